@@ -31,6 +31,12 @@ install -m 755 .build/release/CodexBarCLI "$APPDIR/usr/bin/usagebar"
 install -m 755 usagebar-tray.py "$APPDIR/usr/lib/usagebar/usagebar-tray.py"
 install -m 755 usagebar-history.py "$APPDIR/usr/lib/usagebar/usagebar-history.py"
 install -m 755 usagebar-charts.py "$APPDIR/usr/lib/usagebar/usagebar-charts.py"
+install -m 755 usagebar-collector.py "$APPDIR/usr/lib/usagebar/usagebar-collector.py"
+install -m 755 usagebar-scheduler.py "$APPDIR/usr/lib/usagebar/usagebar-scheduler.py"
+install -m 755 usagebar-forecast.py "$APPDIR/usr/lib/usagebar/usagebar-forecast.py"
+install -m 755 usagebar-downsample.py "$APPDIR/usr/lib/usagebar/usagebar-downsample.py"
+install -m 755 usagebar-metrics.py "$APPDIR/usr/lib/usagebar/usagebar-metrics.py"
+install -m 755 usagebar-profiler.py "$APPDIR/usr/lib/usagebar/usagebar-profiler.py"
 
 # Create launcher script
 cat > "$APPDIR/usr/bin/usagebar-tray" << 'LAUNCHEREOF'
@@ -27,7 +27,7 @@ echo
 
 # 3. Check Python modules
 echo "[3/5] Checking Python modules..."
-python3 -m py_compile usagebar-tray.py usagebar-history.py usagebar-charts.py usagebar-update.py
+python3 -m py_compile usagebar-tray.py usagebar-history.py usagebar-charts.py usagebar-collector.py usagebar-scheduler.py usagebar-forecast.py usagebar-downsample.py usagebar-metrics.py usagebar-profiler.py usagebar-update.py
 echo "✅ All Python modules valid"
 echo
 
@@ -110,6 +110,12 @@ echo "✅ CLI: .build/release/CodexBarCLI"
 echo "✅ Tray: usagebar-tray.py"
 echo "✅ History: usagebar-history.py"
 echo "✅ Charts: usagebar-charts.py"
+echo "✅ Collector: usagebar-collector.py"
+echo "✅ Scheduler: usagebar-scheduler.py"
+echo "✅ Forecast: usagebar-forecast.py"
+echo "✅ Downsample: usagebar-downsample.py"
+echo "✅ Metrics: usagebar-metrics.py"
+echo "✅ Profiler: usagebar-profiler.py"
 echo "✅ Update: usagebar-update.py"
 echo "✅ Assets: assets/icons/ (10 icons), assets/style.css"
 echo "✅ Docs: INSTALL.md, README.md"
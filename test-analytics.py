@@ -4,15 +4,25 @@ Populate test history data to demonstrate sparkline features.
 Creates fake usage snapshots spanning 24 hours.
 """
 
-import json
-import sys
+import copy
+import importlib.util
 import os
 from datetime import datetime, timedelta
 
-# Add current directory to path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+_script_dir = os.path.dirname(os.path.abspath(__file__))
 
-from usagebar_history import UsageHistory
+
+def _load_module(name, filename):
+    """Load a sibling script (hyphenated filename) as a module via importlib."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_history = _load_module("usagebar_history", "usagebar-history.py")
+usagebar_charts = _load_module("usagebar_charts", "usagebar-charts.py")
+UsageHistory = usagebar_history.UsageHistory
 
 def create_test_snapshots():
     """Create test usage snapshots with varying usage patterns."""
@@ -49,32 +59,25 @@ def create_test_snapshots():
     print("Creating test snapshots...")
 
     # Create 10 snapshots over 24 hours with increasing usage
+    records = []
     for i in range(10):
         # Vary usage from 10% to 45%
         usage_pct = 10 + (i * 3.5)
 
-        snapshot = base_data.copy()
+        snapshot = copy.deepcopy(base_data)
         snapshot["usage"]["primary"]["usedPercent"] = usage_pct
         snapshot["usage"]["primary"]["used"] = int(usage_pct * 2000)
 
-        # Manually set timestamp
-        timestamp = datetime.now() - timedelta(hours=24-(i*2.5))
-        snapshot["timestamp"] = timestamp.isoformat()
-
-        # Save directly to database
-        import sqlite3
-        conn = sqlite3.connect(history.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO usage_snapshots (provider, timestamp, data_json)
-            VALUES (?, ?, ?)
-        """, (snapshot["provider"], timestamp.isoformat(), json.dumps(snapshot)))
-        conn.commit()
-        conn.close()
+        # Spread timestamps over the last day
+        timestamp = datetime.now() - timedelta(hours=23.5 - (i * 2.5))
+        records.append({"provider": snapshot["provider"], "ts": int(timestamp.timestamp()), "data": snapshot})
 
         print(f"  Snapshot {i+1}: {usage_pct:.1f}% ({timestamp.strftime('%H:%M')})")
 
-    print(f"\n✅ Created 10 test snapshots for 'claude'")
+    # One transaction for the whole batch (duplicates from earlier runs are skipped)
+    report = history.import_snapshots(records)
+    print(f"\n✅ Imported {report['imported']} test snapshots for 'claude' "
+          f"({report['duplicates']} already present)")
     print(f"Database: {history.db_path}")
 
     # Verify
@@ -86,12 +89,13 @@ def create_test_snapshots():
         print(f"Last snapshot: {data[-1]['timestamp']}")
 
         # Show sparkline
-        from usagebar_charts import UsageChart
-        sparkline = UsageChart.render_sparkline_text(data, width=20)
-        trend = UsageChart.calculate_trend(data)
+        sparkline = usagebar_charts.UsageChart.render_sparkline_text(data, width=20)
+        trend = usagebar_charts.UsageChart.calculate_trend(data)
 
         print(f"\n📊 Sparkline Preview:")
         print(f"   {sparkline} {trend['direction']} ({trend['change']:+.1f}%)")
 
+    history.close()
+
 if __name__ == "__main__":
     create_test_snapshots()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Tests for the chart image cache and Cairo chart rendering.
+Cairo rendering checks are skipped when pycairo is not installed.
+"""
+
+import importlib.util
+import os
+import sys
+import time
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location(
+    "usagebar_charts", os.path.join(_script_dir, "usagebar-charts.py")
+)
+usagebar_charts = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(usagebar_charts)
+
+
+def _counting_render():
+    calls = []
+
+    def render(values, theme):
+        calls.append((tuple(values), theme))
+        return object()
+    return render, calls
+
+
+def test_cache_reuses_unchanged_series():
+    """The same series and theme return the same image without redrawing."""
+    cache = usagebar_charts.ChartCache()
+    render, calls = _counting_render()
+    first = cache.get('claude', 'sparkline', [10, 20, 30], 'light', render)
+    again = cache.get('claude', 'sparkline', [10, 20, 30], 'light', render)
+    ok = first is again and len(calls) == 1 and cache.stats == {'hits': 1, 'misses': 1}
+    print(f"{'✓' if ok else '✗'} Unchanged series served from cache ({cache.stats})")
+    return ok
+
+
+def test_cache_redraws_on_change():
+    """New data or a theme switch redraws; the stale image of that chart is dropped."""
+    cache = usagebar_charts.ChartCache()
+    render, calls = _counting_render()
+    cache.get('claude', 'sparkline', [10, 20, 30], 'light', render)
+    cache.get('claude', 'sparkline', [10, 20, 31], 'light', render)
+    cache.get('claude', 'sparkline', [10, 20, 31], 'dark', render)
+    cache.get('claude', 'area', [10, 20, 31], 'dark', render)
+    ok = len(calls) == 4 and len(cache) == 3
+    print(f"{'✓' if ok else '✗'} Data and theme changes redraw ({len(calls)} renders, {len(cache)} cached)")
+    return ok
+
+
+def test_cache_lru_eviction():
+    """The least recently used image is evicted at capacity."""
+    cache = usagebar_charts.ChartCache(capacity=2)
+    render, calls = _counting_render()
+    cache.get('claude', 'sparkline', [1, 2], 'light', render)
+    cache.get('codex', 'sparkline', [1, 2], 'light', render)
+    cache.get('claude', 'sparkline', [1, 2], 'light', render)  # Refresh claude
+    cache.get('gemini', 'sparkline', [1, 2], 'light', render)  # Evicts codex
+    cache.get('claude', 'sparkline', [1, 2], 'light', render)
+    cache.get('codex', 'sparkline', [1, 2], 'light', render)
+    ok = [c[0] for c in calls] == [(1, 2)] * 4 and cache.stats['hits'] == 2
+    print(f"{'✓' if ok else '✗'} LRU eviction at capacity 2 ({cache.stats})")
+    return ok
+
+
+def test_cairo_surfaces():
+    """Sparkline and area chart surfaces have the requested size and draw something."""
+    if not usagebar_charts.CAIRO_AVAILABLE:
+        ok = usagebar_charts.render_sparkline_surface([10, 20]) is None
+        print(f"{'✓' if ok else '✗'} pycairo not installed: surfaces skipped, renderers return None")
+        return ok
+
+    values = [(i * 7) % 100 for i in range(5_000)]
+    started = time.perf_counter()
+    sparkline = usagebar_charts.render_sparkline_surface(values, 96, 18, 'dark')
+    area = usagebar_charts.render_area_surface(values, 140, 32, 'light')
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    ok = (
+        (sparkline.get_width(), sparkline.get_height()) == (96, 18)
+        and (area.get_width(), area.get_height()) == (140, 32)
+        and any(bytes(area.get_data()))
+    )
+    print(f"{'✓' if ok else '✗'} Cairo sparkline and area chart rendered in {elapsed_ms:.2f} ms")
+    return ok
+
+
+def test_terminal_chart():
+    """Braille and half-block charts fill fixed-size rows and keep a one-sample spike."""
+    start, end = 1_800_000_000, 1_800_000_000 + 90 * 86400
+    flat = [(ts, 10.0) for ts in range(start, end, 3600)]
+    spiky = list(flat)
+    spiky[1000] = (spiky[1000][0], 100.0)
+    series = {"claude": flat, "codex": spiky}
+
+    ok = True
+    for glyphs in usagebar_charts.TERMINAL_GLYPHS:
+        started = time.perf_counter()
+        lines = usagebar_charts.render_terminal_chart(series, start, end, width=60, height=10, glyphs=glyphs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        plot = lines[:10]
+        case_ok = (
+            len(lines) == 10 + 2 + 2
+            and all(len(row) == len(plot[0]) for row in plot)
+            and plot[0].split("┤")[1].strip() != ""
+            and "codex" in lines[-1] and "max 100%" in lines[-1]
+        )
+        ok &= case_ok
+        print(f"  {'✓' if case_ok else '✗'} {glyphs}: {len(flat) * 2} points in {elapsed_ms:.2f} ms")
+    print(f"{'✓' if ok else '✗'} Terminal chart renders multiple series")
+    return ok
+
+
+def test_downsample_loaded_once():
+    """The downsampling helper is registered in sys.modules, so other modules share the instance."""
+    downsample = sys.modules.get("usagebar_downsample")
+    again = usagebar_charts._load_sibling("usagebar_downsample", "usagebar-downsample.py")
+    ok = downsample is usagebar_charts.usagebar_downsample and again is downsample
+    print(f"{'✓' if ok else '✗'} usagebar-downsample.py loaded once and shared")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Chart Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_cache_reuses_unchanged_series(),
+        test_cache_redraws_on_change(),
+        test_cache_lru_eviction(),
+        test_cairo_surfaces(),
+        test_terminal_chart(),
+        test_downsample_loaded_once(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for shape-preserving downsampling and the chart renderers using it.
+"""
+
+import importlib.util
+import os
+import sys
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_downsample = _load("usagebar_downsample", "usagebar-downsample.py")
+usagebar_charts = _load("usagebar_charts", "usagebar-charts.py")
+
+
+def _spiky(points, spike_at):
+    values = [10.0] * points
+    values[spike_at] = 95.0
+    return values
+
+
+def test_lttb_keeps_spike_and_endpoints():
+    """A single spike survives lttb, every-Nth sampling would skip it."""
+    values = _spiky(10_000, 4_321)
+    values[-1] = 42.0
+    sampled = usagebar_downsample.lttb(values, 40)
+    ok = len(sampled) == 40 and 95.0 in sampled and sampled[0] == 10.0 and sampled[-1] == 42.0
+    print(f"{'✓' if ok else '✗'} lttb: {len(sampled)} points, max {max(sampled):.0f}%")
+    return ok
+
+
+def test_lttb_pairs_and_short_input():
+    """(x, y) pairs come back as the original tuples; short series are untouched."""
+    pairs = [(1_800_000_000 + i * 60, v) for i, v in enumerate(_spiky(500, 123))]
+    sampled = usagebar_downsample.lttb(pairs, 20)
+    ok = (
+        len(sampled) == 20 and pairs[123] in sampled
+        and [p[0] for p in sampled] == sorted(p[0] for p in sampled)
+        and usagebar_downsample.lttb([1, 2, 3], 10) == [1, 2, 3]
+    )
+    print(f"{'✓' if ok else '✗'} lttb on (ts, value) pairs keeps order and the spike")
+    return ok
+
+
+def _sawtooth(points, period=2016):
+    """Weekly climbs to 80% at 5-minute resolution, each followed by a reset, plus noise."""
+    return [round((i % period) / period * 80 + (i * 7919 % 13) / 10, 2) for i in range(points)]
+
+
+def test_lttb_keeps_sawtooth_extremes():
+    """On long noisy sawtooths the global peak and low survive, in order, at the requested size."""
+    results = []
+    for size, width in ((50_000, 40), (100_000, 40), (100_000, 3), (60_480, 30)):
+        values = _sawtooth(size)
+        pairs = list(enumerate(values))
+        sampled = usagebar_downsample.lttb(pairs, width)
+        ys = [y for _, y in sampled]
+        xs = [x for x, _ in sampled]
+        results.append(
+            len(sampled) == width and max(ys) == max(values)
+            and (width == 3 or min(ys) == min(values))
+            and xs == sorted(set(xs)) and xs[0] == 0 and xs[-1] == size - 1
+        )
+    sparkline = usagebar_charts.UsageChart.render_sparkline_text(_sawtooth(50_000), width=30)
+    ok = all(results) and len(sparkline) == 30 and "█" in sparkline and "▁" in sparkline
+    print(f"{'✓' if ok else '✗'} lttb keeps sawtooth peak and low at 50k/100k points: {sparkline}")
+    return ok
+
+
+def test_minmax_buckets():
+    """Each bucket reports its own extremes, including a reset dip."""
+    values = list(range(100))
+    values[37] = -5
+    buckets = usagebar_downsample.minmax_buckets(values, 10)
+    ok = len(buckets) == 10 and buckets[3] == (-5, 39) and buckets[-1] == (90, 99)
+    print(f"{'✓' if ok else '✗'} min/max buckets: {buckets[3]} for the bucket with the dip")
+    return ok
+
+
+def test_renderers_show_spike():
+    """Sparkline and ASCII chart both draw the spike at their fixed width."""
+    values = _spiky(20_000, 7_777)
+    sparkline = usagebar_charts.UsageChart.render_sparkline_text(values, width=30)
+    chart = usagebar_charts.render_ascii_chart(values, width=40, height=8).split("\n")
+    ok = (
+        len(sparkline) == 30 and "█" in sparkline
+        and all(len(row) == 40 for row in chart) and chart[0].count("█") == 1
+    )
+    print(f"{'✓' if ok else '✗'} Renderers keep the spike: {sparkline}")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Downsampling Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_lttb_keeps_spike_and_endpoints(),
+        test_lttb_pairs_and_short_input(),
+        test_lttb_keeps_sawtooth_extremes(),
+        test_minmax_buckets(),
+        test_renderers_show_spike(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
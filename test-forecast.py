@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the burn-rate forecasting module.
+Covers the regression, reset boundaries, exhaustion projection and cost.
+"""
+
+import importlib.util
+import os
+import sys
+import time
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location(
+    "usagebar_forecast", os.path.join(_script_dir, "usagebar-forecast.py")
+)
+usagebar_forecast = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(usagebar_forecast)
+
+NOW = 1_800_000_000
+
+
+def _series(rate_per_hour, start_used, hours, step=300, resets_at=None):
+    """Primary-only get_series() rows ending at NOW."""
+    points = []
+    for i in range(int(hours * 3600 / step) + 1):
+        ts = NOW - hours * 3600 + i * step
+        used = start_used + rate_per_hour * (ts - (NOW - hours * 3600)) / 3600
+        points.append((ts, used, resets_at, None, None, None, None))
+    return points
+
+
+def test_linear_rate_and_exhaustion():
+    """A steady 10%/h burn from 40% runs out in 6 hours."""
+    series = _series(10, 10, 3)
+    forecast = usagebar_forecast.forecast_provider(series, now=NOW)["primary"]
+    ok = (
+        abs(forecast.rate_per_hour - 10) < 1e-6
+        and abs(forecast.exhausts_at - (NOW + 6 * 3600)) < 1
+        and usagebar_forecast.describe(forecast, NOW) == "🔥 10.0%/h · empty in 6h 00m"
+    )
+    print(f"{'✓' if ok else '✗'} Linear burn: {forecast.rate_per_hour:.2f}%/h, "
+          f"{usagebar_forecast.describe(forecast, NOW)}")
+    return ok
+
+
+def test_fit_stops_at_reset():
+    """Samples before a resetsAt change (or usage drop) are not fitted."""
+    before = [(ts, 80 + i, NOW - 3600, None, None, None, None)
+              for i, ts in enumerate(range(NOW - 3 * 3600, NOW - 3600, 600))]
+    after = [(ts, used, NOW + 4 * 3600, *rest) for ts, used, _, *rest in _series(6, 0, 1)]
+    forecast = usagebar_forecast.forecast_provider(before + after, now=NOW)["primary"]
+
+    dropped = [(ts, used, None, None, None, None, None) for ts, used, *_ in before + after]
+    by_drop = usagebar_forecast.forecast_provider(dropped, now=NOW)["primary"]
+
+    ok = (
+        forecast.points == len(after) and abs(forecast.rate_per_hour - 6) < 1e-6
+        and by_drop.points == len(after) and abs(by_drop.rate_per_hour - 6) < 1e-6
+    )
+    print(f"{'✓' if ok else '✗'} Reset boundary: fitted {forecast.points} of {len(before + after)} samples")
+    return ok
+
+
+def test_reset_before_exhaustion():
+    """No exhaustion time when the window resets first; the payload is the newest sample."""
+    series = _series(5, 20, 2, resets_at=NOW + 3600)
+    payload = {"usage": {"primary": {"usedPercent": 30, "resetsAt": "2027-01-15T09:00:00Z"}}}
+    forecast = usagebar_forecast.forecast_provider(series[:-1], payload, now=NOW)["primary"]
+    ok = (
+        forecast.exhausts_at is None
+        and forecast.resets_at == usagebar_forecast.parse_timestamp("2027-01-15T09:00:00Z")
+        and usagebar_forecast.describe(forecast, NOW).endswith("lasts until reset")
+    )
+    print(f"{'✓' if ok else '✗'} Reset first: {usagebar_forecast.describe(forecast, NOW)}")
+    return ok
+
+
+def test_not_enough_data():
+    """Too few or too close samples give no rate rather than a wild guess."""
+    short = usagebar_forecast.forecast_provider(_series(10, 10, 0.1, step=60), now=NOW)["primary"]
+    ok = short.rate_per_hour is None and usagebar_forecast.describe(short) is None
+    print(f"{'✓' if ok else '✗'} Short history gives no forecast ({short.points} points)")
+    return ok
+
+
+def test_cost_per_refresh():
+    """Seven providers with a day of 5-minute samples each forecast in a few ms."""
+    series = [(ts, u, None, u / 2, None, u / 3, None) for ts, u, *_ in _series(2, 10, 24)]
+    started = time.perf_counter()
+    for _ in range(7):
+        usagebar_forecast.forecast_provider(series, now=NOW)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    ok = elapsed_ms < 50
+    print(f"{'✓' if ok else '✗'} 7 providers x {len(series)} samples forecast in {elapsed_ms:.2f} ms")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Forecast Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_linear_rate_and_exhaustion(),
+        test_fit_stops_at_reset(),
+        test_reset_before_exhaustion(),
+        test_not_enough_data(),
+        test_cost_per_refresh(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
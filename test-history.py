@@ -0,0 +1,751 @@
+#!/usr/bin/env python3
+"""
+Tests for UsageHistory storage: epoch timestamps, rollup tiers, schema
+migrations and index usage of the time-window queries (via EXPLAIN QUERY PLAN).
+"""
+
+import contextlib
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location(
+    "usagebar_history", os.path.join(_script_dir, "usagebar-history.py")
+)
+usagebar_history = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(usagebar_history)
+UsageHistory = usagebar_history.UsageHistory
+
+
+def _payload(provider, used):
+    return {"provider": provider, "usage": {"primary": {"usedPercent": used}}, "credits": {"remaining": 7}}
+
+
+def _plan(conn, sql, params):
+    """EXPLAIN QUERY PLAN details for one statement."""
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def _indexed(detail):
+    return "INDEX" in detail or "PRIMARY KEY" in detail
+
+
+def _uses_indexes(details):
+    """True if no step reads a history table without an index."""
+    return all(
+        _indexed(detail)
+        for detail in details
+        if detail.startswith(("SCAN usage_", "SEARCH usage_"))
+    )
+
+
+def test_query_plans():
+    """Every time-window query searches an index instead of scanning the table."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        conn = history._connect()
+        cutoff = int(time.time()) - 3600
+        cases = {
+            "history": (usagebar_history.SQL_HISTORY.format(placeholders="?,?"), ("claude", "codex", cutoff)),
+            "series": (usagebar_history.SQL_SERIES.format(fields="primary_used", placeholders="?"),
+                       ("claude", cutoff)),
+            "latest": (usagebar_history.SQL_LATEST.format(where="WHERE provider IN (?)"), ("claude",)),
+            "latest (all)": (usagebar_history.SQL_LATEST.format(where=""), ()),
+            "warm cache": (usagebar_history.SQL_SERIES_ALL.format(fields="primary_used"), (cutoff,)),
+            "expired": (usagebar_history.SQL_EXPIRED, (cutoff,)),
+            "prune batch": (usagebar_history.SQL_PRUNE_BATCH, (cutoff, 500)),
+            "hourly series": (usagebar_history.SQL_ROLLUP_SERIES.format(
+                fields="primary_used_max", table="usage_hourly", placeholders="?"), ("claude", cutoff)),
+            "hourly prune batch": (usagebar_history.SQL_PRUNE_ROLLUP_BATCH.format(table="usage_hourly"),
+                                   (cutoff, 500)),
+            "export": (usagebar_history.SQL_EXPORT.format(columns="primary_used", where="ts >= ? AND ts < ?",
+                                                          order="ts"), (cutoff, cutoff + 3600)),
+            "export (provider)": (usagebar_history.SQL_EXPORT.format(
+                columns="primary_used", where="ts >= ? AND ts < ? AND provider IN (?,?)", order="provider, ts"),
+                (cutoff, cutoff + 3600, "claude", "codex")),
+        }
+        ok = True
+        for name, (sql, params) in cases.items():
+            details = _plan(conn, sql, params)
+            searched = any(d.startswith("SEARCH") and _indexed(d) for d in details)
+            case_ok = _uses_indexes(details) and searched and not any("TEMP B-TREE" in d for d in details)
+            ok &= case_ok
+            print(f"  {'✓' if case_ok else '✗'} {name}: {' | '.join(details)}")
+    print(f"{'✓' if ok else '✗'} Time-window queries use the indexes")
+    return ok
+
+
+def test_epoch_timestamps():
+    """Snapshots are stored as UTC epoch integers and windows are honoured."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        before = int(time.time())
+        history.save_snapshot([_payload("claude", 42)])
+        conn = history._connect()
+        stored = conn.execute("SELECT ts, typeof(ts) FROM usage_snapshots").fetchone()
+
+        # An old row outside a 2h window, inside 24h
+        conn.execute("INSERT INTO usage_snapshots (provider, ts, primary_used) VALUES (?, ?, ?)",
+                     ("claude", before - 5 * 3600, 10))
+        conn.commit()
+
+        recent = history.get_series("claude", hours=2)
+        day = history.get_series("claude", hours=24)
+        latest = history.get_latest_snapshots(["claude"])["claude"]
+        ok = (
+            stored[1] == "integer" and abs(stored[0] - before) <= 2
+            and [v for _, v in recent] == [42]
+            and [v for _, v in day] == [10, 42]
+            and latest["data"]["usage"]["primary"]["usedPercent"] == 42
+            and usagebar_history.to_epoch(latest["timestamp"]) == stored[0]
+        )
+    print(f"{'✓' if ok else '✗'} Epoch timestamps stored and filtered ({stored[1]})")
+    return ok
+
+
+def test_rollups_incremental():
+    """Hourly/daily buckets track min/max/avg/last as snapshots arrive, in any order."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        conn = history._connect()
+        hour = (int(time.time()) // 3600 - 2) * 3600
+        samples = [("claude", hour + 600, 20.0, None, None, 5.0),
+                   ("claude", hour + 1800, 50.0, 10.0, None, 4.0),
+                   ("claude", hour + 1200, 30.0, None, None, None)]
+        # One sample at a time, out of order, like independent writers
+        for sample in samples:
+            history._update_rollups(conn, [sample])
+        conn.commit()
+
+        hourly = history.get_series("claude", hours=4, fields=("primary_used", "secondary_used"), tier="hourly")
+        last = history.get_series("claude", hours=4, fields=("primary_used", "credits_remaining"),
+                                  tier="hourly", agg="last")
+        peak = history.get_series("claude", hours=4, tier="daily", agg="max")
+        row = conn.execute("SELECT samples, primary_used_cnt, secondary_used_cnt FROM usage_hourly").fetchone()
+        ok = (
+            hourly == [(hour, 100.0 / 3, 10.0)]
+            and last == [(hour, 50.0, 4.0)]
+            and [v for _, v in peak] == [50.0]
+            and row == (3, 3, 1)
+        )
+    print(f"{'✓' if ok else '✗'} Rollups merge incrementally ({hourly}, {last})")
+    return ok
+
+
+def test_tier_planner():
+    """Short windows read raw rows; a 90-day window reads about 90 daily rows."""
+    plan = {hours: usagebar_history.plan_tier(hours).name for hours in (2, 24, 24 * 7, 24 * 90, 24 * 365)}
+    expected = {2: "raw", 24: "raw", 24 * 7: "hourly", 24 * 90: "daily", 24 * 365: "daily"}
+
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        conn = history._connect()
+        now = int(time.time())
+        samples = [("codex", ts, 50.0, None, None, None) for ts in range(now - 90 * 86400, now, 3600)]
+        history._update_rollups(conn, samples)
+        conn.commit()
+        points = len(history.get_series("codex", hours=24 * 90))
+    ok = plan == expected and 90 <= points <= 91
+    print(f"{'✓' if ok else '✗'} Tier planner: {plan}; 90-day series reads {points} rows")
+    return ok
+
+
+def test_retention_batches_and_schedule():
+    """Retention runs on its schedule, deletes in batches and reports what it reclaimed."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        conn = history._connect()
+        now = int(time.time())
+        old = now - 30 * 86400
+        conn.executemany("INSERT INTO usage_snapshots (provider, ts, primary_used, data_json) VALUES (?, ?, ?, ?)",
+                         [("claude", old + i, 10, "x" * 500) for i in range(1200)])
+        conn.commit()
+        history._update_rollups(conn, [("claude", old + i * 3600, 10, None, None, None) for i in range(5)])
+        conn.commit()
+
+        manager = history.retention
+        manager.interval, manager.row_threshold, manager.batch_size = 3600, 10_000, 500
+        due_first = manager.is_due(now)
+        expired = manager.expired(now)
+        report = manager.run(now)
+        remaining = conn.execute("SELECT COUNT(*) FROM usage_snapshots").fetchone()[0]
+        due_after = manager.is_due(now + 60)
+        due_later = manager.is_due(now + 3601)
+
+        # Saves inside the interval do not prune; crossing the row threshold does
+        manager.row_threshold = 3
+        history.save_snapshot([_payload(p, 1) for p in ("a", "b", "c")])
+        due_rows = manager.rows_since_last_run() == 0
+
+        ok = (
+            due_first and not due_after and due_later and due_rows
+            and expired == {"raw": 1200, "hourly": 0}
+            and report["raw"] == 1200 and report["rows"] == 1200 and report["bytes"] > 0
+            and remaining == 0
+            and manager.status()["last_reclaimed_rows"] == 0
+        )
+    print(f"{'✓' if ok else '✗'} Retention: {report}")
+    return ok
+
+
+def _values(primary=None, primary_reset=None, secondary=None, credits=None):
+    return (primary, primary_reset, secondary, None, None, None, credits)
+
+
+def test_sampling_policies():
+    """Each policy writes exactly when its rule says so."""
+    fixed = usagebar_history.FixedIntervalPolicy(interval=600)
+    change = usagebar_history.ChangePolicy(deadband=1.0, heartbeat=3600)
+    reset = usagebar_history.ResetPolicy()
+    every = usagebar_history.SamplingPolicy()
+    last = (1000, _values(40.0, "2026-01-04T10:00:00Z", 5.0, 12.0))
+    checks = {
+        "base: unchanged sample": every.should_write(last, 1001, last[1]),
+        "fixed: first sample": fixed.should_write(None, 1000, _values(1.0)),
+        "fixed: too soon": not fixed.should_write(last, 1500, _values(90.0)),
+        "fixed: interval passed": fixed.should_write(last, 1600, last[1]),
+        "change: inside deadband": not change.should_write(last, 1100, _values(40.9, "2026-01-04T10:00:00Z", 5.0, 12.0)),
+        "change: moved": change.should_write(last, 1100, _values(41.0, "2026-01-04T10:00:00Z", 5.0, 12.0)),
+        "change: credits moved": change.should_write(last, 1100, _values(40.0, "2026-01-04T10:00:00Z", 5.0, 10.0)),
+        "change: window vanished": change.should_write(last, 1100, _values(40.0, "2026-01-04T10:00:00Z", None, 12.0)),
+        "change: heartbeat": change.should_write(last, 4600, last[1]),
+        "reset: unchanged": not reset.should_write(last, 1100, last[1]),
+        "reset: new resetsAt": reset.should_write(last, 1100, _values(40.0, "2026-01-04T15:00:00Z", 5.0, 12.0)),
+        "reset: usage dropped": reset.should_write(last, 1100, _values(0.0, None, 5.0, 12.0)),
+    }
+    failed = [name for name, passed in checks.items() if not passed]
+    ok = not failed
+    print(f"{'✓' if ok else '✗'} Sampling policies ({len(checks) - len(failed)}/{len(checks)}){' ' + str(failed) if failed else ''}")
+    return ok
+
+
+def test_sampling_in_memory():
+    """Unchanged data is skipped without a query; moves and restarts behave."""
+    start = int(time.time()) - 7200
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "h.db")
+        with UsageHistory(db) as history:
+            history.save_snapshot([_payload("claude", 10)], now=start)
+            conn = history._connect()
+            statements = []
+            conn.set_trace_callback(statements.append)
+            history.save_snapshot([_payload("claude", 10.5)], now=start + 60)  # inside deadband
+            selects = [sql for sql in statements if "SELECT" in sql]
+            conn.set_trace_callback(None)
+            history.save_snapshot([_payload("claude", 12)], now=start + 120)  # moved
+        # A new instance picks up the last written state from the database
+        with UsageHistory(db) as history:
+            history.save_snapshot([_payload("claude", 12)], now=start + 180)
+            history.save_snapshot([_payload("claude", 12)], now=start + 3720)  # heartbeat
+            rows = [row[0] for row in history._connect().execute(
+                "SELECT primary_used FROM usage_snapshots ORDER BY ts")]
+    ok = rows == [10, 12, 12] and not selects
+    print(f"{'✓' if ok else '✗'} In-memory sampling: wrote {rows}, {len(selects)} SELECTs for a skipped sample")
+    return ok
+
+
+def test_ring_buffer():
+    """The ring keeps the newest `capacity` samples and knows which windows it covers."""
+    ring = usagebar_history.SeriesRingBuffer(capacity=4, complete_since=100)
+    for ts in range(100, 106):
+        ring.append(ts, (float(ts), None, None, None, None, None, None))
+    ring.append(105, (99.0, None, None, 1.0, None, None, None))  # same second replaces
+    ring.append(50, (0.0, None, None, None, None, None, None))  # out of order is ignored
+    window = ring.window(103, ("primary_used", "credits_remaining"))
+    ok = (
+        len(ring) == 4
+        and ring.complete_since == 102
+        and ring.covers(102) and not ring.covers(101)
+        and window == [(103, 103.0, None), (104, 104.0, None), (105, 99.0, 1.0)]
+    )
+    print(f"{'✓' if ok else '✗'} Ring buffer: {window}, complete since {ring.complete_since}")
+    return ok
+
+
+def test_same_second_saved_once():
+    """A second snapshot for a stored (provider, ts) is dropped: not rolled up, cached or counted."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        now = int(time.time())
+        history.warm_cache()
+        written = []
+        history.retention.note_written = written.append
+        history.save_snapshot([_payload("claude", 10)], now=now)
+        history.save_snapshot([_payload("claude", 20)], now=now + 0.5)
+        history.save_snapshots([(now, [_payload("claude", 30)]), (now, [_payload("claude", 40)])])
+
+        conn = history._connect()
+        raw = conn.execute("SELECT primary_used FROM usage_snapshots").fetchall()
+        hourly = conn.execute("SELECT samples, primary_used_cnt, primary_used_max FROM usage_hourly").fetchone()
+        daily = conn.execute("SELECT samples FROM usage_daily").fetchone()
+        cached = history.cached_series_many(["claude"])["claude"]
+        ok = (
+            raw == [(10.0,)] and hourly == (1, 1, 10.0) and daily == (1,)
+            and [v for _, v in cached] == [10] and sum(written) == 1
+        )
+    print(f"{'✓' if ok else '✗'} Same-second snapshots saved once (rollup {hourly}, cache {len(cached)} point)")
+    return ok
+
+
+def test_series_cache():
+    """Series within the warm window come from memory; longer windows fall back to SQLite."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        now = int(time.time())
+        history.save_snapshot([_payload("claude", 5)], now=now - 30 * 3600)  # outside the warm window
+        history.save_snapshot([_payload("claude", 10)], now=now - 3600)
+        first = history.get_series("claude", hours=24)  # warms the cache
+        history.save_snapshot([_payload("claude", 20), _payload("codex", 1)], now=now)
+
+        conn = history._connect()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        cached = history.get_series_many(["claude", "codex", "gemini"], hours=24)
+        conn.set_trace_callback(None)
+        hits = dict(history.cache_stats)
+        longer = history.get_series("claude", hours=48)
+
+        ok = (
+            [v for _, v in first] == [10]
+            and [v for _, v in cached["claude"]] == [10, 20]
+            and [v for _, v in cached["codex"]] == [1]
+            and cached["gemini"] == []
+            and not [sql for sql in statements if "SELECT" in sql]
+            and [v for _, v in longer] == [5, 10, 20]
+            and hits == {"hits": 4, "misses": 0}
+            and history.cache_stats == {"hits": 4, "misses": 1}
+        )
+    print(f"{'✓' if ok else '✗'} Series cache: {history.cache_stats}, {len(statements)} statements for cached reads")
+    return ok
+
+
+def test_writer_batches_and_flushes():
+    """Queued snapshots are written in one transaction and flushed on stop."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        writer = usagebar_history.SnapshotWriter(history, batch_delay=0.2)
+        writer.start()
+        started = time.perf_counter()
+        for i in range(10):
+            writer.submit([_payload(f"p{i}", i)])
+        submit_ms = (time.perf_counter() - started) * 1000
+        stopped = writer.stop()
+        rows = history._connect().execute("SELECT COUNT(*) FROM usage_snapshots").fetchone()[0]
+        ok = stopped and rows == 10 and writer.stats["batches"] == 1 and writer.stats["dropped"] == 0
+    print(f"{'✓' if ok else '✗'} Writer: 10 submits in {submit_ms:.2f} ms, {writer.stats}")
+    return ok
+
+
+class _StalledHistory:
+    """Stands in for a history whose disk has stopped responding."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.written = []
+
+    def save_snapshots(self, batch):
+        self.release.wait()
+        self.written += batch
+
+    def close_thread(self):
+        pass
+
+
+class _CountingHistory(_StalledHistory):
+    """Accepts every batch at once."""
+
+    def save_snapshots(self, batch):
+        self.written += batch
+
+
+def test_writer_stats_consistent():
+    """Submitting threads and the writer thread count without losing updates; stats is a copy."""
+    history = _CountingHistory()
+    writer = usagebar_history.SnapshotWriter(history, max_pending=8, batch_delay=0)
+    writer.start()
+    threads = [threading.Thread(target=lambda: [writer.submit([_payload("p", i)], now=i) for i in range(2000)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.stop()
+    stats = writer.stats
+    stats["written"] = -1
+
+    ok = (
+        writer.stats["submitted"] == 8000
+        and writer.stats["written"] + writer.stats["dropped"] == 8000
+        and writer.stats["written"] == len(history.written)
+    )
+    print(f"{'✓' if ok else '✗'} Writer stats consistent across threads: {writer.stats}")
+    return ok
+
+
+def test_writer_overflow_policies():
+    """A stalled disk never blocks submit(); the oldest (or newest) snapshots are dropped."""
+    results = {}
+    for policy in usagebar_history.WRITE_POLICIES:
+        history = _StalledHistory()
+        writer = usagebar_history.SnapshotWriter(history, max_pending=4, batch_delay=0, policy=policy,
+                                                 block_timeout=0.01)
+        writer.start()
+        writer.submit([_payload("first", 0)], now=0)
+        time.sleep(0.1)  # writer is now stuck on the first batch
+        started = time.perf_counter()
+        for i in range(1, 11):
+            writer.submit([_payload("p", i)], now=i)
+        worst_ms = (time.perf_counter() - started) * 1000 / 10
+        history.release.set()
+        writer.stop()
+        results[policy] = ([ts for ts, _ in history.written], writer.stats["dropped"], worst_ms)
+
+    kept_oldest, dropped_oldest, _ = results["drop-oldest"]
+    kept_block, dropped_block, block_ms = results["block"]
+    ok = (
+        kept_oldest == [0, 7, 8, 9, 10] and dropped_oldest == 6
+        and kept_block == [0, 1, 2, 3, 4] and dropped_block == 6
+        and block_ms < 50
+    )
+    print(f"{'✓' if ok else '✗'} Overflow: drop-oldest kept {kept_oldest}, block kept {kept_block}")
+    return ok
+
+
+def test_migrate_v0_blob_schema():
+    """A v0 database (JSON blob, local ISO timestamps) is migrated in place."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "h.db")
+        conn = sqlite3.connect(db)
+        conn.execute("""
+            CREATE TABLE usage_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                provider TEXT NOT NULL,
+                data_json TEXT NOT NULL,
+                UNIQUE(provider, timestamp)
+            )
+        """)
+        local = datetime.now() - timedelta(hours=3)
+        conn.execute("INSERT INTO usage_snapshots (timestamp, provider, data_json) VALUES (?, ?, ?)",
+                     (local.isoformat(), "claude", json.dumps(_payload("claude", 30))))
+        conn.execute("INSERT INTO usage_snapshots (timestamp, provider, data_json) VALUES (?, ?, ?)",
+                     ((local + timedelta(hours=1)).isoformat(), "claude", "not json"))
+        conn.commit()
+        conn.close()
+
+        with UsageHistory(db) as history:
+            conn = history._connect()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            series = history.get_series("claude", hours=24, fields=("primary_used", "credits_remaining"))
+            hourly = conn.execute("SELECT SUM(samples) FROM usage_hourly").fetchone()[0]
+            ok = (
+                version == usagebar_history.SCHEMA_VERSION
+                and hourly == 2
+                and len(series) == 2
+                and series[0][0] == int(local.timestamp())
+                and series[0][1:] == (30, 7)
+                and series[1][1] is None
+            )
+    print(f"{'✓' if ok else '✗'} v0 database migrated ({len(series)} rows)")
+    return ok
+
+
+def test_migrate_v1_text_timestamps():
+    """A v1 database (typed columns, text timestamps) keeps its data and gets epoch ts."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "h.db")
+        conn = sqlite3.connect(db)
+        conn.execute(f"""
+            CREATE TABLE usage_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                provider TEXT NOT NULL,
+                {', '.join(c + ' REAL' for c in usagebar_history.SNAPSHOT_COLUMNS)},
+                data_json TEXT,
+                UNIQUE(provider, timestamp)
+            )
+        """)
+        local = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+        conn.execute("INSERT INTO usage_snapshots (timestamp, provider, primary_used) VALUES (?, ?, ?)",
+                     (local.isoformat(), "codex", 55))
+        # Same second, different fraction: collapses to one row
+        conn.execute("INSERT INTO usage_snapshots (timestamp, provider, primary_used) VALUES (?, ?, ?)",
+                     (local.isoformat() + ".5", "codex", 56))
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+
+        with UsageHistory(db) as history:
+            series = history.get_series("codex", hours=24)
+            indexes = {row[0] for row in history._connect().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'usage_snapshots'")}
+            ok = series == [(int(local.timestamp()), 55)] and {"idx_provider_ts", "idx_ts"} <= indexes
+    print(f"{'✓' if ok else '✗'} v1 database migrated ({len(series)} rows, indexes {sorted(indexes)})")
+    return ok
+
+
+def test_chart_command():
+    """`chart --days 90` reads the daily tier and draws every provider; export keeps its positional form."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        conn = history._connect()
+        now = int(time.time())
+        samples = [(p, ts, 100.0 if p == "codex" and ts == now - 30 * 86400 else 20.0, None, None, None)
+                   for p in ("claude", "codex") for ts in range(now - 90 * 86400, now, 3600)]
+        history._update_rollups(conn, samples)
+        conn.commit()
+        history.save_snapshot([_payload("claude", 20), _payload("codex", 20)])
+
+        chart = io.StringIO()
+        with contextlib.redirect_stdout(chart):
+            usagebar_history.run_command(history, ["chart", "--days", "90", "--width", "60", "--height", "8",
+                                                   "--no-color"])
+        lines = chart.getvalue().splitlines()
+
+        export = io.StringIO()
+        with contextlib.redirect_stdout(export):
+            usagebar_history.run_command(history, ["export", "claude", "48"])
+        exported = json.loads(export.getvalue())
+
+    ok = (
+        "daily max" in lines[0]
+        and len(lines) == 1 + 8 + 2 + 2
+        and all(len(line) == len(lines[1]) for line in lines[1:9])
+        and lines[1].strip("100% ┤ ") != ""  # The codex spike reaches the top row
+        and "claude" in lines[-2] and "codex" in lines[-1] and "max 100%" in lines[-1]
+        and len(exported) == 1
+    )
+    print(f"{'✓' if ok else '✗'} chart command over 90 days: {lines[0]!r}")
+    return ok
+
+
+def test_chart_tier_week():
+    """A 7-day chart at the default width keeps hourly detail instead of falling back to 7 daily points."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        conn = history._connect()
+        now = int(time.time())
+        history._update_rollups(conn, [("claude", ts, 20.0 + (ts // 3600) % 24, None, None, None)
+                                       for ts in range(now - 7 * 86400, now, 3600)])
+        conn.commit()
+        history.save_snapshot([_payload("claude", 20)])
+
+        chart = io.StringIO()
+        with contextlib.redirect_stdout(chart):
+            usagebar_history.run_command(history, ["chart", "--days", "7", "--width", "72", "--no-color"])
+        header = chart.getvalue().splitlines()[0]
+
+    tiers = [usagebar_history.plan_tier(24 * 7, max_points=144 * usagebar_history.CHART_POINTS_PER_COLUMN).name,
+             usagebar_history.plan_tier(24, max_points=144 * usagebar_history.CHART_POINTS_PER_COLUMN).name]
+    ok = "hourly max" in header and tiers == ["hourly", "raw"]
+    print(f"{'✓' if ok else '✗'} 7-day chart: {header!r}")
+    return ok
+
+
+class _CountingSink:
+    """Text stream that keeps only a line count, to measure the exporter itself."""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text):
+        self.lines += text.count("\n")
+
+
+def test_streaming_export():
+    """NDJSON/CSV export filters by provider and time, streams in constant memory and gzips."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        conn = history._connect()
+        start = int(time.time()) - 30 * 86400
+        columns = ", ".join(usagebar_history.SNAPSHOT_COLUMNS)
+        conn.executemany(
+            f"INSERT INTO usage_snapshots (provider, ts, {columns}, data_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((provider, start + i * 60, i % 100, None, None, None, None, None, 7, json.dumps(_payload(provider, i % 100)))
+             for i in range(25_000) for provider in ("claude", "codex"))
+        )
+        conn.commit()
+
+        sink = _CountingSink()
+        tracemalloc.start()
+        total = usagebar_history.export_snapshots(history, sink, "ndjson", usagebar_history.EXPORT_FIELDS)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        out = io.StringIO()
+        usagebar_history.export_snapshots(history, out, "ndjson", ("provider", "ts", "primary_used"),
+                                          provider_ids=["codex"], since=start + 600, until=start + 1200)
+        window = [json.loads(line) for line in out.getvalue().splitlines()]
+
+        path = os.path.join(tmp, "export.csv.gz")
+        args = usagebar_history.build_parser().parse_args(
+            ["export", "--format", "csv", "--provider", "claude", "--until", str(start + 180), "-o", path])
+        with contextlib.redirect_stderr(io.StringIO()):
+            usagebar_history.run_export(history, args)
+        with gzip.open(path, "rt", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    ok = (
+        total == sink.lines == 50_000
+        and peak < 2 * 1024 * 1024  # The full result is ~15 MiB of rows
+        and window == [{"provider": "codex", "ts": start + i * 60, "primary_used": float(i)} for i in range(10, 20)]
+        and [r["primary_used"] for r in rows] == ["0.0", "1.0", "2.0"] and rows[0]["credits_remaining"] == "7.0"
+    )
+    print(f"{'✓' if ok else '✗'} Streaming export: {total} rows with {peak / 1024:.0f} KiB peak, "
+          f"{len(window)} in window, {len(rows)} gzip'd CSV rows")
+    return ok
+
+
+def test_bulk_import():
+    """Months of exported history import in one pass; re-importing the same file adds nothing."""
+    with tempfile.TemporaryDirectory() as tmp:
+        now = int(time.time())
+        start = now - 120 * 86400 + 450  # Keep samples off the raw-retention boundary
+        records = [{"provider": p, "ts": ts, "data": _payload(p, (ts // 900) % 100)}
+                   for ts in range(start, now, 900) for p in ("claude", "codex", "gemini")]
+
+        with UsageHistory(os.path.join(tmp, "source.db")) as source:
+            first = source.import_snapshots(iter(records))
+            again = source.import_snapshots(iter(records))
+            path = os.path.join(tmp, "export.csv.gz")
+            with contextlib.redirect_stderr(io.StringIO()):
+                usagebar_history.run_command(source, ["export", "--format", "csv", "-o", path])
+            raw_rows = source.get_stats()["total_snapshots"]
+            daily = source.get_series("codex", hours=24 * 120, tier="daily", agg="max")
+
+        with UsageHistory(os.path.join(tmp, "target.db")) as target:
+            target.save_snapshot([_payload("claude", 55)])
+            target.get_series("claude", hours=1)  # Warm the cache before the import
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                usagebar_history.run_command(target, ["import", path])
+                usagebar_history.run_command(target, ["import", path])
+            merged = target.get_series("claude", hours=24 * 7, tier="raw")
+            cached = target.get_series("claude", hours=24)
+
+    recent = sum(1 for r in records if r["ts"] >= now - usagebar_history.RAW_RETENTION_DAYS * 86400)
+    ok = (
+        first["imported"] == len(records) and first["seconds"] < 10
+        and again["imported"] == 0 and again["duplicates"] == recent
+        and again["skipped_existing_bucket"] == len(records) - recent
+        and raw_rows == recent and 120 <= len(daily) <= 121
+        and f"imported {raw_rows} snapshots (0 duplicates" in log.getvalue()
+        and f"imported 0 snapshots ({raw_rows} duplicates" in log.getvalue()
+        and len(merged) == recent // 3 + 1 and merged[-1][1] == 55
+        and len(cached) == sum(1 for r in records if r["provider"] == "claude" and r["ts"] >= now - 86400) + 1
+    )
+    print(f"{'✓' if ok else '✗'} Bulk import: {first['imported']} rows in {first['seconds']}s, "
+          f"re-import {again['duplicates']} duplicates, {len(merged)} merged claude points")
+    return ok
+
+
+def test_import_existing_buckets():
+    """Old rows landing in an hour the local history already covers are reported, not called duplicates."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        now = int(time.time())
+        hour = now - 30 * 86400
+        hour -= hour % 3600
+        history._update_rollups(history._connect(), [("claude", hour + 60, 10.0, None, None, None)])
+        history._connect().commit()
+        records = [{"provider": "claude", "ts": hour + offset, "data": _payload("claude", 40)}
+                   for offset in (900, 1800, 3600 + 900)]
+        report = history.import_snapshots(iter(records))
+
+        log = io.StringIO()
+        path = os.path.join(tmp, "other.ndjson")
+        with open(path, "w") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+        with contextlib.redirect_stdout(log):
+            usagebar_history.run_command(history, ["import", path])
+
+    ok = (
+        report["imported"] == 1 and report["duplicates"] == 0 and report["skipped_existing_bucket"] == 2
+        and "0 duplicates, 3 older than raw retention in already-filled rollup buckets" in log.getvalue()
+    )
+    print(f"{'✓' if ok else '✗'} Import into filled buckets: {report['skipped_existing_bucket']} reported separately")
+    return ok
+
+
+def test_import_skips_malformed_records():
+    """A bad cell or field skips its record only; the rest of the file is still imported."""
+    with tempfile.TemporaryDirectory() as tmp, UsageHistory(os.path.join(tmp, "h.db")) as history:
+        now = int(time.time()) - 3600
+        path = os.path.join(tmp, "export.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["provider", "ts", "primary_used"])
+            writer.writerows([["claude", now, 10], ["claude", "yesterday", 20], ["claude", now + 60, "n/a"],
+                              ["claude", now + 120, 30]])
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            usagebar_history.run_command(history, ["import", path])
+        records = [{"provider": "codex", "ts": [now]}, {"provider": "codex", "ts": now, "data": "[1]"},
+                   {"provider": "codex", "ts": now, "data": _payload("codex", 5)}]
+        report = history.import_snapshots(iter(records))
+        stored = [v for _, v in history.get_series("claude", hours=2, tier="raw")]
+
+    ok = (
+        stored == [10, 30] and "imported 2 snapshots (0 duplicates, 2 skipped)" in log.getvalue()
+        and report["imported"] == 1 and report["skipped"] == 2
+    )
+    print(f"{'✓' if ok else '✗'} Malformed records skipped, the others imported ({stored} from CSV)")
+    return ok
+
+
+def test_to_epoch_formats():
+    """Stored timestamp formats from every schema version convert consistently."""
+    naive = datetime(2026, 1, 4, 12, 0, 0)
+    ok = (
+        usagebar_history.to_epoch(1767528000) == 1767528000
+        and usagebar_history.to_epoch("2026-01-04T12:00:00Z") == 1767528000
+        and usagebar_history.to_epoch("2026-01-04 12:00:00") == 1767528000  # CURRENT_TIMESTAMP is UTC
+        and usagebar_history.to_epoch(naive.isoformat()) == int(naive.timestamp())  # local time
+        and usagebar_history.to_epoch("garbage") is None
+    )
+    print(f"{'✓' if ok else '✗'} Timestamp formats convert to UTC epoch")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar History Storage Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_query_plans(),
+        test_epoch_timestamps(),
+        test_rollups_incremental(),
+        test_tier_planner(),
+        test_retention_batches_and_schedule(),
+        test_sampling_policies(),
+        test_sampling_in_memory(),
+        test_ring_buffer(),
+        test_same_second_saved_once(),
+        test_series_cache(),
+        test_writer_batches_and_flushes(),
+        test_writer_overflow_policies(),
+        test_writer_stats_consistent(),
+        test_migrate_v0_blob_schema(),
+        test_migrate_v1_text_timestamps(),
+        test_chart_command(),
+        test_chart_tier_week(),
+        test_streaming_export(),
+        test_bulk_import(),
+        test_import_existing_buckets(),
+        test_import_skips_malformed_records(),
+        test_to_epoch_formats(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Tests for the tray's retained menu (RetainedMenu.sync), run against the
+headless GTK stand-in from usagebar-bench.py: unchanged rows keep their
+widgets, changed rows update in place, stale rows are destroyed and new
+rows land in order. Also checks that refreshes never read SQLite on the
+GTK thread and that a burst of results costs one rebuild.
+"""
+
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location(
+    "usagebar_bench", os.path.join(_script_dir, "usagebar-bench.py")
+)
+usagebar_bench = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(usagebar_bench)
+
+# Scratch HOME for the tray's settings and history, removed when the tests finish
+_home = tempfile.TemporaryDirectory()
+with contextlib.redirect_stdout(io.StringIO()):
+    tray_module, gtk = usagebar_bench.load_headless_tray(_home.name)
+
+ROWS = [
+    ('codex', "Codex 90%", "Codex"),
+    ('sep', None, None),
+    ('claude', "Claude 80%", "Claude"),
+    ('refresh', "Refresh", None),
+]
+
+
+def _menu():
+    """An exported RetainedMenu whose widgets record being destroyed."""
+    destroyed = []
+
+    def factory(key, label):
+        widget = gtk.Gtk.SeparatorMenuItem() if label is None else gtk.Gtk.MenuItem(label=label)
+        widget.key = key
+        widget.destroy = lambda: destroyed.append(key)
+        return widget
+
+    menu = tray_module.RetainedMenu(factory)
+    gtk.exported = menu.menu
+    return menu, destroyed
+
+
+def _children(menu):
+    return [(child.key, child.get_label()) for child in menu.menu.get_children()]
+
+
+def _updates():
+    return gtk.counters['property_updates'], gtk.counters['layout_updates']
+
+
+def test_unchanged_rows_kept():
+    """Syncing the same rows again touches no widget and sends no updates."""
+    menu, destroyed = _menu()
+    menu.sync(ROWS)
+    widgets = dict(menu.items)
+    before = _updates()
+    menu.sync(list(ROWS))
+
+    ok = (
+        all(menu.items[key] is widget for key, widget in widgets.items())
+        and _updates() == before and not destroyed
+        and _children(menu) == [(key, label) for key, label, _ in ROWS]
+    )
+    print(f"{'✓' if ok else '✗'} Unchanged rows keep their widgets ({len(widgets)} rows, no updates)")
+    return ok
+
+
+def test_changed_labels_in_place():
+    """A changed label or tooltip is set on the existing widget, without a layout change."""
+    menu, destroyed = _menu()
+    menu.sync(ROWS)
+    claude = menu.items['claude']
+    properties, layouts = _updates()
+    menu.sync([ROWS[0], ROWS[1], ('claude', "Claude 75%", "Claude\nResets soon"), ROWS[3]])
+
+    ok = (
+        menu.items['claude'] is claude and claude.get_label() == "Claude 75%"
+        and claude.get_tooltip_text() == "Claude\nResets soon"
+        and _updates() == (properties + 2, layouts) and not destroyed
+    )
+    print(f"{'✓' if ok else '✗'} Changed label and tooltip updated in place")
+    return ok
+
+
+def test_removed_rows_destroyed():
+    """Rows no longer wanted are removed from the menu and destroyed."""
+    menu, destroyed = _menu()
+    menu.sync(ROWS)
+    codex = menu.items['codex']
+    menu.sync([ROWS[2], ROWS[3]])
+
+    ok = (
+        sorted(destroyed) == ['codex', 'sep'] and codex.parent is None
+        and set(menu.items) == {'claude', 'refresh'} and menu.order == ['claude', 'refresh']
+        and _children(menu) == [('claude', "Claude 80%"), ('refresh', "Refresh")]
+    )
+    print(f"{'✓' if ok else '✗'} Removed rows destroyed: {sorted(destroyed)}")
+    return ok
+
+
+def test_new_rows_in_order():
+    """New rows are inserted at their position and moved rows are reordered."""
+    menu, destroyed = _menu()
+    menu.sync(ROWS)
+    claude = menu.items['claude']
+    rows = [
+        ('cursor', "Cursor 95%", None),
+        ROWS[2],
+        ('gemini', "Gemini 85%", None),
+        ROWS[0],
+        ROWS[1],
+        ROWS[3],
+    ]
+    menu.sync(rows)
+
+    ok = (
+        _children(menu) == [(key, label) for key, label, _ in rows]
+        and menu.order == [key for key, _, _ in rows]
+        and menu.items['claude'] is claude and not destroyed
+    )
+    print(f"{'✓' if ok else '✗'} New rows inserted in order: {menu.order}")
+    return ok
+
+
+def test_tray_provider_removed():
+    """A provider that disappears loses its header and submenu; the others keep their widgets."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = tray_module.UsageBarTray()
+    app.provider_data = usagebar_bench.synthetic_payloads()
+    app.build_full_menu()
+    headers = {key: widget for key, widget in app.main_menu.items.items() if key.startswith('provider:')}
+    codex_rows = dict(app.provider_menus['codex'].items)
+
+    app.provider_data = [p for p in app.provider_data if p['provider'] != 'zai']
+    app.build_full_menu()
+    app.shutdown()
+
+    ok = (
+        'provider:zai' not in app.main_menu.items and 'zai' not in app.provider_menus
+        and headers['provider:zai'].parent is None
+        and all(app.main_menu.items[key] is widget for key, widget in headers.items() if key != 'provider:zai')
+        and all(app.provider_menus['codex'].items[key] is widget for key, widget in codex_rows.items())
+    )
+    print(f"{'✓' if ok else '✗'} Removed provider's rows dropped, {len(headers) - 1} others retained")
+    return ok
+
+
+def test_menu_reads_no_sqlite():
+    """With history attached, data arriving and the menu rebuild never touch SQLite on the GTK thread."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = tray_module.UsageBarTray()
+        history = app.open_history()
+    now = time.time()
+    for hours_ago in (3, 2, 1):
+        history.save_snapshot(usagebar_bench.synthetic_payloads(hours_ago), now=now - hours_ago * 3600)
+    seeds = app.load_scheduler_history(history)
+
+    main_thread_queries = []
+    connect = history._connect
+
+    def tracked_connect():
+        if threading.current_thread() is threading.main_thread():
+            main_thread_queries.append(sys._getframe(1).f_code.co_name)
+        return connect()
+
+    history._connect = tracked_connect
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.attach_history(history, {}, seeds)
+            for round_no in range(3):
+                app.on_data_ready(usagebar_bench.synthetic_payloads(round_no))
+        trend = app.provider_menus['claude'].items['trend'].get_label()
+        rate = app.scheduler.burn_rate('claude', 'primary')
+        # A cold cache means no sparklines for now, not a query
+        history.invalidate_cache()
+        app.build_full_menu()
+    finally:
+        history._connect = connect
+        app.shutdown()
+
+    ok = not main_thread_queries and trend.startswith("24h") and rate is not None
+    print(f"{'✓' if ok else '✗'} No SQLite on the GTK thread (queries from: {main_thread_queries or 'none'}; "
+          f"trend row {trend!r})")
+    return ok
+
+
+def test_results_coalesced():
+    """Provider results queued before the main loop runs are applied with one menu rebuild."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = tray_module.UsageBarTray()
+    app.on_data_ready(usagebar_bench.synthetic_payloads())
+    stages = tray_module.usagebar_metrics.STAGE_SECONDS
+    idle = []
+    idle_add, gtk.GLib.idle_add = gtk.GLib.idle_add, lambda func, *args: idle.append((func, args))
+    try:
+        for payload in usagebar_bench.synthetic_payloads(1)[:6]:
+            app.queue_result(payload=payload)
+        app.queue_result(p_id='factory', error="timed out after 45s")
+        scheduled = len(idle)
+        before = stages.count(stage='menu_build')
+        for func, args in idle:
+            func(*args)
+        builds = stages.count(stage='menu_build') - before
+    finally:
+        gtk.GLib.idle_add = idle_add
+        app.shutdown()
+
+    header = app.main_menu.items['provider:factory'].get_label()
+    ok = scheduled == 1 and builds == 1 and header.endswith("⚠️") and not app.incoming
+    print(f"{'✓' if ok else '✗'} 7 queued results: {scheduled} idle callback, {builds} menu build")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Menu Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_unchanged_rows_kept(),
+        test_changed_labels_in_place(),
+        test_removed_rows_destroyed(),
+        test_new_rows_in_order(),
+        test_tray_provider_removed(),
+        test_menu_reads_no_sqlite(),
+        test_results_coalesced(),
+    ]
+    _home.cleanup()
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Tests for the refresh-pipeline instrumentation module.
+Covers histograms and the Prometheus text format, spans, endpoint parsing,
+the HTTP/Unix-socket endpoint, log formatting and the tray's stage spans.
+"""
+
+import contextlib
+import importlib.util
+import io
+import logging
+import os
+import socket
+import stat
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load(name, filename):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_metrics = _load("usagebar_metrics", "usagebar-metrics.py")
+usagebar_bench = _load("usagebar_bench", "usagebar-bench.py")
+
+
+def test_histogram_exposition():
+    """Buckets are cumulative, +Inf equals the count, and label values are escaped."""
+    registry = usagebar_metrics.Registry()
+    histogram = registry.histogram('test_seconds', "Test durations", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage='a"b')
+    registry.counter('test_total', "Test events").inc(3, provider='codex')
+    text = registry.render()
+
+    expected = [
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{stage="a\\"b",le="0.1"} 1',
+        'test_seconds_bucket{stage="a\\"b",le="1.0"} 3',
+        'test_seconds_bucket{stage="a\\"b",le="+Inf"} 4',
+        'test_seconds_sum{stage="a\\"b"} 6.05',
+        'test_seconds_count{stage="a\\"b"} 4',
+        '# TYPE test_total counter',
+        'test_total{provider="codex"} 3',
+    ]
+    missing = [line for line in expected if line not in text.splitlines()]
+    ok = not missing and text.endswith('\n')
+    print(f"{'✓' if ok else '✗'} Prometheus exposition (missing: {missing or 'none'})")
+    return ok
+
+
+def test_spans():
+    """span() and timed() record into usagebar_stage_seconds with their labels."""
+    @usagebar_metrics.timed('test_stage', kind='decorated')
+    def work():
+        time.sleep(0.002)
+        return 42
+
+    with usagebar_metrics.span('test_stage', kind='block'):
+        time.sleep(0.002)
+    result = work()
+    try:
+        with usagebar_metrics.span('test_stage', kind='error'):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    stages = usagebar_metrics.STAGE_SECONDS
+    ok = (
+        result == 42
+        and all(stages.count(stage='test_stage', kind=kind) == 1 for kind in ('block', 'decorated', 'error'))
+        and stages.sum(stage='test_stage', kind='block') >= 0.002
+    )
+    print(f"{'✓' if ok else '✗'} Spans recorded for blocks, decorated calls and errors")
+    return ok
+
+
+def test_parse_endpoint():
+    """Ports, loopback host:port and unix: paths parse; other hosts are refused."""
+    parse = usagebar_metrics.parse_endpoint
+    ok = (
+        parse("9464") == ('tcp', ('127.0.0.1', 9464))
+        and parse("localhost:9000") == ('tcp', ('localhost', 9000))
+        and parse("[::1]:9000") == ('tcp', ('::1', 9000))
+        and parse("unix:/tmp/m.sock") == ('unix', '/tmp/m.sock')
+    )
+    for bad in ("0.0.0.0:9464", "example.com:80", "localhost:http", "unix:"):
+        try:
+            parse(bad)
+            ok = False
+        except ValueError:
+            pass
+    print(f"{'✓' if ok else '✗'} Endpoint parsing (non-loopback hosts refused)")
+    return ok
+
+
+def test_endpoints():
+    """The TCP and Unix-socket endpoints serve /metrics; other paths are 404."""
+    usagebar_metrics.observe('menu_build', 0.003)
+    server = usagebar_metrics.MetricsServer("127.0.0.1:0").start()
+    try:
+        with urllib.request.urlopen(server.url, timeout=5) as response:
+            content_type = response.headers['Content-Type']
+            body = response.read().decode()
+        try:
+            urllib.request.urlopen(server.url.replace('/metrics', '/other'), timeout=5)
+            not_found = False
+        except urllib.error.HTTPError as e:
+            not_found = e.code == 404
+    finally:
+        server.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metrics.sock")
+        server = usagebar_metrics.MetricsServer(f"unix:{path}").start()
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+            with socket.socket(socket.AF_UNIX) as client:
+                client.settimeout(5)
+                client.connect(path)
+                client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+                reply = b"".join(iter(lambda: client.recv(65536), b"")).decode()
+        finally:
+            server.stop()
+        removed = not os.path.exists(path)
+
+    ok = (
+        content_type.startswith('text/plain; version=0.0.4')
+        and 'usagebar_stage_seconds_count{stage="menu_build"}' in body
+        and 'usagebar_uptime_seconds' in body and not_found
+        and reply.startswith("HTTP/1.0 200") and 'usagebar_stage_seconds' in reply
+        and mode == 0o600 and removed
+    )
+    print(f"{'✓' if ok else '✗'} TCP and Unix-socket endpoints (socket mode {oct(mode)})")
+    return ok
+
+
+def test_log_format():
+    """INFO lines keep the '[UsageBar] ' prefix; other levels name themselves."""
+    usagebar_metrics.setup_logging('INFO')
+    logger = logging.getLogger('usagebar')
+    stream = io.StringIO()
+    handler = logger.handlers[0]
+    old_stream = handler.setStream(stream)
+    try:
+        logging.getLogger('usagebar.test').info("History tracking enabled")
+        logging.getLogger('usagebar.test').warning("Could not load history: %s", "locked")
+        logging.getLogger('usagebar.test').debug("hidden at INFO")
+    finally:
+        handler.setStream(old_stream)
+        usagebar_metrics.setup_logging('WARNING')
+
+    lines = stream.getvalue().splitlines()
+    ok = lines == ["[UsageBar] History tracking enabled", "[UsageBar] Warning: Could not load history: locked"]
+    print(f"{'✓' if ok else '✗'} Log format: {lines}")
+    return ok
+
+
+def test_tray_stages():
+    """A headless menu refresh records menu, history read and indicator stages, and prints nothing."""
+    stages = usagebar_metrics.STAGE_SECONDS
+    before = {stage: stages.count(stage=stage) for stage in ('menu_build',)}
+    with tempfile.TemporaryDirectory() as home:
+        quiet = io.StringIO()
+        with contextlib.redirect_stdout(quiet):
+            tray_module, _ = usagebar_bench.load_headless_tray(home)
+            app = tray_module.UsageBarTray()
+            app.attach_history(app.open_history())
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            for round_no in range(3):
+                app.provider_data = usagebar_bench.synthetic_payloads(round_no)
+                app.build_full_menu()
+        with contextlib.redirect_stdout(quiet):
+            app.shutdown()
+
+    ok = (
+        tray_module.usagebar_metrics is usagebar_metrics
+        and stages.count(stage='menu_build') - before['menu_build'] == 3
+        and stages.count(stage='history_read', query='series') >= 3
+        and stages.count(stage='indicator_update', call='set_menu') >= 1
+        and out.getvalue() == ""
+    )
+    print(f"{'✓' if ok else '✗'} Tray stages recorded, no DEBUG output ({len(out.getvalue())} chars printed)")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Metrics Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_histogram_exposition(),
+        test_spans(),
+        test_parse_endpoint(),
+        test_endpoints(),
+        test_log_format(),
+        test_tray_stages(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
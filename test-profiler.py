@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Tests for the opt-in session profiler.
+Covers call sampling, report contents, rotation, the disabled fast path
+and the tray's profiling hooks and settings items.
+"""
+
+import contextlib
+import importlib.util
+import io
+import os
+import pstats
+import sys
+import tempfile
+import tracemalloc
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load(name, filename):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_profiler = _load("usagebar_profiler", "usagebar-profiler.py")
+usagebar_bench = _load("usagebar_bench", "usagebar-bench.py")
+
+_retained = []
+
+
+def busy_work(n=2000):
+    return sum(i * i for i in range(n))
+
+
+def leaky_work():
+    _retained.append(bytearray(64 * 1024))
+
+
+@contextlib.contextmanager
+def _profiler(tmp, **kwargs):
+    """Install a SessionProfiler writing to tmp as the module-wide PROFILER."""
+    previous = usagebar_profiler.PROFILER
+    profiler = usagebar_profiler.PROFILER = usagebar_profiler.SessionProfiler(tmp, **kwargs)
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        usagebar_profiler.PROFILER = previous
+
+
+def test_sampling():
+    """One call in sample_every is profiled; nested calls are covered by the outer capture."""
+    @usagebar_profiler.profiled('inner')
+    def inner():
+        return busy_work(100)
+
+    @usagebar_profiler.profiled('outer')
+    def outer():
+        return inner()
+
+    with tempfile.TemporaryDirectory() as tmp, _profiler(tmp, sample_every=3) as profiler:
+        profiler.start()
+        for _ in range(7):
+            outer()
+        counts = {hook: list(c) for hook, c in profiler._calls.items()}
+
+    # inner runs unnested 4 times (outer calls 2, 3, 5, 6), sampling the 1st and 4th
+    ok = counts == {'outer': [7, 3, 0], 'inner': [7, 2, 3]}
+    print(f"{'✓' if ok else '✗'} Sampling 1 in 3: {counts}")
+    return ok
+
+
+def test_report():
+    """Reports list each hook's hot functions, allocation growth, and a loadable .prof file."""
+    @usagebar_profiler.profiled('build_full_menu')
+    def hooked():
+        busy_work()
+        leaky_work()
+
+    with tempfile.TemporaryDirectory() as tmp, _profiler(tmp, sample_every=1) as profiler:
+        profiler.start()
+        for _ in range(5):
+            hooked()
+        path = profiler.write_report()
+        with open(path) as f:
+            text = f.read()
+        prof = path[:-len(".txt")] + ".prof"
+        stats = pstats.Stats(prof)
+        functions = {func[2] for func in stats.stats}
+        # The next report only covers calls made after this one
+        hooked()
+        second = profiler.write_report("periodic")
+        with open(second) as f:
+            second_text = f.read()
+
+    ok = (
+        "== build_full_menu: 5 calls, 5 profiled ==" in text
+        and "busy_work" in text and "busy_work" in functions
+        and "Growth since the previous report:" in text and "test-profiler.py" in text
+        and "== build_full_menu: 1 calls, 1 profiled ==" in second_text
+        and "(periodic)" in second_text
+    )
+    print(f"{'✓' if ok else '✗'} Report: hooks, hot functions, allocation growth and .prof ({len(stats.stats)} functions)")
+    return ok
+
+
+def test_rotation():
+    """Only the newest `keep` reports (text and .prof) stay on disk."""
+    @usagebar_profiler.profiled('on_data_ready')
+    def hooked():
+        busy_work(10)
+
+    with tempfile.TemporaryDirectory() as tmp, _profiler(tmp, sample_every=1, keep=3) as profiler:
+        profiler.start()
+        written = []
+        for _ in range(5):
+            hooked()
+            written.append(profiler.write_report())
+        remaining = sorted(os.listdir(tmp))
+
+    expected = sorted(os.path.basename(p)[:-len(".txt")] + ext for p in written[-3:] for ext in (".txt", ".prof"))
+    ok = remaining == expected
+    print(f"{'✓' if ok else '✗'} Rotation keeps the newest 3 of 5 reports ({len(remaining)} files)")
+    return ok
+
+
+def test_disabled():
+    """While disabled nothing is traced or written, and stop() ends tracemalloc."""
+    @usagebar_profiler.profiled('trigger_refresh')
+    def hooked():
+        return 7
+
+    with tempfile.TemporaryDirectory() as tmp, _profiler(tmp) as profiler:
+        before = hooked()
+        nothing = profiler.write_report()
+        profiler.start()
+        tracing = tracemalloc.is_tracing()
+        profiler.stop()
+        files = os.listdir(tmp)
+
+    ok = before == 7 and nothing is None and tracing and not tracemalloc.is_tracing() and not files
+    print(f"{'✓' if ok else '✗'} Disabled profiler records and writes nothing")
+    return ok
+
+
+def test_tray_hooks():
+    """The tray's hooks are profiled, the Settings items work, and exit writes a final report."""
+    with tempfile.TemporaryDirectory() as home, _profiler(os.path.join(home, "profiles"), sample_every=1) as profiler:
+        with contextlib.redirect_stdout(io.StringIO()):
+            tray_module, _ = usagebar_bench.load_headless_tray(home)
+            app = tray_module.UsageBarTray()
+            app.on_data_ready(usagebar_bench.synthetic_payloads())
+            app.create_main_menu()
+        idle_item_sensitive = app.dump_profile_item is not None
+
+        toggle = type("Toggle", (), {"get_active": lambda self: True})()
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.on_profiling_toggled(toggle)
+            for round_no in range(3):
+                app.on_data_ready(usagebar_bench.synthetic_payloads(round_no))
+            path = app.dump_profile()
+            with open(path) as f:
+                text = f.read()
+            app.shutdown()
+        reports = profiler.reports()
+        with open(reports[-1]) as f:
+            exit_report = f.read()
+        with open(os.path.join(home, ".config", "usagebar", "settings.json")) as f:
+            saved = f.read()
+
+    ok = (
+        idle_item_sensitive and path is not None
+        and "== on_data_ready: 3 calls, 3 profiled ==" in text
+        and "== build_full_menu: 3 calls, 0 profiled, 3 inside another hook's capture ==" in text
+        and len(reports) == 2 and "(exit)" in exit_report
+        and '"profiling": true' in saved and not profiler.enabled
+    )
+    print(f"{'✓' if ok else '✗'} Tray hooks profiled, on-demand and exit reports written ({len(reports)} reports)")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Profiler Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_sampling(),
+        test_report(),
+        test_rotation(),
+        test_disabled(),
+        test_tray_hooks(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
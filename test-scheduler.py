@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive refresh scheduler.
+Covers interval bounds, faster polling near resets and warning thresholds,
+failure backoff, due/next-tick bookkeeping, seeding from stored history,
+and the tray keeping its menu
+when every provider polled on a tick fails.
+"""
+
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load(name, filename):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_scheduler = _load("usagebar_scheduler", "usagebar-scheduler.py")
+usagebar_bench = _load("usagebar_bench", "usagebar-bench.py")
+
+NOW = 1_767_225_600  # 2026-01-01 00:00 UTC
+
+
+def _payload(used, resets_in=None):
+    primary = {'usedPercent': used}
+    if resets_in is not None:
+        reset = datetime.fromtimestamp(NOW + resets_in, tz=timezone.utc)
+        primary['resetsAt'] = reset.isoformat().replace('+00:00', 'Z')
+    return {'provider': 'claude', 'usage': {'primary': primary}}
+
+
+def _scheduler(first, last, span=3600):
+    """A scheduler that saw claude go from `first` to `last` percent used over `span` seconds."""
+    scheduler = usagebar_scheduler.AdaptiveScheduler(base_interval=300, min_interval=60, max_interval=1800)
+    scheduler.observe('claude', _payload(first), now=NOW - span)
+    scheduler.observe('claude', _payload(last), now=NOW)
+    return scheduler
+
+
+def test_bounds():
+    """Computed intervals are clamped to the configured minimum and maximum."""
+    slow = _scheduler(9.4, 10).next_interval('claude', _payload(10), now=NOW)  # 40 points to go at 0.6/h
+    idle = _scheduler(10, 10).next_interval('claude', _payload(10), now=NOW)
+    fast = _scheduler(31, 40).next_interval('claude', _payload(40), now=NOW)  # 10 points at 9/h: 4000s / 4 polls
+    racing = _scheduler(24, 44, span=600).next_interval('claude', _payload(44), now=NOW)  # 6 points at 120/h
+    unknown = usagebar_scheduler.AdaptiveScheduler(base_interval=300).next_interval('claude', _payload(10), now=NOW)
+
+    ok = slow == 1800 and idle == 1800 and fast == 1000 and racing == 60 and unknown == 300
+    print(f"{'✓' if ok else '✗'} Bounds: slow {slow}s, idle {idle}s, fast {fast}s, racing {racing}s, "
+          f"no history {unknown}s")
+    return ok
+
+
+def test_reset_and_thresholds():
+    """Polls land just after an upcoming reset and at the minimum near the 50% and 20% marks."""
+    scheduler = _scheduler(10, 10)
+    before_reset = scheduler.next_interval('claude', _payload(10, resets_in=120), now=NOW)
+    past_reset = scheduler.next_interval('claude', _payload(10, resets_in=-60), now=NOW)
+    far_reset = scheduler.next_interval('claude', _payload(10, resets_in=7 * 86400), now=NOW)
+    near_half = _scheduler(48, 48).next_interval('claude', _payload(48), now=NOW)
+    near_fifth = _scheduler(78, 78).next_interval('claude', _payload(78), now=NOW)
+    past_half = _scheduler(56, 56).next_interval('claude', _payload(56), now=NOW)
+
+    grace = usagebar_scheduler.RESET_GRACE_SECONDS
+    ok = (
+        before_reset == 120 + grace and past_reset == 60 and far_reset == 1800
+        and near_half == 60 and near_fifth == 60 and past_half == 1800
+    )
+    print(f"{'✓' if ok else '✗'} Reset in 2 min -> {before_reset}s; 2/2/24 points from a threshold -> "
+          f"{near_half}s/{near_fifth}s/{past_half}s")
+    return ok
+
+
+def test_failure_backoff():
+    """Consecutive failures double the retry delay up to the maximum; fresh data resets it."""
+    scheduler = usagebar_scheduler.AdaptiveScheduler(base_interval=300, min_interval=60, max_interval=1800)
+    delays = [scheduler.mark_failed('factory', now=NOW) for _ in range(5)]
+    scheduler.observe('factory', _payload(10), now=NOW)
+    after_success = scheduler.mark_failed('factory', now=NOW)
+
+    ok = delays == [300, 600, 1200, 1800, 1800] and after_success == 300
+    print(f"{'✓' if ok else '✗'} Failure backoff {delays}, then {after_success}s after a success")
+    return ok
+
+
+def test_due_and_next():
+    """due() lists providers whose time has come (unknown ones first of all); the wait is bounded."""
+    scheduler = usagebar_scheduler.AdaptiveScheduler(base_interval=300, min_interval=60, max_interval=1800)
+    providers = ['claude', 'codex', 'gemini']
+    scheduler.observe('claude', _payload(10), now=NOW)  # no history: base interval
+    scheduler.mark_failed('codex', now=NOW - 200)
+    due_now = scheduler.due(providers, now=NOW)
+    waits = [scheduler.seconds_until_next(['claude', 'codex'], now=now) for now in (NOW, NOW + 90, NOW + 100)]
+    due_later = scheduler.due(providers, now=NOW + 300)
+
+    ok = due_now == ['gemini'] and waits == [100, 60, 0] and due_later == providers
+    print(f"{'✓' if ok else '✗'} Due now {due_now}, waits {waits}, due after 5 min {due_later}")
+    return ok
+
+
+def test_seed_merges_history():
+    """Stored samples read off the GTK thread are merged with those observed before they arrived."""
+    scheduler = usagebar_scheduler.AdaptiveScheduler(base_interval=300, min_interval=60, max_interval=1800)
+    scheduler.observe('claude', _payload(40), now=NOW)
+    before = scheduler.burn_rate('claude', 'primary', now=NOW)
+    scheduler.seed({'claude': [(NOW - 3600, {'primary': 31}), (NOW - 1800, {'primary': 35.5})]})
+    samples = [ts for ts, _ in scheduler._samples['claude']]
+    after = scheduler.burn_rate('claude', 'primary', now=NOW)
+
+    ok = before is None and samples == [NOW - 3600, NOW - 1800, NOW] and after == 9
+    print(f"{'✓' if ok else '✗'} Seeded history merged in order; burn rate {after}%/h")
+    return ok
+
+
+def test_tray_keeps_menu_when_due_providers_fail():
+    """An adaptive tick whose providers all fail marks their rows instead of replacing the menu."""
+    with tempfile.TemporaryDirectory() as home:
+        with contextlib.redirect_stdout(io.StringIO()):
+            tray_module, _ = usagebar_bench.load_headless_tray(home)
+            app = tray_module.UsageBarTray()
+            app.on_data_ready(usagebar_bench.synthetic_payloads())
+        menu = app.main_menu.menu
+        error = "exit 1: provider not configured"
+        app.on_provider_error('factory', error)
+        app.on_error(error)
+        kept = app.attached_menu is menu
+        header = app.main_menu.items['provider:factory'].get_label()
+        factory_error = app.provider_menus['factory'].items['error'].get_label()
+        codex_error = 'error' in app.provider_menus['codex'].items
+
+        app.on_data_ready([p for p in usagebar_bench.synthetic_payloads() if p['provider'] == 'factory'])
+        cleared = 'error' not in app.provider_menus['factory'].items
+        app.on_error("nothing")
+        app.on_provider_error('cursor', "timed out after 45s")
+        app.shutdown()
+
+        # With no data at all the error menu is still used
+        with contextlib.redirect_stdout(io.StringIO()):
+            empty = tray_module.UsageBarTray()
+        empty.on_error(error)
+        error_menu = [child.get_label() for child in empty.attached_menu.get_children()]
+        empty.shutdown()
+
+    ok = (
+        kept and header.endswith("⚠️") and factory_error == f"⚠️ Refresh failed: {error}"
+        and not codex_error and cleared and app.attached_menu is menu
+        and error_menu[0] == f"⚠️ {error}"
+    )
+    print(f"{'✓' if ok else '✗'} Failed tick keeps the menu ({header!r})")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Scheduler Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_bounds(),
+        test_reset_and_thresholds(),
+        test_failure_backoff(),
+        test_due_and_next(),
+        test_seed_merges_history(),
+        test_tray_keeps_menu_when_due_providers_fail(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Tests for the tray's startup path, run against the headless GTK stand-in
+from usagebar-bench.py: optional modules and the history database stay
+off the critical path, and --profile-startup reports every phase.
+"""
+
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location(
+    "usagebar_bench", os.path.join(_script_dir, "usagebar-bench.py")
+)
+usagebar_bench = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(usagebar_bench)
+
+
+def _tray(home):
+    """A freshly imported tray module and app with HOME at a scratch dir."""
+    for name in ('usagebar_history', 'usagebar_charts', 'usagebar_downsample'):
+        sys.modules.pop(name, None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tray_module, _ = usagebar_bench.load_headless_tray(home)
+        app = tray_module.UsageBarTray()
+    return tray_module, app
+
+
+def test_lazy_modules_and_database():
+    """Constructing the tray loads neither history nor charts and creates no database."""
+    with tempfile.TemporaryDirectory() as home:
+        tray_module, app = _tray(home)
+        loaded = [name for name in ('usagebar_history', 'usagebar_charts') if name in sys.modules]
+        db_created = os.path.exists(os.path.join(home, ".config", "usagebar"))
+        app.shutdown()
+
+    ok = not loaded and not db_created and app.history is None
+    print(f"{'✓' if ok else '✗'} Startup defers optional modules (loaded: {loaded or 'none'}, "
+          f"database created: {db_created})")
+    return ok
+
+
+def test_snapshots_before_history_opens():
+    """Data fetched before the database is open is written once it is attached."""
+    with tempfile.TemporaryDirectory() as home:
+        tray_module, app = _tray(home)
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.on_data_ready(usagebar_bench.synthetic_payloads())
+            app.attach_history(app.open_history())
+            app.history_writer.flush()
+            stored = app.history.get_latest_snapshots()
+            app.shutdown()
+
+    ok = len(stored) == 7 and app.pending_snapshots is None
+    print(f"{'✓' if ok else '✗'} Early snapshots written after the database opened ({len(stored)} providers)")
+    return ok
+
+
+def test_profile_report():
+    """The startup report is printed once, after the first menu and history are both ready."""
+    with tempfile.TemporaryDirectory() as home:
+        tray_module, app = _tray(home)
+        tray_module.STARTUP.enabled = True
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            app.on_data_ready(usagebar_bench.synthetic_payloads())
+            early = out.getvalue()
+            app.attach_history(app.open_history())
+            app.on_data_ready(usagebar_bench.synthetic_payloads(1))
+            app.shutdown()
+        report = out.getvalue()
+
+    phases = ("GI imports", "CSS", "indicator", "loading menu", "DB init", "first menu")
+    missing = [phase for phase in phases if f"   {phase} " not in report]
+    ok = ("Startup profile" not in early and report.count("Startup profile") == 1 and not missing)
+    print(f"{'✓' if ok else '✗'} Startup profile reported once (missing phases: {missing or 'none'})")
+    return ok
+
+
+def _seed_history(home, saved_at):
+    """Store one round of synthetic snapshots in HOME's history database."""
+    history_module = sys.modules.get('usagebar_history') or usagebar_bench._load_module(
+        "usagebar_history", "usagebar-history.py")
+    path = os.path.join(home, ".config", "usagebar", "history.db")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        with history_module.UsageHistory(path) as history:
+            history.save_snapshot(usagebar_bench.synthetic_payloads(), now=saved_at)
+
+
+def _labels(app):
+    return {key: widget.get_label() for key, widget in app.main_menu.items.items()}
+
+
+def test_warm_start_from_stored_snapshots():
+    """Stored snapshots fill the menu before the first fetch, marked with their age."""
+    with tempfile.TemporaryDirectory() as home:
+        _seed_history(home, time.time() - 2 * 3600)
+        tray_module, app = _tray(home)
+        with contextlib.redirect_stdout(io.StringIO()):
+            history = app.open_history()
+            app.attach_history(history, app.load_cached_snapshots(history))
+        cached = _labels(app)
+        stale_rows = [p_id for p_id, menu in app.provider_menus.items() if 'stale' in menu.items]
+
+        fresh = [p for p in usagebar_bench.synthetic_payloads(1) if p['provider'] == 'claude']
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.on_data_ready(fresh)
+        refreshed = _labels(app)
+        claude_stale = 'stale' in app.provider_menus['claude'].items
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.shutdown()
+
+    ok = (
+        len(stale_rows) == 7
+        and all("🕓 2h 00m" in cached[f"provider:{p_id}"] for p_id in stale_rows)
+        and cached['updated'].startswith("🕓 Showing saved data")
+        and "🕓" not in refreshed['provider:claude'] and not claude_stale
+        and "🕓" in refreshed['provider:codex']
+        and refreshed['updated'].startswith("🕐 Last updated")
+    )
+    print(f"{'✓' if ok else '✗'} Warm start shows {len(stale_rows)} stored providers; fresh data replaces one")
+    return ok
+
+
+def test_warm_start_limits():
+    """Old snapshots are not shown, reset times are recomputed, and errors keep saved data."""
+    now = time.time()
+    with tempfile.TemporaryDirectory() as home:
+        _seed_history(home, now - 600)
+        tray_module, app = _tray(home)
+        with contextlib.redirect_stdout(io.StringIO()):
+            history = app.open_history()
+            too_old = app.load_cached_snapshots(history, now=now + tray_module.WARM_START_MAX_AGE)
+            app.attach_history(history, app.load_cached_snapshots(history))
+            app.on_error("CLI returned no data")
+        labels = _labels(app)
+        reset = app.provider_menus['codex'].items['reset'].get_label()
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.shutdown()
+
+    # synthetic_payloads() resets at a fixed past date, so the description is recomputed
+    ok = (
+        too_old == {}
+        and labels['updated'] == "⚠️ Showing saved data: CLI returned no data"
+        and "reset since this was saved" in reset
+    )
+    print(f"{'✓' if ok else '✗'} Warm start limits: old snapshots skipped, reset recomputed, error keeps data")
+    return ok
+
+
+def test_history_open_thread_closes_connection():
+    """The background open leaves no SQLite connection behind for its finished thread."""
+    with tempfile.TemporaryDirectory() as home:
+        _seed_history(home, time.time() - 600)
+        tray_module, app = _tray(home)
+        idle = []
+        idle_add, tray_module.GLib.idle_add = tray_module.GLib.idle_add, lambda func, *args: idle.append(args)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                app.start_history()
+                for thread in threading.enumerate():
+                    if thread.name == "usagebar-history-open":
+                        thread.join(10)
+        finally:
+            tray_module.GLib.idle_add = idle_add
+        history, cached, _ = idle[0]
+        left_open = len(history._connections)
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.attach_history(history, cached)
+            app.shutdown()
+
+    ok = left_open == 0 and len(cached) == 7
+    print(f"{'✓' if ok else '✗'} History-open thread released its connection ({left_open} left open)")
+    return ok
+
+
+def main():
+    print("=" * 50)
+    print("UsageBar Startup Tests")
+    print("=" * 50)
+    print()
+
+    results = [
+        test_lazy_modules_and_database(),
+        test_snapshots_before_history_opens(),
+        test_profile_report(),
+        test_warm_start_from_stored_snapshots(),
+        test_warm_start_limits(),
+        test_history_open_thread_closes_connection(),
+    ]
+
+    print()
+    print("=" * 50)
+    if all(results):
+        print("✓ All tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed. Please review the errors above.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,769 @@
+#!/usr/bin/env python3
+"""
+UsageBar Benchmarks
+
+Micro-benchmarks for the tray refresh pipeline. Each benchmark prints a
+summary table, or JSON with --json.
+
+Usage:
+    python3 usagebar-bench.py collector [--runs N] [--cli PATH]
+    python3 usagebar-bench.py menu [--runs N]
+    python3 usagebar-bench.py history [--runs N]
+    python3 usagebar-bench.py charts [--runs N] [--sizes 10000,50000,100000]
+    python3 usagebar-bench.py suite [--days 90] [--interval 900] [--runs N] [-o results.json]
+    python3 usagebar-bench.py compare OLD.json NEW.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Stand-in CLI: prints a realistic 7-provider payload, like `usagebar usage --format json`
+STUB_CLI = '''#!{python}
+import json, sys
+providers = ['codex', 'claude', 'cursor', 'gemini', 'zai', 'antigravity', 'factory']
+wanted = sys.argv[sys.argv.index('--provider') + 1] if '--provider' in sys.argv else 'all'
+print('[info] probing providers', file=sys.stderr)
+print(json.dumps([
+    {{'provider': p, 'version': '1.0.0',
+      'usage': {{'primary': {{'usedPercent': 10 + i * 7, 'resetDescription': 'in 3 hours'}},
+                'secondary': {{'usedPercent': 5 + i * 3}}, 'accountEmail': 'user@example.com'}}}}
+    for i, p in enumerate(providers) if wanted in ('all', p)
+]))
+'''
+
+
+def _load_module(name, filename):
+    """Load a sibling script (hyphenated filename) as a module via importlib."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class HeadlessGtk:
+    """
+    Minimal stand-in for the Gtk/AppIndicator3/GLib APIs the tray uses.
+
+    Counts widget allocations and the DBus traffic libdbusmenu would
+    generate: a full layout export per set_menu(), a LayoutUpdated signal per
+    structural change to an exported menu, and an ItemsPropertiesUpdated
+    signal per label/tooltip change on an exported item.
+    """
+
+    def __init__(self):
+        self.counters = dict.fromkeys(
+            ('widgets', 'set_menu', 'exported_items', 'layout_updates', 'property_updates', 'labels'), 0)
+        self.exported = None
+        counters = self.counters
+        gtk = self
+
+        class Widget:
+            def __init__(self, label=None, **kwargs):
+                counters['widgets'] += 1
+                self.label = label
+                self.tooltip = None
+                self.parent = None
+                self.submenu = None
+                self.active = False
+
+            def exported(self):
+                menu = self.parent
+                while menu is not None:
+                    if menu is gtk.exported:
+                        return True
+                    menu = menu.owner.parent if menu.owner else None
+                return False
+
+            def _changed(self):
+                if self.exported():
+                    counters['property_updates'] += 1
+
+            def set_label(self, label):
+                self.label = label
+                self._changed()
+
+            def get_label(self):
+                return self.label
+
+            def set_tooltip_text(self, text):
+                self.tooltip = text
+                self._changed()
+
+            def get_tooltip_text(self):
+                return self.tooltip
+
+            def set_image(self, image):
+                self.image = image
+                self._changed()
+
+            def set_always_show_image(self, *args):
+                pass
+
+            def set_submenu(self, menu):
+                self.submenu = menu
+                menu.owner = self
+
+            def set_active(self, active):
+                self.active = active
+
+            def get_active(self):
+                return self.active
+
+            def set_sensitive(self, *args):
+                pass
+
+            def connect(self, *args):
+                pass
+
+            def show(self):
+                pass
+
+            def show_all(self):
+                pass
+
+            def destroy(self):
+                pass
+
+        class Menu(Widget):
+            def __init__(self):
+                super().__init__()
+                self.children = []
+                self.owner = None
+
+            def is_exported(self):
+                return self is gtk.exported or (self.owner is not None and self.owner.exported())
+
+            def _layout(self):
+                if self.is_exported():
+                    counters['layout_updates'] += 1
+
+            def append(self, item):
+                self.insert(item, len(self.children))
+
+            def insert(self, item, position):
+                item.parent = self
+                self.children.insert(position, item)
+                self._layout()
+
+            def remove(self, item):
+                self.children.remove(item)
+                item.parent = None
+                self._layout()
+
+            def reorder_child(self, item, position):
+                self.children.remove(item)
+                self.children.insert(position, item)
+                self._layout()
+
+            def get_children(self):
+                return list(self.children)
+
+        def count_items(menu):
+            return sum(1 + (count_items(c.submenu) if c.submenu else 0) for c in menu.children)
+
+        class Indicator:
+            @staticmethod
+            def new(*args):
+                return Indicator()
+
+            def set_status(self, *args):
+                pass
+
+            def set_menu(self, menu):
+                gtk.exported = menu
+                counters['set_menu'] += 1
+                counters['exported_items'] += count_items(menu)
+
+            def set_label(self, *args):
+                counters['labels'] += 1
+
+        class Anything:
+            """Accepts any attribute access or call (CSS providers, screens, settings...)."""
+
+            def __getattr__(self, name):
+                return Anything()
+
+            def __call__(self, *args, **kwargs):
+                return Anything()
+
+        self.Gtk = types.SimpleNamespace(
+            Menu=Menu, MenuItem=Widget, SeparatorMenuItem=Widget, CheckMenuItem=Widget,
+            ImageMenuItem=Widget, Image=types.SimpleNamespace(new_from_pixbuf=lambda pixbuf: pixbuf),
+            CssProvider=Anything(), StyleContext=Anything(), Settings=Anything(),
+            STYLE_PROVIDER_PRIORITY_APPLICATION=600, main_quit=lambda: None, main=lambda: None,
+        )
+        self.AppIndicator3 = types.SimpleNamespace(
+            Indicator=Indicator, IndicatorCategory=Anything(), IndicatorStatus=Anything()
+        )
+        # Timers never fire and idle callbacks are dropped: the benchmark drives the tray
+        self.GLib = types.SimpleNamespace(
+            idle_add=lambda *a: 0, timeout_add=lambda *a: 0,
+            timeout_add_seconds=lambda *a: 0, source_remove=lambda *a: True,
+        )
+
+    def install(self):
+        """Register fake gi/gi.repository modules so the tray can be imported."""
+        gi = types.ModuleType("gi")
+        gi.require_version = lambda *args: None
+        repository = types.ModuleType("gi.repository")
+        repository.Gtk = self.Gtk
+        repository.AppIndicator3 = self.AppIndicator3
+        repository.GLib = self.GLib
+        repository.Gdk = types.SimpleNamespace(Screen=types.SimpleNamespace(get_default=lambda: None),
+                                               pixbuf_get_from_surface=lambda surface, *args: surface)
+        repository.GdkPixbuf = types.SimpleNamespace()
+        gi.repository = repository
+        sys.modules["gi"] = gi
+        sys.modules["gi.repository"] = repository
+
+
+def synthetic_payloads(round_no=0):
+    """Seven providers; one provider's usage moves each round, like a typical refresh."""
+    providers = ['codex', 'claude', 'cursor', 'gemini', 'zai', 'antigravity', 'factory']
+    payloads = []
+    for i, p in enumerate(providers):
+        used = 10 + i * 11 + (round_no % 5 if i == round_no % len(providers) else 0)
+        payloads.append({
+            'provider': p, 'version': '1.0.0',
+            'usage': {
+                'primary': {'usedPercent': used, 'resetDescription': 'in 3 hours',
+                            'resetsAt': '2026-01-04T00:00:00Z'},
+                'secondary': {'usedPercent': used / 2, 'resetDescription': 'in 5 days'},
+                'accountEmail': 'user@example.com',
+            },
+            'credits': {'remaining': 15.5} if p == 'codex' else None,
+        })
+    return payloads
+
+
+def load_headless_tray(home):
+    """Import usagebar-tray.py against HeadlessGtk with HOME pointed at a scratch dir."""
+    os.environ["HOME"] = home
+    gtk = HeadlessGtk()
+    gtk.install()
+    tray = _load_module("usagebar_tray", "usagebar-tray.py")
+    return tray, gtk
+
+
+def _cpu(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _measure(fn, runs):
+    """Run fn() `runs` times; return per-run wall, own-CPU and child-CPU samples."""
+    samples = {'wall_ms': [], 'cpu_ms': [], 'child_cpu_ms': []}
+    for _ in range(runs):
+        wall0 = time.perf_counter()
+        self0 = _cpu(resource.RUSAGE_SELF)
+        child0 = _cpu(resource.RUSAGE_CHILDREN)
+        fn()
+        samples['wall_ms'].append((time.perf_counter() - wall0) * 1000)
+        samples['cpu_ms'].append((_cpu(resource.RUSAGE_SELF) - self0) * 1000)
+        samples['child_cpu_ms'].append((_cpu(resource.RUSAGE_CHILDREN) - child0) * 1000)
+    return samples
+
+
+def _summarize(samples):
+    return {
+        key: {
+            'mean': round(statistics.mean(values), 3),
+            'median': round(statistics.median(values), 3),
+            'max': round(max(values), 3),
+        }
+        for key, values in samples.items()
+    }
+
+
+def _print_table(title, results):
+    print(title)
+    print("=" * 60)
+    for name, summary in results.items():
+        print(f"{name}:")
+        for key, stats in summary.items():
+            print(f"  {key:<14} mean {stats['mean']:>9.2f}  median {stats['median']:>9.2f}"
+                  f"  max {stats['max']:>9.2f}")
+
+
+def bench_collector(args):
+    """Refresh latency and CPU: spawn-per-refresh vs. the long-lived collector worker."""
+    collector = _load_module("usagebar_collector", "usagebar-collector.py")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cli = args.cli
+        if not cli:
+            cli = os.path.join(tmp, "usagebar")
+            with open(cli, 'w') as f:
+                f.write(STUB_CLI.format(python=sys.executable))
+            os.chmod(cli, 0o755)
+
+        spawn = _measure(lambda: collector.fetch_usage(cli=cli), args.runs)
+
+        env_cli = os.environ.get("USAGEBAR_CLI")
+        os.environ["USAGEBAR_CLI"] = cli
+        client = collector.CollectorClient()
+        try:
+            startup = _measure(client.start, 1)
+            worker = _measure(client.refresh, args.runs)
+        finally:
+            client.stop()
+            if env_cli is None:
+                os.environ.pop("USAGEBAR_CLI", None)
+            else:
+                os.environ["USAGEBAR_CLI"] = env_cli
+
+    results = {
+        'spawn_per_refresh': _summarize(spawn),
+        'collector_worker': _summarize(worker),
+        'collector_startup': _summarize(startup),
+    }
+    if args.json:
+        print(json.dumps({'benchmark': 'collector', 'runs': args.runs, 'results': results}, indent=2))
+    else:
+        _print_table(f"Collector benchmark ({args.runs} refreshes, times in ms)", results)
+
+
+def bench_menu(args):
+    """Widget allocations, DBus layout traffic and time per menu refresh: rebuild vs. diff."""
+    with tempfile.TemporaryDirectory() as home:
+        tray_module, gtk = load_headless_tray(home)
+        app = tray_module.UsageBarTray()
+        app.attach_history(app.open_history())
+
+        results = {}
+        for mode in ('rebuild', 'diff'):
+            app.provider_data = synthetic_payloads()
+            app.build_full_menu(rebuild=True)
+            before = dict(gtk.counters)
+            samples = []
+            for round_no in range(1, args.runs + 1):
+                app.provider_data = synthetic_payloads(round_no)
+                wall0 = time.perf_counter()
+                app.build_full_menu(rebuild=(mode == 'rebuild'))
+                samples.append((time.perf_counter() - wall0) * 1000)
+            per_refresh = {k: round((gtk.counters[k] - before[k]) / args.runs, 2) for k in gtk.counters}
+            per_refresh['build_ms'] = round(statistics.mean(samples), 3)
+            results[mode] = per_refresh
+        app.shutdown()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'menu', 'runs': args.runs, 'results': results}, indent=2))
+    else:
+        print(f"Menu benchmark ({args.runs} refreshes, 7 providers, per-refresh averages)")
+        print("=" * 60)
+        keys = list(results['rebuild'])
+        print(f"{'':<18}" + "".join(f"{mode:>12}" for mode in results))
+        for key in keys:
+            print(f"{key:<18}" + "".join(f"{results[mode][key]:>12}" for mode in results))
+
+
+def bench_history(args):
+    """Per-call overhead of UsageHistory: reconnect per call vs. the long-lived connection."""
+    history_module = _load_module("usagebar_history", "usagebar-history.py")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = history_module.UsageHistory(os.path.join(tmp, "history.db"))
+        # Seed a day of hourly snapshots for every provider
+        conn = history._connect()
+        base = time.time() - 86400
+        for hour in range(24):
+            for payload in synthetic_payloads(hour):
+                conn.execute(
+                    f"INSERT INTO usage_snapshots (provider, ts, "
+                    f"{', '.join(history_module.SNAPSHOT_COLUMNS)}, data_json) "
+                    f"VALUES (?, ?, {', '.join('?' * len(history_module.SNAPSHOT_COLUMNS))}, ?)",
+                    (payload['provider'], int(base + hour * 3600),
+                     *history_module.snapshot_columns(payload), json.dumps(payload))
+                )
+        conn.commit()
+
+        calls = {
+            'get_history': lambda: history.get_history('claude', hours=24),
+            'get_history_many': lambda: history.get_history_many(['claude', 'codex', 'gemini'], hours=24),
+            'get_series_many': lambda: history.get_series_many(['claude', 'codex', 'gemini'], hours=24),
+            'get_latest_snapshots': history.get_latest_snapshots,
+            'get_stats': history.get_stats,
+            'save_snapshot': lambda: history.save_snapshot(synthetic_payloads()),
+        }
+
+        results = {}
+        for mode in ('reconnect_per_call', 'persistent'):
+            for name, call in calls.items():
+                samples = []
+                for _ in range(args.runs):
+                    wall0 = time.perf_counter()
+                    call()
+                    if mode == 'reconnect_per_call':
+                        history.close()
+                    samples.append((time.perf_counter() - wall0) * 1000)
+                results.setdefault(name, {})[mode] = round(statistics.median(samples), 4)
+        history.close()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'history', 'runs': args.runs, 'results': results}, indent=2))
+    else:
+        print(f"History benchmark ({args.runs} calls each, median ms per call)")
+        print("=" * 60)
+        print(f"{'':<22}{'reconnect':>14}{'persistent':>14}")
+        for name, by_mode in results.items():
+            print(f"{name:<22}{by_mode['reconnect_per_call']:>14}{by_mode['persistent']:>14}")
+
+
+def synthetic_series(points):
+    """A sawtooth usage series (climbs, then resets) with occasional short spikes."""
+    values = []
+    for i in range(points):
+        used = (i % 2016) / 2016 * 80
+        if i % 997 == 0:
+            used += 15
+        values.append(round(used, 2))
+    return values
+
+
+def bench_charts(args):
+    """Downsampling and render cost: every-Nth vs. lttb vs. min/max, text and Cairo charts."""
+    downsample = _load_module("usagebar_downsample", "usagebar-downsample.py")
+    charts = _load_module("usagebar_charts", "usagebar-charts.py")
+    width = 40
+
+    def every_nth(values, n):
+        step = len(values) / n
+        return [values[int(i * step)] for i in range(n)]
+
+    results = {}
+    for size in args.sizes:
+        values = synthetic_series(size)
+        peak = max(values)
+        reducers = {
+            'every_nth': lambda: every_nth(values, width),
+            'lttb': lambda: downsample.lttb(values, width),
+            'minmax_buckets': lambda: [hi for _, hi in downsample.minmax_buckets(values, width)],
+            'render_sparkline_text': lambda: charts.UsageChart.render_sparkline_text(values, width),
+            'render_ascii_chart': lambda: charts.render_ascii_chart(values, width),
+        }
+        if charts.CAIRO_AVAILABLE:
+            cache = charts.ChartCache()
+            draw = lambda v, theme: charts.render_sparkline_surface(v, theme=theme)
+            reducers.update({
+                'render_sparkline_surface': lambda: charts.render_sparkline_surface(values),
+                'render_area_surface': lambda: charts.render_area_surface(values),
+                'chart_cache_hit': lambda: cache.get('bench', 'sparkline', values, 'light', draw),
+            })
+        for name, reduce in reducers.items():
+            samples = _measure(reduce, args.runs)['wall_ms']
+            entry = {'median_ms': round(statistics.median(samples), 3)}
+            if name in ('every_nth', 'lttb', 'minmax_buckets'):
+                entry['peak_kept'] = max(reduce()) == peak
+            results.setdefault(str(size), {})[name] = entry
+
+    # Cost per point at the largest size relative to the smallest: about 1 for a linear pass
+    small, large = str(min(args.sizes)), str(max(args.sizes))
+    scaling = {}
+    if small != large:
+        for name in ('lttb', 'minmax_buckets'):
+            per_point = [results[size][name]['median_ms'] / int(size) for size in (small, large)]
+            scaling[name] = round(per_point[1] / per_point[0], 2) if per_point[0] else None
+
+    if args.json:
+        print(json.dumps({'benchmark': 'charts', 'runs': args.runs, 'width': width, 'results': results,
+                          'scaling': scaling}, indent=2))
+    else:
+        print(f"Chart benchmark ({args.runs} runs, width {width}, median ms)")
+        print("=" * 60)
+        if not charts.CAIRO_AVAILABLE:
+            print("(pycairo not installed: Cairo render timings skipped)")
+        for size, by_name in results.items():
+            print(f"{size} points:")
+            for name, entry in by_name.items():
+                kept = {True: "  peak kept", False: "  peak lost"}.get(entry.get('peak_kept'), "")
+                print(f"  {name:<24}{entry['median_ms']:>10.3f}{kept}")
+        if scaling:
+            ratios = ", ".join(f"{name} {ratio}x" for name, ratio in scaling.items())
+            print(f"Cost per point, {large} vs {small} points (1.0 = linear): {ratios}")
+
+
+SUITE_PROVIDERS = ('codex', 'claude', 'cursor', 'gemini', 'zai', 'antigravity', 'factory')
+
+
+def synthetic_history_payload(index, provider, ts, rng):
+    """
+    One provider's payload at `ts`: a 5-hour session window and a weekly
+    window, each climbing at a provider-specific pace and resetting to 0,
+    with a little noise.
+    """
+    session, week = 5 * 3600, 7 * 86400
+    pace = 0.6 + index * 0.1
+    session_start = ts - (ts + index * 1800) % session
+    week_start = ts - (ts + index * 86400) % week
+    primary = min(100.0, (ts - session_start) / session * 100 * pace + rng.uniform(0, 2))
+    secondary = min(100.0, (ts - week_start) / week * 100 * pace)
+    iso = lambda epoch: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))
+    payload = {
+        'provider': provider, 'version': '1.0.0',
+        'usage': {
+            'primary': {'usedPercent': round(primary, 1), 'resetsAt': iso(session_start + session),
+                        'resetDescription': 'in a few hours'},
+            'secondary': {'usedPercent': round(secondary, 1), 'resetsAt': iso(week_start + week)},
+            'accountEmail': 'user@example.com',
+        },
+    }
+    if provider == 'codex':
+        payload['credits'] = {'remaining': round(50 - secondary / 4, 2)}
+    return payload
+
+
+def build_synthetic_history(history_module, path, days=90, interval=900, seed=0, now=None):
+    """
+    Create a history database holding `days` of snapshots for 7 providers,
+    one every `interval` seconds, as if retention had never run (so pruning
+    has a realistic backlog). The same arguments always give the same data.
+
+    Returns:
+        Number of raw snapshots written
+    """
+    rng = random.Random(seed)
+    now = int(time.time() if now is None else now)
+    now -= now % interval
+    history = history_module.UsageHistory(path)
+    conn = history._connect()
+    columns = history_module.SNAPSHOT_COLUMNS
+    insert = (f"INSERT INTO usage_snapshots (provider, ts, {', '.join(columns)}, data_json) "
+              f"VALUES (?, ?, {', '.join('?' * len(columns))}, ?)")
+    series_index = [columns.index(f) for f in history_module.SERIES_FIELDS]
+
+    rows, samples, total = [], [], 0
+    for ts in range(now - days * 86400, now + 1, interval):
+        for index, provider in enumerate(SUITE_PROVIDERS):
+            payload = synthetic_history_payload(index, provider, ts, rng)
+            values = history_module.snapshot_columns(payload)
+            rows.append((provider, ts, *values, json.dumps(payload)))
+            samples.append((provider, ts, *(values[i] for i in series_index)))
+        if len(rows) >= 10_000:
+            conn.executemany(insert, rows)
+            history._update_rollups(conn, samples)
+            conn.commit()
+            total += len(rows)
+            rows, samples = [], []
+    if rows:
+        conn.executemany(insert, rows)
+        history._update_rollups(conn, samples)
+        total += len(rows)
+
+    # Mark retention as just run so timed saves don't trigger a prune
+    history.set_meta(conn, 'retention_last_run', now)
+    history.set_meta(conn, 'retention_max_id', history.retention._max_id())
+    conn.commit()
+    history.close()
+    return total
+
+
+def _timing(samples):
+    return {
+        'runs': len(samples),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+        'min_ms': round(min(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def _time_calls(fn, runs, setup=None):
+    """Wall time in ms of `runs` calls of fn(); setup() runs untimed before each call."""
+    samples = []
+    for _ in range(runs):
+        arg = setup() if setup else None
+        wall0 = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append((time.perf_counter() - wall0) * 1000)
+    return samples
+
+
+def bench_suite(args):
+    """History, chart and menu timings on a synthetic 90-day, 7-provider database."""
+    results = {}
+    with tempfile.TemporaryDirectory() as home:
+        history_module = _load_module("usagebar_history", "usagebar-history.py")
+        charts = _load_module("usagebar_charts", "usagebar-charts.py")
+        db_path = os.path.join(home, ".config", "usagebar", "history.db")
+        os.makedirs(os.path.dirname(db_path))
+
+        wall0 = time.perf_counter()
+        rows = build_synthetic_history(history_module, db_path, args.days, args.interval, args.seed)
+        build_seconds = time.perf_counter() - wall0
+        pristine = os.path.join(home, "pristine.db")
+        shutil.copy(db_path, pristine)
+
+        history = history_module.UsageHistory(db_path)
+        day = history.get_history('claude', hours=24)
+        full = [v for _, v in history.get_series('claude', hours=args.days * 24, tier='raw')]
+        rounds = iter(range(1, 1_000_000))
+        now = int(time.time())
+
+        def save():
+            round_no = next(rounds)
+            history.save_snapshot(synthetic_payloads(round_no), now=now + round_no * 60)
+        calls = {
+            'UsageHistory.get_history(24h)': lambda: history.get_history('claude', hours=24),
+            'UsageHistory.get_history(7d)': lambda: history.get_history('claude', hours=24 * 7),
+            'UsageHistory.get_latest_snapshots': history.get_latest_snapshots,
+            'UsageHistory.get_stats': history.get_stats,
+            'UsageHistory.save_snapshot': save,
+            'UsageChart.render_sparkline_text(24h)': lambda: charts.UsageChart.render_sparkline_text(day, width=20),
+            'UsageChart.render_sparkline_text(all raw)':
+                lambda: charts.UsageChart.render_sparkline_text(full, width=20),
+            'UsageChart.calculate_trend(24h)': lambda: charts.UsageChart.calculate_trend(day),
+        }
+        for name, call in calls.items():
+            results[name] = _timing(_time_calls(call, args.runs))
+        history.close()
+
+        # Pruning is destructive: each run starts from a fresh copy of the database
+        def fresh_copy():
+            copy_path = os.path.join(home, "prune.db")
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(copy_path + suffix):
+                    os.remove(copy_path + suffix)
+            shutil.copy(pristine, copy_path)
+            return history_module.UsageHistory(copy_path)
+
+        def prune(copy):
+            with contextlib.redirect_stdout(io.StringIO()):
+                copy.prune_old_data()
+            copy.close()
+        results['UsageHistory.prune_old_data'] = _timing(
+            _time_calls(prune, max(1, min(args.runs, 5)), setup=fresh_copy))
+
+        # Menu building against the headless GTK stand-in, with this database as ~/.config history
+        shutil.copy(pristine, db_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        tray_module, gtk = load_headless_tray(home)
+        with contextlib.redirect_stdout(io.StringIO()):
+            app = tray_module.UsageBarTray()
+            app.attach_history(app.open_history())
+            app.provider_data = synthetic_payloads()
+            results['UsageBarTray.build_full_menu(cold)'] = _timing(
+                _time_calls(lambda: app.build_full_menu(rebuild=True), 1))
+            menu_rounds = iter(range(1, 1_000_000))
+
+            def refresh():
+                app.provider_data = synthetic_payloads(next(menu_rounds))
+                app.build_full_menu()
+            results['UsageBarTray.build_full_menu'] = _timing(_time_calls(refresh, args.runs))
+            app.shutdown()
+
+    report = {
+        'benchmark': 'suite',
+        'params': {'days': args.days, 'interval': args.interval, 'seed': args.seed, 'runs': args.runs,
+                   'providers': len(SUITE_PROVIDERS), 'raw_rows': rows},
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform()},
+        'build_seconds': round(build_seconds, 2),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    if args.json:
+        print(text)
+    else:
+        print(f"Benchmark suite: {args.days} days x {len(SUITE_PROVIDERS)} providers every {args.interval}s "
+              f"({rows:,} rows, built in {build_seconds:.1f}s), {args.runs} runs, ms")
+        print("=" * 78)
+        print(f"{'':<46}{'median':>10}{'mean':>10}{'max':>10}")
+        for name, timing in results.items():
+            print(f"{name:<46}{timing['median_ms']:>10.3f}{timing['mean_ms']:>10.3f}{timing['max_ms']:>10.3f}")
+        if args.output:
+            print(f"\nResults written to {args.output}")
+
+
+def bench_compare(args):
+    """Median change per benchmark between two `suite -o` result files."""
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows = {}
+    for name in sorted(set(old['results']) | set(new['results'])):
+        before = old['results'].get(name, {}).get('median_ms')
+        after = new['results'].get(name, {}).get('median_ms')
+        change = None
+        if before and after is not None:
+            change = round((after - before) / before * 100, 1)
+        rows[name] = {'old_ms': before, 'new_ms': after, 'change_pct': change}
+
+    if args.json:
+        print(json.dumps({'benchmark': 'compare', 'results': rows}, indent=2, sort_keys=True))
+        return
+    if old.get('params') != new.get('params'):
+        print(f"Warning: parameters differ ({old.get('params')} vs {new.get('params')})")
+    print(f"{'':<46}{'old':>10}{'new':>10}{'change':>10}")
+    for name, row in rows.items():
+        fmt = lambda v: f"{v:>10.3f}" if v is not None else f"{'-':>10}"
+        change = f"{row['change_pct']:>+9.1f}%" if row['change_pct'] is not None else f"{'-':>10}"
+        print(f"{name:<46}{fmt(row['old_ms'])}{fmt(row['new_ms'])}{change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UsageBar benchmarks")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("collector", help=bench_collector.__doc__)
+    p.add_argument("--runs", type=int, default=20)
+    p.add_argument("--cli", help="CLI to benchmark (default: bundled stand-in)")
+    p.set_defaults(func=bench_collector)
+
+    p = sub.add_parser("menu", help=bench_menu.__doc__)
+    p.add_argument("--runs", type=int, default=50)
+    p.set_defaults(func=bench_menu)
+
+    p = sub.add_parser("history", help=bench_history.__doc__)
+    p.add_argument("--runs", type=int, default=200)
+    p.set_defaults(func=bench_history)
+
+    p = sub.add_parser("charts", help=bench_charts.__doc__)
+    p.add_argument("--runs", type=int, default=10)
+    p.add_argument("--sizes", type=lambda text: [int(n) for n in text.split(',')],
+                   default=[10_000, 50_000, 100_000], help="Comma-separated series lengths")
+    p.set_defaults(func=bench_charts)
+
+    p = sub.add_parser("suite", help=bench_suite.__doc__)
+    p.add_argument("--days", type=int, default=90, help="Days of synthetic history")
+    p.add_argument("--interval", type=int, default=900, help="Seconds between synthetic samples")
+    p.add_argument("--seed", type=int, default=0, help="Seed for the synthetic noise")
+    p.add_argument("--runs", type=int, default=20)
+    p.add_argument("-o", "--output", help="Also write the JSON results to this file")
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("compare", help=bench_compare.__doc__)
+    p.add_argument("old")
+    p.add_argument("new")
+    p.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,91 @@ UsageBar Chart Rendering Module
 
 Provides Cairo-based visualization for usage trends,
 including sparklines and mini charts for the tray UI.
+
+Long series are reduced with usagebar-downsample.py before rendering, so
+spikes and resets survive even in 90 days of raw history. Cairo (pycairo)
+is optional: without it the tray falls back to Unicode text sparklines.
+Rendered images are kept in a ChartCache, so a chart is only redrawn
+when its data or the theme changes.
 """
 
+import importlib.util
 import math
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import cairo
+    CAIRO_AVAILABLE = True
+except ImportError:
+    cairo = None
+    CAIRO_AVAILABLE = False
+
+
+def _load_sibling(name, filename):
+    """Load a sibling script (hyphenated filename) as a module via importlib, once per process."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(os.path.abspath(__file__)), filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_downsample = _load_sibling("usagebar_downsample", "usagebar-downsample.py")
+
+# Unicode block elements for sparklines, 8 levels: ▁ ▂ ▃ ▄ ▅ ▆ ▇ █
+BLOCKS = '▁▂▃▄▅▆▇█'
+
+# Image sizes in pixels for the provider submenu
+SPARKLINE_SIZE = (96, 18)
+AREA_CHART_SIZE = (140, 32)
+
+# Terminal glyphs: a braille cell holds 2x4 dots, a half block 1x2
+BRAILLE_DOTS = ((0x01, 0x08), (0x02, 0x10), (0x04, 0x20), (0x40, 0x80))  # [sub-row][sub-column]
+BRAILLE_GLYPHS = ' ' + ''.join(chr(0x2800 + mask) for mask in range(1, 256))
+HALF_BLOCK_GLYPHS = ' ▀▄█'
+TERMINAL_GLYPHS = ('braille', 'block')
+
+# ANSI foreground colours for terminal chart series, in legend order
+ANSI_COLOURS = (36, 33, 35, 32, 34, 31, 96, 93, 95, 92, 94, 91)
+
+# Rendered images kept by ChartCache (7 providers x 2 charts x 2 themes fits)
+CHART_CACHE_SIZE = 32
+
+# RGBA colours per theme: line, area fill, baseline
+CHART_THEMES = {
+    'light': {'line': (0.20, 0.45, 0.85, 1.0), 'fill': (0.20, 0.45, 0.85, 0.25),
+              'baseline': (0.0, 0.0, 0.0, 0.15)},
+    'dark': {'line': (0.45, 0.70, 1.0, 1.0), 'fill': (0.45, 0.70, 1.0, 0.30),
+             'baseline': (1.0, 1.0, 1.0, 0.20)},
+}
+
+
+def _percentages(history_points):
+    """
+    Primary usage values from history points.
+
+    Accepts plain numbers, (timestamp, usedPercent, ...) series tuples as
+    returned by UsageHistory.get_series(), or snapshot dicts as returned
+    by UsageHistory.get_history(). Missing values count as 0.
+    """
+    if history_points and isinstance(history_points[0], (int, float)):
+        return [p or 0 for p in history_points]
+
+    percentages = []
+    for p in history_points:
+        if isinstance(p, dict):
+            pct = p.get('data', {}).get('usage', {}).get('primary', {}).get('usedPercent', 0)
+        elif isinstance(p, (tuple, list)):
+            pct = p[1]
+        else:
+            pct = p
+        percentages.append(pct or 0)
+    return percentages
 
 
 class UsageChart:
@@ -18,7 +100,7 @@ class UsageChart:
         Render a sparkline as Unicode text (fallback for no Cairo).
 
         Args:
-            history_points: List of usage dicts with 'usedPercent'
+            history_points: Usage series (numbers, get_series() tuples or snapshot dicts)
             width: Width of sparkline in characters
 
         Returns:
@@ -28,13 +110,7 @@ class UsageChart:
             return "▄▄▄▄▄"[:width]
 
         # Extract percentages
-        percentages = []
-        for p in history_points:
-            data = p.get('data', {})
-            usage = data.get('usage', {})
-            primary = usage.get('primary', {})
-            pct = primary.get('usedPercent', 0)
-            percentages.append(pct)
+        percentages = _percentages(history_points)
 
         if not percentages:
             return "▄▄▄▄▄"[:width]
@@ -44,28 +120,15 @@ class UsageChart:
         max_val = max(percentages)
         range_val = max_val - min_val or 1
 
-        # Map to Unicode block elements
-        # 8 levels: ▁ ▂ ▃ ▄ ▅ ▆ ▇ █
-        blocks = ['▁', '▂', '▃', '▄', '▅', '▆', '▇', '█']
-
-        # Resample to width
+        # Resample to width, keeping peaks and resets
         if len(percentages) > width:
-            # Downsample
-            step = len(percentages) / width
-            resampled = []
-            for i in range(width):
-                idx = int(i * step)
-                resampled.append(percentages[idx])
-            percentages = resampled
-
-        # Convert to blocks
-        sparkline = ""
-        for pct in percentages:
-            normalized = (pct - min_val) / range_val
-            block_idx = min(int(normalized * 8), 7)
-            sparkline += blocks[block_idx]
-
-        return sparkline
+            percentages = usagebar_downsample.lttb(percentages, width)
+
+        # Map each value to one of the 8 block levels
+        return "".join(
+            BLOCKS[min(int((pct - min_val) / range_val * 8), 7)]
+            for pct in percentages
+        )
 
     @staticmethod
     def calculate_trend(history_points):
@@ -73,7 +136,7 @@ class UsageChart:
         Calculate usage trend direction and rate.
 
         Args:
-            history_points: List of usage dicts
+            history_points: Usage series (numbers, get_series() tuples or snapshot dicts)
 
         Returns:
             Dict with 'direction' (up/down/stable) and 'rate' (percent/hour)
@@ -82,8 +145,7 @@ class UsageChart:
             return {'direction': 'stable', 'rate': 0}
 
         # Get first and last
-        first = history_points[0].get('data', {}).get('usage', {}).get('primary', {}).get('usedPercent', 0)
-        last = history_points[-1].get('data', {}).get('usage', {}).get('primary', {}).get('usedPercent', 0)
+        first, last = _percentages((history_points[0], history_points[-1]))
 
         # Calculate rate
         diff = last - first
@@ -97,10 +159,290 @@ class UsageChart:
         }
 
 
+def _chart_points(values, width, height, padding):
+    """Downsample values to the pixel width and map them to (x, y) pixels on a 0-100% scale."""
+    values = [v or 0 for v in values]
+    if len(values) > width:
+        values = usagebar_downsample.lttb(values, width)
+    step = (width - 1) / max(len(values) - 1, 1)
+    usable = height - 2 * padding
+    return [(i * step, padding + usable * (1 - min(max(v, 0), 100) / 100))
+            for i, v in enumerate(values)]
+
+
+def _new_surface(width, height):
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    return surface, cairo.Context(surface)
+
+
+def render_sparkline_surface(values, width=SPARKLINE_SIZE[0], height=SPARKLINE_SIZE[1], theme='light'):
+    """
+    Draw a usage sparkline (0-100%) as a line on a transparent Cairo surface.
+
+    Args:
+        values: usedPercent values, oldest first
+        width, height: Image size in pixels
+        theme: 'light' or 'dark' (see CHART_THEMES)
+
+    Returns:
+        cairo.ImageSurface, or None when Cairo is unavailable
+    """
+    if not CAIRO_AVAILABLE:
+        return None
+    colours = CHART_THEMES[theme]
+    surface, ctx = _new_surface(width, height)
+
+    ctx.set_source_rgba(*colours['baseline'])
+    ctx.set_line_width(1)
+    ctx.move_to(0, height - 0.5)
+    ctx.line_to(width, height - 0.5)
+    ctx.stroke()
+
+    points = _chart_points(values, width, height, padding=2)
+    if points:
+        ctx.set_source_rgba(*colours['line'])
+        ctx.set_line_width(1.5)
+        ctx.set_line_join(cairo.LINE_JOIN_ROUND)
+        ctx.move_to(*points[0])
+        for x, y in points[1:]:
+            ctx.line_to(x, y)
+        ctx.stroke()
+        # Mark the latest value
+        ctx.arc(points[-1][0], points[-1][1], 2, 0, 2 * math.pi)
+        ctx.fill()
+    return surface
+
+
+def render_area_surface(values, width=AREA_CHART_SIZE[0], height=AREA_CHART_SIZE[1], theme='light'):
+    """
+    Draw a usage mini area chart (0-100%): a filled band under the line.
+
+    Same arguments and return value as render_sparkline_surface().
+    """
+    if not CAIRO_AVAILABLE:
+        return None
+    colours = CHART_THEMES[theme]
+    surface, ctx = _new_surface(width, height)
+
+    points = _chart_points(values, width, height, padding=1)
+    if points:
+        ctx.move_to(points[0][0], height)
+        for x, y in points:
+            ctx.line_to(x, y)
+        ctx.line_to(points[-1][0], height)
+        ctx.close_path()
+        ctx.set_source_rgba(*colours['fill'])
+        ctx.fill()
+
+        ctx.set_source_rgba(*colours['line'])
+        ctx.set_line_width(1)
+        ctx.move_to(*points[0])
+        for x, y in points[1:]:
+            ctx.line_to(x, y)
+        ctx.stroke()
+
+    ctx.set_source_rgba(*colours['baseline'])
+    ctx.move_to(0, height - 0.5)
+    ctx.line_to(width, height - 0.5)
+    ctx.stroke()
+    return surface
+
+
+def series_hash(values):
+    """Cheap fingerprint of a series, for cache keys."""
+    return hash(tuple(values))
+
+
+class ChartCache:
+    """
+    LRU cache of rendered chart images.
+
+    Entries are keyed by (provider, kind, series hash, theme), so an image
+    is only redrawn when its data or the theme changes; unchanged charts
+    return the very same object, which lets the menu skip re-setting it.
+    """
+
+    def __init__(self, capacity=CHART_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, provider_id, kind, values, theme, render):
+        """
+        Cached image for this chart, calling render(values, theme) on a miss.
+
+        Args:
+            provider_id: Provider the chart belongs to
+            kind: Chart kind, e.g. 'sparkline' or 'area'
+            values: The series drawn (hashed for the key)
+            theme: 'light' or 'dark'
+            render: Callable producing the image
+        """
+        key = (provider_id, kind, series_hash(values), theme)
+        image = self._entries.get(key)
+        if image is not None:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return image
+
+        self.stats['misses'] += 1
+        image = render(values, theme)
+        if image is not None:
+            # Older images of the same chart are stale now
+            for old in [k for k in self._entries if k[:2] == key[:2] and k[3] == theme]:
+                del self._entries[old]
+            self._entries[key] = image
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return image
+
+    def clear(self):
+        """Drop every cached image."""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _DotGrid:
+    """Preallocated cell buffers for a terminal chart, addressed in dots (y=0 is the bottom)."""
+
+    def __init__(self, width, height, glyphs):
+        self.braille = glyphs == 'braille'
+        self.sub_x, self.sub_y = (2, 4) if self.braille else (1, 2)
+        self.dots_w, self.dots_h = width * self.sub_x, height * self.sub_y
+        self.masks = [[0] * width for _ in range(height)]
+        self.owners = [[0] * width for _ in range(height)]
+
+    def span(self, x, y0, y1, owner):
+        """Set the dots from y0 to y1 (inclusive) in dot column x."""
+        column, sub_col = divmod(x, self.sub_x)
+        for y in range(min(y0, y1), max(y0, y1) + 1):
+            row, sub_row = divmod(self.dots_h - 1 - y, self.sub_y)
+            if self.braille:
+                self.masks[row][column] |= BRAILLE_DOTS[sub_row][sub_col]
+            else:
+                self.masks[row][column] |= 1 << sub_row
+            self.owners[row][column] = owner
+
+    def line(self, x0, y0, x1, y1, owner):
+        """Connect two dots with vertical spans in every column between them."""
+        steps = x1 - x0
+        previous = y0
+        for i in range(1, steps + 1):
+            y = round(y0 + (y1 - y0) * i / steps)
+            self.span(x0 + i, previous, y, owner)
+            previous = y
+
+
+def _axis_time(ts, span):
+    """Local time label for the x-axis: date for multi-day windows, else (week)day and clock time."""
+    if span > 2 * 86400:
+        layout = '%b %d'
+    elif span > 12 * 3600:
+        layout = '%a %H:%M'
+    else:
+        layout = '%H:%M'
+    return datetime.fromtimestamp(ts).strftime(layout)
+
+
+def render_terminal_chart(series, start, end, width=72, height=12, glyphs='braille',
+                          colour=False, low=0.0, high=100.0, unit='%'):
+    """
+    Render several time series into one terminal chart.
+
+    Each series is plotted as a line on a shared time axis; within a dot
+    column the line spans the column's min and max, so spikes survive any
+    zoom level. Rows are filled into preallocated buffers (one pass over
+    the points) and joined once per row.
+
+    Args:
+        series: Dict mapping name -> list of (ts, value), oldest first
+        start, end: Epoch seconds covered by the x-axis
+        width, height: Plot size in terminal cells
+        glyphs: 'braille' (2x4 dots per cell) or 'block' (half blocks, 1x2)
+        colour: Colour each series with ANSI escapes
+        low, high: Value range of the y-axis
+        unit: Suffix for y-axis labels
+
+    Returns:
+        List of lines: plot rows with y labels, x-axis, time labels, legend
+    """
+    grid = _DotGrid(width, height, glyphs)
+    span = max(end - start, 1)
+    scale = (grid.dots_h - 1) / ((high - low) or 1)
+    legend = []
+
+    for owner, (name, points) in enumerate(series.items(), 1):
+        # Per dot column: first, last, lowest and highest dot row
+        columns = {}
+        values = []
+        for ts, value in points:
+            if value is None or ts < start or ts > end:
+                continue
+            values.append(value)
+            x = min(int((ts - start) / span * grid.dots_w), grid.dots_w - 1)
+            y = min(max(int(round((value - low) * scale)), 0), grid.dots_h - 1)
+            column = columns.get(x)
+            if column is None:
+                columns[x] = [y, y, y, y]
+            else:
+                column[1] = y
+                column[2] = min(column[2], y)
+                column[3] = max(column[3], y)
+
+        previous = None
+        for x, (first, last, lowest, highest) in columns.items():
+            if previous is not None:
+                grid.line(previous[0], previous[1], x, first, owner)
+            grid.span(x, lowest, highest, owner)
+            previous = (x, last)
+
+        summary = f"now {values[-1]:.0f}{unit}  max {max(values):.0f}{unit}" if values else "no data"
+        legend.append((owner, name, summary))
+
+    def paint(text, owner):
+        if not colour or not owner:
+            return text
+        return f"\x1b[{ANSI_COLOURS[(owner - 1) % len(ANSI_COLOURS)]}m{text}\x1b[0m"
+
+    table = BRAILLE_GLYPHS if grid.braille else HALF_BLOCK_GLYPHS
+    label_width = max(len(f"{high:.0f}{unit}"), len(f"{low:.0f}{unit}"))
+    labels = {0: high, height // 2: (high + low) / 2, height - 1: low}
+    lines = []
+    for row, (masks, owners) in enumerate(zip(grid.masks, grid.owners)):
+        label = f"{labels[row]:.0f}{unit}" if row in labels else ""
+        if colour:
+            # One escape sequence per run of cells drawn by the same series
+            parts, run, run_owner = [], [], 0
+            for mask, owner in zip(masks, owners):
+                owner = owner if mask else 0
+                if owner != run_owner and run:
+                    parts.append(paint("".join(run), run_owner))
+                    run = []
+                run_owner = owner
+                run.append(table[mask])
+            parts.append(paint("".join(run), run_owner))
+            cells = "".join(parts)
+        else:
+            cells = "".join([table[mask] for mask in masks])
+        lines.append(f"{label:>{label_width}} ┤{cells}")
+
+    lines.append(" " * label_width + " └" + "─" * width)
+    left, right = _axis_time(start, span), _axis_time(end, span)
+    lines.append(" " * (label_width + 2) + left + right.rjust(width - len(left)))
+    for owner, name, summary in legend:
+        lines.append(f"  {paint('━━', owner)} {name:<12} {summary}")
+    return lines
+
+
 def render_ascii_chart(values, width=40, height=8):
     """
     Render an ASCII chart of values.
 
+    Series longer than `width` are reduced to one column per min/max
+    bucket, drawn up to the bucket's maximum so spikes stay visible.
+
     Args:
         values: List of numeric values
         width: Chart width in characters
@@ -112,24 +454,22 @@ def render_ascii_chart(values, width=40, height=8):
     if not values:
         return " " * width
 
+    # One column per value, or per bucket's peak for long series
+    if len(values) > width:
+        columns = [high for _, high in usagebar_downsample.minmax_buckets(values, width)]
+    else:
+        columns = list(values)
+
     # Normalize values
-    min_val = min(values)
-    max_val = max(values)
+    min_val = min(columns)
+    max_val = max(columns)
     range_val = max_val - min_val or 1
 
     # Create chart rows (top to bottom)
     chart = []
     for row in range(height):
-        line = ""
         threshold = max_val - (row / height) * range_val
-
-        for val in values:
-            if val >= threshold:
-                line += "█"
-            else:
-                line += " "
-
-        chart.append(line)
+        chart.append("".join("█" if val >= threshold else " " for val in columns))
 
     # Add x-axis
     chart.append("─" * width)
@@ -0,0 +1,718 @@
+#!/usr/bin/env python3
+"""
+UsageBar Collector Worker
+
+Long-lived helper process that owns usage collection for the tray.
+The tray starts one worker, sends refresh requests over its stdin and
+reads NDJSON responses from its stdout, instead of spawning a fresh
+collection pipeline from the GTK process on every refresh.
+
+Each refresh fans out one CLI call per provider on a bounded thread pool,
+with a timeout per provider, and streams every result back as soon as it
+completes. CLI stdout is decoded incrementally by JSONStreamParser, so
+provider objects are picked off the pipe as they arrive. Spawn and parse
+times are measured in the worker and reported in "done", so they end up
+in the tray's metrics registry.
+
+Protocol (one JSON object per line):
+
+    request:  {"id": 1, "op": "refresh", "providers": ["codex", "claude"],
+               "timeout": 60, "timeouts": {"claude": 90}}
+    response: {"id": 1, "type": "provider", "provider": "claude", "data": {...}}
+              {"id": 1, "type": "error", "provider": "codex", "error": "..."}
+              {"id": 1, "type": "done", "elapsed": 1.23,
+               "timings": {"claude": {"cli_spawn": 0.004, "json_parse": 0.0002}}}
+
+Other ops: "ping" (answered with "pong"), "cancel" (with "target": <id>)
+and "shutdown".
+"""
+
+import codecs
+import collections
+import importlib.util
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _load_sibling(name, filename):
+    """Load a sibling script (hyphenated filename) as a module via importlib, once per process."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(os.path.abspath(__file__)), filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_metrics = _load_sibling("usagebar_metrics", "usagebar-metrics.py")
+
+log = logging.getLogger('usagebar.collector')
+
+# CLI used to collect usage (override with USAGEBAR_CLI for testing)
+CLI_NAME = os.environ.get("USAGEBAR_CLI", "usagebar")
+
+# Default timeout for a single provider fetch, in seconds
+DEFAULT_TIMEOUT = 60
+
+# Concurrent CLI processes per refresh
+MAX_WORKERS = 4
+
+# Read size for CLI stdout, and the largest single JSON object we will buffer
+CHUNK_SIZE = 64 * 1024
+MAX_ELEMENT_SIZE = 8 * 1024 * 1024
+
+# How long the client waits for the worker to answer a ping after start
+STARTUP_TIMEOUT = 10
+
+# Restarts allowed inside RESTART_WINDOW seconds before giving up
+MAX_RESTARTS = 5
+RESTART_WINDOW = 300
+
+
+def resolve_cli():
+    """Resolve the usagebar CLI to an absolute path (falls back to the bare name)."""
+    return shutil.which(CLI_NAME) or CLI_NAME
+
+
+def kill_process_group(proc):
+    """
+    Kill a CLI started with start_new_session=True, with everything it spawned.
+
+    Killing only the direct child is not enough: a wrapper script that does
+    not exec leaves its child holding stdout, and the read never ends.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # Already reaped (its group is gone); make sure of the child itself
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
+# Scanner states for JSONStreamParser
+_LINE, _NOISE, _ARRAY, _ELEMENT = range(4)
+
+_SCAN_STRUCT = re.compile(r'[{}\[\]"]')
+_SCAN_STRING = re.compile(r'["\\]')
+
+
+class JSONStreamParser:
+    """
+    Incremental decoder for CLI stdout.
+
+    Accepts NDJSON objects and JSON arrays of objects (single-line or
+    pretty-printed), interleaved with log noise, and returns each object as
+    soon as its closing brace has been fed. Noise lines are skipped once,
+    up to the next newline, without attempting to decode them. Only the
+    object currently being decoded is buffered, up to max_element_size.
+
+    After close(), `truncated` tells whether the input ended mid-object or
+    mid-array, and `dropped` counts objects that were malformed or too large.
+    `parse_seconds` is the time spent decoding objects so far.
+    """
+
+    def __init__(self, max_element_size=MAX_ELEMENT_SIZE):
+        self.max_element_size = max_element_size
+        self.truncated = False
+        self.dropped = 0
+        self.parse_seconds = 0.0
+        self._buf = ''
+        self._pos = 0
+        self._start = 0
+        self._mode = _LINE
+        self._in_array = False
+        self._in_string = False
+        self._depth = 0
+
+    @property
+    def buffered(self):
+        """Characters currently held in memory."""
+        return len(self._buf)
+
+    def feed(self, text):
+        """Feed a chunk of text; return the objects it completed."""
+        out = []
+        buf = self._buf + text if self._buf else text
+        n = len(buf)
+        pos = self._pos
+
+        while pos < n:
+            mode = self._mode
+            if mode == _ELEMENT:
+                if self._in_string:
+                    m = _SCAN_STRING.search(buf, pos)
+                    if not m:
+                        pos = n
+                    elif m.group() == '\\':
+                        if m.start() + 1 >= n:
+                            # Escape split across chunks: wait for the next one
+                            pos = m.start()
+                            break
+                        pos = m.start() + 2
+                    else:
+                        self._in_string = False
+                        pos = m.end()
+                else:
+                    m = _SCAN_STRUCT.search(buf, pos)
+                    if not m:
+                        pos = n
+                    else:
+                        pos = m.end()
+                        c = m.group()
+                        if c == '"':
+                            self._in_string = True
+                        elif c in '{[':
+                            self._depth += 1
+                        else:
+                            self._depth -= 1
+                            if self._depth == 0:
+                                self._finish_element(buf[self._start:pos], out)
+                if self._mode == _ELEMENT and pos - self._start > self.max_element_size:
+                    self.dropped += 1
+                    self._mode = _NOISE
+            elif mode == _NOISE:
+                nl = buf.find('\n', pos)
+                if nl < 0:
+                    pos = n
+                else:
+                    pos = nl + 1
+                    self._mode = _LINE
+            else:
+                c = buf[pos]
+                if c in ' \t\r\n' or (mode == _ARRAY and c == ','):
+                    pos += 1
+                elif c == '{':
+                    self._in_array = mode == _ARRAY
+                    self._mode = _ELEMENT
+                    self._start = pos
+                    self._depth = 0
+                    self._in_string = False
+                elif mode == _LINE and c == '[':
+                    self._mode = _ARRAY
+                    pos += 1
+                elif mode == _ARRAY and c == ']':
+                    self._mode = _LINE
+                    pos += 1
+                else:
+                    # Log noise, including "[info] ..." lines that merely look like arrays
+                    self._mode = _NOISE
+
+        # Keep only the unfinished element (if any)
+        keep = self._start if self._mode == _ELEMENT else pos
+        self._buf = buf[keep:]
+        self._pos = pos - keep
+        self._start = 0
+        return out
+
+    def close(self):
+        """Signal end of input."""
+        self.truncated = self._mode in (_ELEMENT, _ARRAY)
+        self._buf = ''
+        self._pos = 0
+        self._mode = _LINE
+
+    def iter_stream(self, stream, chunk_size=CHUNK_SIZE):
+        """Yield objects from a binary or text stream as they are decoded."""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        read = getattr(stream, 'read1', stream.read)
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk)
+            yield from self.feed(chunk)
+        yield from self.feed(decoder.decode(b'', final=True))
+        self.close()
+
+    def _finish_element(self, text, out):
+        started = time.perf_counter()
+        try:
+            value = json.loads(text)
+        except ValueError:
+            # e.g. "[{oops}] ..." log line; skip the rest of it
+            self.dropped += 1
+            self._mode = _NOISE
+            return
+        finally:
+            self.parse_seconds += time.perf_counter() - started
+        if isinstance(value, dict):
+            out.append(value)
+        self._mode = _ARRAY if self._in_array else _LINE
+
+
+def parse_cli_output(text):
+    """
+    Extract the provider list from CLI stdout.
+
+    Returns:
+        List of provider dicts, or None if none were found
+    """
+    parser = JSONStreamParser()
+    data = [v for v in parser.feed(text) if 'provider' in v]
+    parser.close()
+    return data or None
+
+
+def observe_timings(provider, timings):
+    """Record one provider's spawn and parse durations, as measured by FanoutFetch."""
+    if 'cli_spawn' in timings:
+        usagebar_metrics.observe('cli_spawn', timings['cli_spawn'], provider=provider)
+    if 'json_parse' in timings:
+        usagebar_metrics.observe('json_parse', timings['json_parse'], source='cli', provider=provider)
+
+
+def fetch_usage(providers=("all",), timeout=DEFAULT_TIMEOUT, cli=None):
+    """
+    Run the CLI sequentially and return the parsed provider list.
+
+    This is the plain spawn-per-refresh path, kept for benchmarks and
+    one-off use; refreshes go through FanoutFetch.
+    """
+    cli = cli or resolve_cli()
+    data = []
+    for provider in providers:
+        cmd = [cli, "usage", "--provider", provider, "--format", "json"]
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        parsed = parse_cli_output(result.stdout)
+        if parsed:
+            data.extend(parsed)
+    return data
+
+
+class FetchCancelled(Exception):
+    """Raised for provider fetches aborted by FanoutFetch.cancel()."""
+
+
+class FanoutFetch:
+    """
+    One refresh, fanned out across providers.
+
+    Every provider runs in its own CLI process on a bounded thread pool,
+    with its own timeout. Results are reported as they complete, so a slow
+    or hung provider never holds back the others.
+    """
+
+    def __init__(self, providers, timeout=DEFAULT_TIMEOUT, timeouts=None,
+                 max_workers=MAX_WORKERS, cli=None):
+        self.providers = list(providers)
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.max_workers = max_workers
+        self.cli = cli or resolve_cli()
+        self._procs = {}
+        self.timings = {}  # provider -> {'cli_spawn': s, 'json_parse': s}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Abort the refresh: running CLI processes are killed, queued ones skipped."""
+        self._cancelled.set()
+        with self._lock:
+            procs = list(self._procs.values())
+        for proc in procs:
+            kill_process_group(proc)
+
+    def run(self, on_result, on_error=None, on_timings=observe_timings):
+        """
+        Fetch all providers; blocks until every fetch finished or was cancelled.
+
+        Callbacks run on the calling thread, as soon as data is decoded:
+            on_result(provider_id, payload) for each provider dict
+            on_error(provider_id, message) for timeouts and CLI failures
+            on_timings(provider_id, timings) once a provider's CLI has exited
+        """
+        if not self.providers:
+            return
+        events = queue.Queue()
+
+        def task(provider):
+            try:
+                for payload in self._fetch_one(provider):
+                    events.put((provider, payload, None))
+            except FetchCancelled:
+                pass
+            except Exception as e:
+                events.put((provider, None, str(e)))
+            finally:
+                events.put((provider, None, None))
+
+        workers = min(self.max_workers, len(self.providers))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="usagebar-fetch") as pool:
+            for provider in self.providers:
+                pool.submit(task, provider)
+            remaining = len(self.providers)
+            while remaining:
+                provider, payload, error = events.get()
+                if payload is not None:
+                    on_result(provider, payload)
+                elif error is not None:
+                    if on_error:
+                        on_error(provider, error)
+                else:
+                    remaining -= 1
+                    if on_timings and self.timings.get(provider):
+                        on_timings(provider, self.timings[provider])
+
+    def _fetch_one(self, provider):
+        """Run the CLI for one provider, yielding provider dicts off its stdout."""
+        if self.cancelled:
+            raise FetchCancelled(provider)
+
+        timeout = self.timeouts.get(provider, self.timeout)
+        cmd = [self.cli, "usage", "--provider", provider, "--format", "json"]
+        timings = self.timings[provider] = {}
+        started = time.perf_counter()
+        # Own session, so a timeout or cancel() can kill the CLI's children too
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                start_new_session=True)
+        timings['cli_spawn'] = time.perf_counter() - started
+        with self._lock:
+            self._procs[provider] = proc
+        if self.cancelled:
+            kill_process_group(proc)  # cancel() ran while we were spawning
+
+        # Drain stderr concurrently, keeping only the last line for error reports
+        stderr_tail = collections.deque(maxlen=1)
+        drain = threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True)
+        drain.start()
+
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            kill_process_group(proc)
+
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+
+        parser = JSONStreamParser()
+        count = 0
+        try:
+            for value in parser.iter_stream(proc.stdout):
+                if 'provider' in value:
+                    count += 1
+                    yield value
+            proc.wait()
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                kill_process_group(proc)
+                proc.wait()
+            proc.stdout.close()
+            if parser.parse_seconds:
+                timings['json_parse'] = parser.parse_seconds
+            drain.join(timeout=1)
+            with self._lock:
+                self._procs.pop(provider, None)
+
+        if self.cancelled:
+            raise FetchCancelled(provider)
+        if timed_out.is_set():
+            raise TimeoutError(f"timed out after {timeout}s")
+        if not count:
+            detail = stderr_tail[0].decode(errors='replace').strip() if stderr_tail else "no data"
+            if parser.truncated:
+                detail = "truncated output"
+            raise RuntimeError(f"exit {proc.returncode}: {detail}")
+
+
+# --- Worker side ---
+
+class _Worker:
+    """Request loop of the worker process."""
+
+    def __init__(self, stdin, stdout):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.cli = resolve_cli()
+        self._write_lock = threading.Lock()
+        self._active = {}
+
+    def emit(self, message):
+        line = json.dumps(message, separators=(',', ':')) + '\n'
+        with self._write_lock:
+            self.stdout.write(line)
+            self.stdout.flush()
+
+    def serve(self):
+        for line in self.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                self.emit({'id': None, 'type': 'error', 'error': 'malformed request'})
+                continue
+
+            req_id = request.get('id')
+            op = request.get('op')
+
+            if op == 'ping':
+                self.emit({'id': req_id, 'type': 'pong', 'pid': os.getpid()})
+            elif op == 'refresh':
+                fetch = FanoutFetch(
+                    request.get('providers') or ["all"],
+                    timeout=request.get('timeout', DEFAULT_TIMEOUT),
+                    timeouts=request.get('timeouts'),
+                    max_workers=request.get('max_workers', MAX_WORKERS),
+                    cli=self.cli
+                )
+                self._active[req_id] = fetch
+                threading.Thread(target=self._refresh, args=(req_id, fetch), daemon=True).start()
+            elif op == 'cancel':
+                fetch = self._active.get(request.get('target'))
+                if fetch:
+                    fetch.cancel()
+            elif op == 'shutdown':
+                for fetch in list(self._active.values()):
+                    fetch.cancel()
+                self.emit({'id': req_id, 'type': 'done', 'elapsed': 0})
+                return
+            else:
+                self.emit({'id': req_id, 'type': 'error', 'error': f"unknown op: {op}"})
+
+        for fetch in list(self._active.values()):
+            fetch.cancel()
+
+    def _refresh(self, req_id, fetch):
+        started = time.monotonic()
+        # Sent back in 'done': metrics recorded in this process never reach the tray's registry
+        timings = {}
+
+        def on_result(provider, payload):
+            self.emit({'id': req_id, 'type': 'provider', 'provider': provider, 'data': payload})
+
+        def on_error(provider, message):
+            self.emit({'id': req_id, 'type': 'error', 'provider': provider, 'error': message})
+
+        def on_timings(provider, measured):
+            timings[provider] = {stage: round(seconds, 6) for stage, seconds in measured.items()}
+
+        try:
+            fetch.run(on_result, on_error, on_timings)
+        except Exception as e:
+            self.emit({'id': req_id, 'type': 'error', 'error': str(e)})
+        finally:
+            self._active.pop(req_id, None)
+            self.emit({'id': req_id, 'type': 'done', 'cancelled': fetch.cancelled,
+                       'elapsed': round(time.monotonic() - started, 4), 'timings': timings})
+
+
+def serve(stdin=None, stdout=None):
+    """Worker main loop: answer requests from stdin until EOF or shutdown."""
+    _Worker(stdin or sys.stdin, stdout or sys.stdout).serve()
+
+
+# --- Tray side ---
+
+class CollectorError(Exception):
+    """Raised when the collector worker cannot serve a request."""
+
+
+WORKER_RESTARTS = usagebar_metrics.counter(
+    'usagebar_collector_restarts_total', "Times the collector worker was restarted after exiting")
+
+
+class CollectorClient:
+    """
+    Manages a long-lived collector worker process.
+
+    The worker is started lazily and restarted if it exits or stops
+    answering. Requests are serialized; call refresh() from a background
+    thread, never from the GTK main loop. cancel() may be called from any
+    thread.
+    """
+
+    def __init__(self, command=None):
+        self.command = command or [sys.executable, os.path.abspath(__file__), "--worker"]
+        self._proc = None
+        self._responses = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._next_id = 0
+        self._current_id = None
+        self._restarts = []
+
+    @property
+    def running(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """Start the worker if it is not already running."""
+        if self.running:
+            return
+
+        now = time.monotonic()
+        self._restarts = [t for t in self._restarts if now - t < RESTART_WINDOW]
+        if len(self._restarts) >= MAX_RESTARTS:
+            raise CollectorError(f"worker restarted {MAX_RESTARTS} times in {RESTART_WINDOW}s")
+        if self._proc is not None:
+            self._restarts.append(now)
+            WORKER_RESTARTS.inc()
+            log.warning("Collector worker exited (%s), restarting", self._proc.returncode)
+
+        with usagebar_metrics.span('worker_spawn'):
+            self._proc = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1
+            )
+        self._responses = queue.Queue()
+        reader = threading.Thread(
+            target=self._read_loop, args=(self._proc, self._responses), daemon=True
+        )
+        reader.start()
+
+        for message in self._request('ping', STARTUP_TIMEOUT):
+            if message.get('type') == 'pong':
+                break
+
+    def stop(self):
+        """Ask the worker to exit, killing it if it does not comply."""
+        self.cancel()
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        try:
+            self._send(proc, {'id': 0, 'op': 'shutdown'})
+            proc.wait(timeout=2)
+        except Exception:
+            proc.kill()
+            proc.wait()
+
+    def cancel(self):
+        """Cancel the refresh in flight, if any."""
+        target, proc = self._current_id, self._proc
+        if target is None or proc is None:
+            return
+        try:
+            self._send(proc, {'id': 0, 'op': 'cancel', 'target': target})
+        except OSError:
+            pass
+
+    def refresh(self, providers=("all",), timeout=DEFAULT_TIMEOUT, timeouts=None,
+                on_provider=None, on_error=None):
+        """
+        Request a refresh and return the provider list.
+
+        on_provider(payload) and on_error(provider_id, message) are called on
+        this thread as each provider completes. Retries once on a fresh worker
+        if the current one has died, skipping providers already delivered.
+        The spawn and parse times the worker reports are recorded in this
+        process's metrics.
+        """
+        timeouts = timeouts or {}
+        # The worker reports every provider within its timeout; allow for queueing
+        idle_timeout = max([timeout, *timeouts.values()])
+        pending = list(providers)
+        data = []
+
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    self.start()
+                    for message in self._request('refresh', idle_timeout, providers=pending,
+                                                 timeout=timeout, timeouts=timeouts):
+                        kind = message.get('type')
+                        if kind == 'provider':
+                            data.append(message['data'])
+                            if message.get('provider') in pending:
+                                pending.remove(message['provider'])
+                            if on_provider:
+                                on_provider(message['data'])
+                        elif kind == 'error' and message.get('provider'):
+                            if on_error:
+                                on_error(message['provider'], message.get('error'))
+                        elif kind == 'error':
+                            raise CollectorError(message.get('error'))
+                        elif kind == 'done':
+                            for provider, timings in (message.get('timings') or {}).items():
+                                observe_timings(provider, timings)
+                    return data
+                except (BrokenPipeError, EOFError):
+                    self._proc.kill()
+                    self._proc.wait()
+                    if attempt or not pending:
+                        raise CollectorError("collector worker crashed")
+        return data
+
+    def _send(self, proc, message):
+        with self._write_lock:
+            proc.stdin.write(json.dumps(message) + '\n')
+            proc.stdin.flush()
+
+    def _request(self, op, wait, **params):
+        """Send one request and yield responses until its 'done'/'pong'."""
+        self._next_id += 1
+        req_id = self._next_id
+        self._current_id = req_id if op == 'refresh' else None
+        self._send(self._proc, {'id': req_id, 'op': op, **params})
+
+        try:
+            # Leave the worker time to hit its own timeouts before we give up on it
+            while True:
+                try:
+                    message = self._responses.get(timeout=wait + 5)
+                except queue.Empty:
+                    self._proc.kill()
+                    raise CollectorError(f"collector worker went silent for {wait}s")
+                if message is None:
+                    raise EOFError
+                if message.get('id') != req_id:
+                    continue
+                yield message
+                if message.get('type') in ('done', 'pong'):
+                    return
+        finally:
+            self._current_id = None
+
+    @staticmethod
+    def _read_loop(proc, responses):
+        for line in proc.stdout:
+            try:
+                with usagebar_metrics.span('json_parse', source='worker'):
+                    message = json.loads(line)
+                responses.put(message)
+            except json.JSONDecodeError:
+                continue
+        responses.put(None)
+
+
+def main():
+    """Run as a worker (--worker) or do a single refresh and print it."""
+    if "--worker" in sys.argv[1:]:
+        serve()
+        return
+
+    providers = sys.argv[1:] or ["all"]
+    client = CollectorClient()
+    try:
+        print(json.dumps(client.refresh(providers), indent=2))
+    finally:
+        client.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+UsageBar Downsampling
+
+Shape-preserving reduction of long usage series for rendering. Picking
+every Nth sample drops the spikes and resets that matter most;
+largest-triangle-three-buckets (lttb) keeps them for line-like output
+and min/max buckets keep each column's extremes. Both are a single O(n)
+pass, so 90 days of raw history reduce in milliseconds.
+"""
+
+
+def lttb(values, threshold):
+    """
+    Downsample to `threshold` points with largest-triangle-three-buckets.
+
+    Keeps the first and last point and, from each bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket, which preserves peaks and dips. The
+    series' minimum and maximum always replace their buckets' picks: the
+    largest triangle alone can skip a sawtooth's peak next to its reset.
+
+    Args:
+        values: Sequence of numbers (x is the index) or (x, y) pairs
+        threshold: Number of points to return
+
+    Returns:
+        List of the kept items, in order (unchanged if already short enough)
+    """
+    n = len(values)
+    if threshold >= n:
+        return list(values)
+    if threshold < 3:
+        return [values[0], values[-1]][:max(threshold, 0)]
+
+    if isinstance(values[0], (tuple, list)):
+        xs = [v[0] for v in values]
+        ys = [v[1] for v in values]
+    else:
+        xs = range(n)
+        ys = values
+
+    kept = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        # Point in this bucket with the largest triangle area
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # Twice the triangle area is |dx*y - dy*x + c|; the constant c is hoisted
+        ax, ay = xs[a], ys[a]
+        dx, dy = avg_x - ax, avg_y - ay
+        c = ax * dy - ay * dx
+        best, best_area = start, -1.0
+        for j, x, y in zip(range(start, end), xs[start:end], ys[start:end]):
+            area = abs(dx * y - dy * x + c)
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+
+    kept.append(n - 1)
+    _keep_extremes(kept, ys, every)
+    return [values[j] for j in kept]
+
+
+def _keep_extremes(kept, ys, every):
+    """Put the global min and max of ys into the lttb slots of their buckets."""
+    n = len(ys)
+    inner = len(kept) - 2
+    low = min(range(n), key=ys.__getitem__)
+    high = max(range(n), key=ys.__getitem__)
+    extremes = sorted({low, high} - {0, n - 1})
+    if inner == 1 and len(extremes) == 2:
+        extremes = [high]  # One slot to fill: the peak matters most
+
+    slots = []
+    for j in extremes:
+        # Bucket i covers [int(i * every) + 1, int((i + 1) * every) + 1)
+        i = min(int((j - 1) / every), inner - 1)
+        while i and int(i * every) + 1 > j:
+            i -= 1
+        while i < inner - 1 and int((i + 1) * every) + 1 <= j:
+            i += 1
+        slots.append(i + 1)
+    if len(slots) == 2 and slots[0] == slots[1]:
+        # Both in one bucket (a peak right before its reset): borrow a neighbour's slot
+        if slots[1] < inner:
+            slots[1] += 1
+        else:
+            slots[0] -= 1
+    for j, slot in zip(extremes, slots):
+        kept[slot] = j
+
+
+def minmax_buckets(values, buckets):
+    """
+    Split values into `buckets` equal runs and keep each run's (min, max).
+
+    Args:
+        values: Sequence of numbers
+        buckets: Number of buckets (at most len(values))
+
+    Returns:
+        List of (min, max) tuples, one per bucket
+    """
+    n = len(values)
+    buckets = min(buckets, n)
+    if buckets <= 0:
+        return []
+    result = []
+    for i in range(buckets):
+        run = values[i * n // buckets:(i + 1) * n // buckets]
+        result.append((min(run), max(run)))
+    return result
+
+
+def main():
+    """Compare every-Nth sampling with lttb on a series with one spike."""
+    values = [10.0] * 10_000
+    values[4_321] = 95.0
+    step = len(values) / 40
+    naive = [values[int(i * step)] for i in range(40)]
+    print(f"every Nth: max {max(naive):.0f}%")
+    print(f"lttb:      max {max(lttb(values, 40)):.0f}%")
+    print(f"min/max:   max {max(high for _, high in minmax_buckets(values, 40)):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+UsageBar Burn-Rate Forecasting
+
+Fits a least-squares line to recent usage samples of each limit window
+(primary, secondary, tertiary) and projects when it will run out. Fits
+never span a reset: only samples since the last `resetsAt` change or
+usage drop are used. Each fit is a single pass of running sums, so
+forecasting every provider on every refresh costs microseconds.
+"""
+
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+USAGE_WINDOWS = ('primary', 'secondary', 'tertiary')
+
+# Fields to request from UsageHistory.get_series() for forecast_provider()
+SERIES_FIELDS = (
+    'primary_used', 'primary_resets_at',
+    'secondary_used', 'secondary_resets_at',
+    'tertiary_used', 'tertiary_resets_at',
+)
+
+# Regression window per limit: the session window moves fast, weekly ones slowly
+FIT_WINDOW_SECONDS = {'primary': 3 * 3600, 'secondary': 24 * 3600, 'tertiary': 24 * 3600}
+
+# A fit needs at least this many samples spread over at least this long
+MIN_POINTS = 3
+MIN_SPAN_SECONDS = 600
+
+# Below this rate (percent per hour) usage counts as flat: no exhaustion time
+MIN_RATE = 0.1
+
+# A usedPercent drop bigger than this counts as a reset
+RESET_DROP = 1.0
+
+Forecast = namedtuple('Forecast', 'window used rate_per_hour exhausts_at resets_at points')
+Forecast.__doc__ = """
+Projection for one limit window.
+
+used: latest usedPercent; rate_per_hour: fitted burn rate (None without
+enough samples); exhausts_at: epoch seconds when usage reaches 100%, or
+None if it is flat, falling, or the window resets first; resets_at:
+epoch seconds of the next reset, if known; points: samples in the fit.
+"""
+
+
+def parse_timestamp(value):
+    """ISO 8601 string or epoch number to epoch seconds (None if unknown)."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def fit_rate(times, values):
+    """
+    Least-squares slope of values over times, in units per hour.
+
+    Returns None for fewer than MIN_POINTS samples or a span shorter
+    than MIN_SPAN_SECONDS.
+    """
+    n = len(times)
+    if n < MIN_POINTS or times[-1] - times[0] < MIN_SPAN_SECONDS:
+        return None
+    # Centre on the first sample so epoch-sized numbers don't cost precision
+    t0 = times[0]
+    sum_t = sum_v = sum_tt = sum_tv = 0.0
+    for t, v in zip(times, values):
+        t -= t0
+        sum_t += t
+        sum_v += v
+        sum_tt += t * t
+        sum_tv += t * v
+    denominator = n * sum_tt - sum_t * sum_t
+    if denominator <= 0:
+        return None
+    return (n * sum_tv - sum_t * sum_v) / denominator * 3600
+
+
+def since_reset(samples):
+    """
+    Trailing samples after the most recent reset.
+
+    samples: (ts, used, resets_at) tuples, oldest first. A reset is a
+    change of resets_at or a usage drop larger than RESET_DROP.
+    """
+    for i in range(len(samples) - 1, 0, -1):
+        _, used, reset = samples[i]
+        _, prev_used, prev_reset = samples[i - 1]
+        if reset is not None and prev_reset is not None and reset != prev_reset:
+            return samples[i:]
+        if used < prev_used - RESET_DROP:
+            return samples[i:]
+    return samples
+
+
+def forecast_window(window, samples, now=None, resets_at=None):
+    """
+    Forecast one limit window.
+
+    Args:
+        window: 'primary', 'secondary' or 'tertiary'
+        samples: (ts, used, resets_at) tuples, oldest first; None values skipped
+        now: Current epoch seconds (default: time.time())
+        resets_at: Next reset (epoch or ISO), defaulting to the latest sample's
+    """
+    now = now or time.time()
+    samples = [s for s in samples if s[1] is not None]
+    if not samples:
+        return None
+
+    start = now - FIT_WINDOW_SECONDS[window]
+    recent = since_reset([s for s in samples if s[0] >= start])
+    latest_ts, used, latest_reset = samples[-1]
+    resets_at = parse_timestamp(resets_at) if resets_at is not None else latest_reset
+
+    rate = fit_rate([s[0] for s in recent], [s[1] for s in recent]) if recent else None
+
+    exhausts_at = None
+    if rate is not None and rate >= MIN_RATE and used < 100:
+        exhausts_at = latest_ts + (100 - used) / rate * 3600
+        if resets_at is not None and exhausts_at >= resets_at:
+            exhausts_at = None  # The window resets before it runs out
+    elif used >= 100:
+        exhausts_at = latest_ts
+
+    return Forecast(window, used, rate, exhausts_at, resets_at, len(recent))
+
+
+def forecast_provider(series, payload=None, now=None):
+    """
+    Forecast every limit window of one provider.
+
+    Args:
+        series: (ts, *values) tuples from UsageHistory.get_series() with
+            fields=SERIES_FIELDS, oldest first
+        payload: Latest provider dict from the CLI; its values are used as
+            the newest sample (history writes may lag behind)
+
+    Returns:
+        Dict mapping window name -> Forecast, for windows with data
+    """
+    now = now or time.time()
+    usage = (payload or {}).get('usage') or {}
+    forecasts = {}
+    for i, window in enumerate(USAGE_WINDOWS):
+        samples = [(point[0], point[1 + 2 * i], point[2 + 2 * i]) for point in series]
+        limit = usage.get(window) or {}
+        resets_at = parse_timestamp(limit.get('resetsAt'))
+        if limit.get('usedPercent') is not None and (not samples or samples[-1][0] < now):
+            samples.append((now, limit['usedPercent'], resets_at))
+        forecast = forecast_window(window, samples, now, resets_at)
+        if forecast:
+            forecasts[window] = forecast
+    return forecasts
+
+
+def format_duration(seconds):
+    """Compact duration like '45m', '3h 20m' or '2d 4h'."""
+    minutes = max(int(seconds // 60), 0)
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 48:
+        return f"{hours}h {minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h"
+
+
+def describe(forecast, now=None):
+    """One-line summary for the tray, e.g. '🔥 4.2%/h · empty in 3h 20m'."""
+    if forecast is None or forecast.rate_per_hour is None:
+        return None
+    now = now or time.time()
+    rate = f"🔥 {forecast.rate_per_hour:.1f}%/h"
+    if forecast.exhausts_at is not None:
+        return f"{rate} · empty in {format_duration(forecast.exhausts_at - now)}"
+    if forecast.rate_per_hour >= MIN_RATE and forecast.resets_at is not None:
+        return f"{rate} · lasts until reset"
+    return f"{rate} · steady"
+
+
+def to_dict(forecast):
+    """JSON-friendly form of a Forecast (timestamps as ISO 8601 UTC)."""
+    def iso(ts):
+        return datetime.fromtimestamp(int(ts), timezone.utc).isoformat() if ts is not None else None
+
+    return {
+        'usedPercent': forecast.used,
+        'burnRatePerHour': round(forecast.rate_per_hour, 3) if forecast.rate_per_hour is not None else None,
+        'exhaustsAt': iso(forecast.exhausts_at),
+        'resetsAt': iso(forecast.resets_at),
+        'points': forecast.points,
+    }
+
+
+def main():
+    """Print forecasts for the providers in the history database."""
+    import importlib.util
+    import os
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location("usagebar_history", os.path.join(script_dir, "usagebar-history.py"))
+    usagebar_history = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(usagebar_history)
+
+    with usagebar_history.UsageHistory() as history:
+        latest = history.get_latest_snapshots()
+        series = history.get_series_many(list(latest), hours=24, fields=SERIES_FIELDS)
+        now = time.time()
+        for provider_id in sorted(latest):
+            forecasts = forecast_provider(series[provider_id])
+            for window, forecast in forecasts.items():
+                print(f"{provider_id:<12} {window:<10} {describe(forecast, now) or 'not enough data'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,105 +4,983 @@ UsageBar History Tracking Module
 
 Provides SQLite-based persistence for usage snapshots,
 enabling historical analysis and trend visualization.
+
+Timestamps are stored as UTC epoch seconds (INTEGER column `ts`) so every
+time-window filter is a plain indexed range comparison.
+
+Raw snapshots are also folded into hourly and daily rollup tables as they
+are written (min/max/avg/last per usage dimension). Each tier has its own
+retention, and series queries read from the cheapest tier that covers the
+requested window (see plan_tier).
 """
 
+import argparse
+import csv
+import gzip
+import importlib.util
+import io
+import logging
 import sqlite3
 import json
+import math
 import os
-from datetime import datetime, timedelta
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime, timezone
 from pathlib import Path
 
+
+def _load_sibling(name, filename):
+    """Load a sibling script (hyphenated filename) as a module via importlib, once per process."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(os.path.abspath(__file__)), filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+usagebar_metrics = _load_sibling("usagebar_metrics", "usagebar-metrics.py")
+
+log = logging.getLogger('usagebar.history')
+
 # Database location
 HISTORY_DB = Path.home() / ".config" / "usagebar" / "history.db"
 
+# Sampling (see default_sampling_policy)
+SAMPLE_DEADBAND = 1.0  # Write when any usedPercent moved at least this many points
+SAMPLE_HEARTBEAT_SECONDS = 3600  # ...or at least this often while nothing changes
+RESET_DROP = 1.0  # A usedPercent drop bigger than this counts as a reset
+
 # Pruning settings
-MAX_HISTORY_DAYS = 90  # Keep 90 days of data
-MAX_SNAPSHOTS_PER_DAY = 24  # Max one per hour
+RAW_RETENTION_DAYS = 7
+HOURLY_RETENTION_DAYS = 90
+DAILY_RETENTION_DAYS = None  # Keep forever
+
+# Retention runs at most this often, or sooner once this many raw rows were
+# added since the last run, and deletes in batches of this many rows
+RETENTION_INTERVAL_SECONDS = 86400
+RETENTION_ROW_THRESHOLD = 5000
+RETENTION_BATCH_SIZE = 500
+
+# Schema version stored in PRAGMA user_version (see _migrate)
+SCHEMA_VERSION = 3
+
+# Typed columns extracted from each provider payload
+USAGE_WINDOWS = ('primary', 'secondary', 'tertiary')
+SNAPSHOT_COLUMNS = (
+    'primary_used', 'primary_resets_at',
+    'secondary_used', 'secondary_resets_at',
+    'tertiary_used', 'tertiary_resets_at',
+    'credits_remaining',
+)
+
+# Numeric columns that get_series() may return
+SERIES_FIELDS = ('primary_used', 'secondary_used', 'tertiary_used', 'credits_remaining')
+
+# Reset times get_series() may also return from the raw tier, as epoch seconds
+RESET_FIELDS = ('primary_resets_at', 'secondary_resets_at', 'tertiary_resets_at')
+
+# Columns held by the in-memory series cache
+CACHE_FIELDS = SERIES_FIELDS + RESET_FIELDS
+
+# Storage tiers, finest first. `resolution` is the bucket size in seconds
+# (for raw snapshots, the nominal spacing used when planning queries).
+Tier = namedtuple('Tier', 'name table resolution retention_days')
+TIERS = (
+    Tier('raw', 'usage_snapshots', 900, RAW_RETENTION_DAYS),
+    Tier('hourly', 'usage_hourly', 3600, HOURLY_RETENTION_DAYS),
+    Tier('daily', 'usage_daily', 86400, DAILY_RETENTION_DAYS),
+)
+ROLLUP_TIERS = TIERS[1:]
+
+# Terminal charts read the finest tier with at most this many points per dot column
+CHART_POINTS_PER_COLUMN = 4
+
+# Series queries pick the finest tier that returns at most this many points
+MAX_SERIES_POINTS = 240
+
+# Aggregates available from the rollup tiers
+ROLLUP_AGGREGATES = ('avg', 'min', 'max', 'last')
+
+# In-memory recent series cache (SeriesRingBuffer per provider)
+CACHE_CAPACITY = 2048  # Points kept per provider (about a week at 5-minute changes)
+CACHE_WARM_HOURS = 24  # Window loaded from SQLite when the cache is first used
+
+# Write-behind queue (SnapshotWriter)
+WRITE_QUEUE_SIZE = 64  # Pending snapshots before the overflow policy applies
+WRITE_BATCH_DELAY = 0.5  # Seconds to gather more snapshots into one transaction
+WRITE_BLOCK_TIMEOUT = 0.05  # 'block' policy: longest a producer waits for room
+WRITE_POLICIES = ('drop-oldest', 'block')
+
+# Streaming export (export_snapshots)
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_FIELDS = ('provider', 'ts', 'timestamp') + SNAPSHOT_COLUMNS + ('data',)
+DEFAULT_EXPORT_FIELDS = ('provider', 'timestamp') + SNAPSHOT_COLUMNS
+EXPORT_CHUNK_SIZE = 1000  # Rows fetched from the cursor at a time
+
+# Bulk import (UsageHistory.import_snapshots)
+IMPORT_BATCH_SIZE = 5000  # Rows per executemany() and transaction
+
+# Connection settings
+BUSY_TIMEOUT_MS = 5000  # Wait this long for a competing writer before "database is locked"
+STATEMENT_CACHE_SIZE = 64  # Prepared statements kept per connection
+
+_CREATE_SNAPSHOTS = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER NOT NULL,
+        provider TEXT NOT NULL,
+        primary_used REAL,
+        primary_resets_at TEXT,
+        secondary_used REAL,
+        secondary_resets_at TEXT,
+        tertiary_used REAL,
+        tertiary_resets_at TEXT,
+        credits_remaining REAL,
+        data_json TEXT
+    )
+"""
+
+# (provider, ts) is unique and serves every per-provider window query;
+# ts alone serves pruning and the global date range.
+_CREATE_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_provider_ts ON {table}(provider, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_ts ON {table}(ts)",
+)
+
+# Rollup buckets keep mergeable aggregates per dimension (min, max, sum and
+# count of non-null values, last value) so they can be updated in place.
+_ROLLUP_AGGS = ('min', 'max', 'sum', 'cnt', 'last')
+_ROLLUP_COLUMNS = tuple(f"{field}_{agg}" for field in SERIES_FIELDS for agg in _ROLLUP_AGGS)
+
+_CREATE_ROLLUP = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        provider TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        %s,
+        PRIMARY KEY (provider, bucket)
+    ) WITHOUT ROWID
+""" % ',\n        '.join(
+    f"{column} {'INTEGER' if column.endswith('_cnt') else 'REAL'}" for column in _ROLLUP_COLUMNS
+)
+
+
+def _rollup_upsert_sql():
+    """UPSERT merging one pre-aggregated row into a rollup bucket ({table} left for the tier)."""
+    merges = []
+    for f in SERIES_FIELDS:
+        merges += [
+            f"{f}_min = coalesce(min({f}_min, excluded.{f}_min), {f}_min, excluded.{f}_min)",
+            f"{f}_max = coalesce(max({f}_max, excluded.{f}_max), {f}_max, excluded.{f}_max)",
+            f"{f}_sum = coalesce({f}_sum, 0) + coalesce(excluded.{f}_sum, 0)",
+            f"{f}_cnt = {f}_cnt + excluded.{f}_cnt",
+            f"{f}_last = CASE WHEN excluded.last_ts >= last_ts AND excluded.{f}_last IS NOT NULL"
+            f" THEN excluded.{f}_last ELSE {f}_last END",
+        ]
+    return f"""
+        INSERT INTO {{table}} (provider, bucket, samples, last_ts, {', '.join(_ROLLUP_COLUMNS)})
+        VALUES (?, ?, ?, ?, {', '.join('?' * len(_ROLLUP_COLUMNS))})
+        ON CONFLICT (provider, bucket) DO UPDATE SET
+            samples = samples + excluded.samples,
+            last_ts = max(last_ts, excluded.last_ts),
+            {', '.join(merges)}
+    """
+
+
+SQL_ROLLUP_UPSERT = _rollup_upsert_sql()
+
+_SNAPSHOT_SELECT = f"provider, ts, {', '.join(SNAPSHOT_COLUMNS)}, data_json"
+
+# Time-window queries. All filters compare the bare `ts` column against a
+# bound epoch value so SQLite can use the indexes (see test-history.py).
+SQL_HISTORY = f"""
+    SELECT {_SNAPSHOT_SELECT}
+    FROM usage_snapshots
+    WHERE provider IN ({{placeholders}})
+    AND ts >= ?
+    ORDER BY provider, ts ASC
+"""
+
+SQL_SERIES = """
+    SELECT provider, ts, {fields}
+    FROM usage_snapshots
+    WHERE provider IN ({placeholders})
+    AND ts >= ?
+    ORDER BY provider, ts ASC
+"""
+
+SQL_LATEST = f"""
+    SELECT {_SNAPSHOT_SELECT}
+    FROM usage_snapshots
+    JOIN (
+        SELECT provider, MAX(ts) AS ts FROM usage_snapshots
+        {{where}}
+        GROUP BY provider
+    ) latest USING (provider, ts)
+"""
+
+SQL_SERIES_ALL = """
+    SELECT provider, ts, {fields}
+    FROM usage_snapshots
+    WHERE ts >= ?
+    ORDER BY ts ASC
+"""
+
+SQL_ROLLUP_SERIES = """
+    SELECT provider, bucket, {fields}
+    FROM {table}
+    WHERE provider IN ({placeholders})
+    AND bucket >= ?
+    ORDER BY provider, bucket ASC
+"""
+
+# Export walks one index in order (idx_ts, or idx_provider_ts when filtered
+# by provider), so rows stream without a sort buffering the whole result.
+SQL_EXPORT = """
+    SELECT provider, ts, {columns}
+    FROM usage_snapshots
+    WHERE {where}
+    ORDER BY {order}
+"""
+
+# Import dedupe: keys already stored in a batch's time range
+SQL_EXISTING_KEYS = "SELECT provider, ts FROM usage_snapshots WHERE ts BETWEEN ? AND ?"
+SQL_EXISTING_BUCKETS = "SELECT provider, bucket FROM {table} WHERE bucket BETWEEN ? AND ?"
+
+# Retention deletes one small batch per statement (and per commit), each
+# picked through the time index, so no single write holds the lock for long.
+SQL_EXPIRED = "SELECT COUNT(*) FROM usage_snapshots WHERE ts < ?"
+SQL_EXPIRED_ROLLUP = "SELECT COUNT(*) FROM {table} WHERE bucket < ?"
+SQL_PRUNE_BATCH = """
+    DELETE FROM usage_snapshots WHERE id IN (
+        SELECT id FROM usage_snapshots WHERE ts < ? LIMIT ?
+    )
+"""
+SQL_PRUNE_ROLLUP_BATCH = """
+    DELETE FROM {table} WHERE (provider, bucket) IN (
+        SELECT provider, bucket FROM {table} WHERE bucket < ? LIMIT ?
+    )
+"""
+
+_CREATE_META = """
+    CREATE TABLE IF NOT EXISTS history_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+"""
+
+
+def to_epoch(value):
+    """
+    Convert a stored timestamp to UTC epoch seconds.
+
+    Accepts epoch numbers, ISO 8601 strings with an offset, naive ISO
+    strings as written by older versions (local time), and SQLite's
+    CURRENT_TIMESTAMP format 'YYYY-MM-DD HH:MM:SS' (UTC).
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().replace('Z', '+00:00')
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None and 'T' not in text:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+class SamplingPolicy:
+    """
+    Decides whether a provider's new snapshot is worth writing.
+
+    should_write() compares the new typed values (SNAPSHOT_COLUMNS order)
+    with the last written ones, both held in memory by UsageHistory, so
+    the decision costs no query. `last` is a (ts, values) pair, or None
+    if nothing was written for the provider yet.
+
+    The base class writes every snapshot (no sampling); subclasses
+    override should_write() with their rule.
+    """
+
+    def should_write(self, last, ts, values):
+        return True
+
+    @staticmethod
+    def windows(values):
+        """(usedPercent, resetsAt) pairs for the primary/secondary/tertiary windows."""
+        return [(values[2 * i], values[2 * i + 1]) for i in range(len(USAGE_WINDOWS))]
+
+
+class FixedIntervalPolicy(SamplingPolicy):
+    """Write at most one snapshot per `interval` seconds."""
+
+    def __init__(self, interval=SAMPLE_HEARTBEAT_SECONDS):
+        self.interval = interval
+
+    def should_write(self, last, ts, values):
+        return last is None or ts - last[0] >= self.interval
+
+
+class ChangePolicy(SamplingPolicy):
+    """
+    Write when any usedPercent (or credits remaining) moved by at least
+    `deadband`, or a window appeared/disappeared; otherwise only once per
+    `heartbeat` seconds (None to never write unchanged data).
+    """
+
+    def __init__(self, deadband=SAMPLE_DEADBAND, heartbeat=SAMPLE_HEARTBEAT_SECONDS):
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+
+    def should_write(self, last, ts, values):
+        if last is None:
+            return True
+        if self.heartbeat is not None and ts - last[0] >= self.heartbeat:
+            return True
+        old = last[1]
+        for i in (0, 2, 4, 6):  # usedPercent columns and credits_remaining
+            if (old[i] is None) != (values[i] is None):
+                return True
+            if values[i] is not None and abs(values[i] - old[i]) >= self.deadband:
+                return True
+        return False
+
+
+class ResetPolicy(SamplingPolicy):
+    """Always write the first snapshot after a window resets (new resetsAt or a usage drop)."""
+
+    def should_write(self, last, ts, values):
+        if last is None:
+            return True
+        for (old_used, old_reset), (used, reset) in zip(self.windows(last[1]), self.windows(values)):
+            if old_reset and reset and old_reset != reset:
+                return True
+            if old_used is not None and used is not None and used < old_used - RESET_DROP:
+                return True
+        return False
+
+
+class AnyPolicy(SamplingPolicy):
+    """Write when any of the wrapped policies says so."""
+
+    def __init__(self, *policies):
+        self.policies = policies
+
+    def should_write(self, last, ts, values):
+        return any(policy.should_write(last, ts, values) for policy in self.policies)
+
+
+def default_sampling_policy():
+    """Change-only with a 1-point deadband and hourly heartbeat, plus every reset."""
+    return AnyPolicy(ChangePolicy(), ResetPolicy())
+
+
+class SeriesRingBuffer:
+    """
+    Fixed-capacity ring of recent raw samples for one provider.
+
+    Timestamps live in an array('q') and each CACHE_FIELDS column in an
+    array('d') (NaN for missing values, reset times as epoch seconds). `complete_since` is the earliest
+    time from which the buffer holds every written sample; windows that
+    start at or after it can be answered without SQLite.
+    """
+
+    def __init__(self, capacity=CACHE_CAPACITY, complete_since=0):
+        self.capacity = capacity
+        self.complete_since = complete_since
+        self._ts = array('q', [0]) * capacity
+        self._values = [array('d', [math.nan]) * capacity for _ in CACHE_FIELDS]
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, ts, values):
+        """Add a sample (values in CACHE_FIELDS order); the oldest is evicted when full."""
+        if self._count and ts <= self._ts[(self._start + self._count - 1) % self.capacity]:
+            if ts < self._ts[(self._start + self._count - 1) % self.capacity]:
+                return  # Older than what we hold; SQLite remains the source of truth
+            index = (self._start + self._count - 1) % self.capacity  # Same second: replace
+        elif self._count < self.capacity:
+            index = (self._start + self._count) % self.capacity
+            self._count += 1
+        else:
+            index = self._start
+            self.complete_since = self._ts[index] + 1
+            self._start = (self._start + 1) % self.capacity
+        self._ts[index] = ts
+        for column, value in zip(self._values, values):
+            column[index] = math.nan if value is None else value
+
+    def covers(self, since):
+        return since >= self.complete_since
+
+    def window(self, since, fields):
+        """Samples with ts >= since as (ts, *values) tuples, oldest first."""
+        columns = [self._values[CACHE_FIELDS.index(f)] for f in fields]
+        points = []
+        for offset in range(self._count - 1, -1, -1):
+            index = (self._start + offset) % self.capacity
+            ts = self._ts[index]
+            if ts < since:
+                break
+            points.append((ts, *(None if math.isnan(c[index]) else c[index] for c in columns)))
+        points.reverse()
+        return points
+
+
+def cache_values(columns):
+    """CACHE_FIELDS values from typed columns (SNAPSHOT_COLUMNS order), reset times as epoch."""
+    values = [columns[SNAPSHOT_COLUMNS.index(f)] for f in CACHE_FIELDS]
+    for i in range(len(SERIES_FIELDS), len(CACHE_FIELDS)):
+        values[i] = to_epoch(values[i])
+    return values
+
+
+def plan_tier(hours, max_points=MAX_SERIES_POINTS):
+    """
+    Pick the cheapest storage tier for a window of `hours`.
+
+    That is the finest tier that still holds the whole window and returns
+    at most `max_points` points per provider, e.g. raw for a day, hourly
+    for a week and daily for 90 days. Falls back to the coarsest tier.
+    """
+    seconds = hours * 3600
+    for tier in TIERS:
+        if tier.retention_days is not None and seconds > tier.retention_days * 86400:
+            continue
+        if seconds / tier.resolution <= max_points:
+            return tier
+    return TIERS[-1]
+
+
+def rollup_values(values):
+    """Rollup column values (in _ROLLUP_COLUMNS order) for one sample of SERIES_FIELDS values."""
+    row = []
+    for value in values:
+        row += (value, value, value, 0 if value is None else 1, value)
+    return row
+
+
+def format_timestamp(ts):
+    """Format UTC epoch seconds as a local ISO 8601 string with offset."""
+    return datetime.fromtimestamp(ts, timezone.utc).astimezone().isoformat()
+
+
+def snapshot_columns(provider):
+    """Extract the typed column values (in SNAPSHOT_COLUMNS order) from a provider payload."""
+    usage = provider.get('usage') or {}
+    values = []
+    for window in USAGE_WINDOWS:
+        limit = usage.get(window) or {}
+        values.append(limit.get('usedPercent'))
+        values.append(limit.get('resetsAt'))
+    credits = provider.get('credits') or {}
+    values.append(credits.get('remaining'))
+    return tuple(values)
+
+
+def import_record(record):
+    """
+    Normalise one exported record for import_snapshots().
+
+    Accepts NDJSON objects and CSV rows from `export --format ndjson|csv`
+    (any field projection that keeps the provider, a time and either the
+    typed columns or the payload), or {'provider', 'ts', 'data'} dicts.
+
+    Returns:
+        (provider, ts, columns, payload) with columns in SNAPSHOT_COLUMNS
+        order and payload a dict or None; None if the record is unusable
+
+    Raises:
+        ValueError, TypeError: for a malformed time or column value
+    """
+    data = record.get('data')
+    if isinstance(data, str):
+        try:
+            data = json.loads(data) if data else None
+        except json.JSONDecodeError:
+            data = None
+    provider = record.get('provider') or (data or {}).get('provider')
+    ts = record.get('ts')
+    ts = int(float(ts)) if ts not in (None, '') else to_epoch(record.get('timestamp') or None)
+    if not provider or ts is None:
+        return None
+
+    if any(column in record for column in SNAPSHOT_COLUMNS):
+        columns = []
+        for column in SNAPSHOT_COLUMNS:
+            value = record.get(column)
+            if value == '':
+                value = None
+            elif value is not None and column not in RESET_FIELDS:
+                value = float(value)
+            columns.append(value)
+        columns = tuple(columns)
+    elif data:
+        columns = snapshot_columns(data)
+    else:
+        return None
+    return provider, ts, columns, data
+
+
+def payload_from_columns(provider_id, columns):
+    """Rebuild a minimal provider payload from typed columns (when no raw JSON was kept)."""
+    usage = {}
+    for i, window in enumerate(USAGE_WINDOWS):
+        used, resets_at = columns[2 * i], columns[2 * i + 1]
+        if used is not None:
+            usage[window] = {'usedPercent': used}
+            if resets_at:
+                usage[window]['resetsAt'] = resets_at
+    payload = {'provider': provider_id, 'usage': usage}
+    if columns[6] is not None:
+        payload['credits'] = {'remaining': columns[6]}
+    return payload
 
 
 class UsageHistory:
-    """Manages usage data persistence and retrieval."""
+    """
+    Manages usage data persistence and retrieval.
+
+    Each thread gets its own long-lived connection in WAL mode, so the tray
+    can read while another thread or `usagebar-history.py` writes. Call
+    close() when done, or use the instance as a context manager.
+    """
+
+    def __init__(self, db_path=HISTORY_DB, store_raw=True, sampling=None):
+        """
+        Initialize history database.
 
-    def __init__(self, db_path=HISTORY_DB):
-        """Initialize history database."""
-        self.db_path = db_path
+        Args:
+            db_path: SQLite database file
+            store_raw: Also keep each full provider payload as JSON
+            sampling: SamplingPolicy deciding which snapshots are written
+                (default: default_sampling_policy())
+        """
+        self.db_path = Path(db_path)
+        self.store_raw = store_raw
+        self.sampling = sampling or default_sampling_policy()
+        self._last_written = None  # provider -> (ts, values), loaded on first save
+        # Recent raw series per provider (see warm_cache); guarded by _cache_lock
+        self._cache = None
+        self._cache_since = None
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+        self.retention = RetentionManager(self)
         self.init_db()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connect(self):
+        """Return this thread's connection, opening and tuning it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False  # close() may run on another thread
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+
+        with self._connections_lock:
+            self._connections.append(conn)
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    def close_thread(self):
+        """Close only the calling thread's connection (for worker threads that exit)."""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is None:
+            return
+        with self._connections_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Close every connection opened by this instance (they reopen on next use)."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
     def init_db(self):
-        """Create database schema if it doesn't exist."""
+        """Create database schema if it doesn't exist, migrating older layouts."""
         # Ensure directory exists
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
 
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
 
-        # Main snapshots table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS usage_snapshots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                provider TEXT NOT NULL,
-                data_json TEXT NOT NULL,
-                UNIQUE(provider, timestamp)
-            )
-        """)
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()[0]
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usage_snapshots'")
+        if cursor.fetchone() and version < SCHEMA_VERSION:
+            self._migrate(conn, version)
 
-        # Indexes for fast queries
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_provider_timestamp
-            ON usage_snapshots(provider, timestamp DESC)
-        """)
+        # Main snapshots table and its indexes
+        cursor.execute(_CREATE_SNAPSHOTS.format(table='usage_snapshots'))
+        for statement in _CREATE_INDEXES:
+            cursor.execute(statement.format(table='usage_snapshots'))
 
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_timestamp
-            ON usage_snapshots(timestamp DESC)
-        """)
+        # Rollup tiers (primary key serves per-provider windows)
+        self._create_rollups(cursor)
 
+        # Bookkeeping (e.g. when retention last ran)
+        cursor.execute(_CREATE_META)
+
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
-        conn.close()
 
-    def save_snapshot(self, provider_data):
+    def _migrate(self, conn, version):
+        """
+        Upgrade an existing database from `version` to SCHEMA_VERSION in place.
+
+        v0 kept only a JSON blob per row; v1 added typed usage columns; v2
+        replaced the local-time ISO `timestamp` text with UTC epoch `ts`;
+        v3 added the hourly/daily rollup tiers.
+        """
+        log.info("Migrating history database...")
+        if version < 2:
+            self._rebuild_snapshots(conn, version)
+        if version < 3:
+            self._create_rollups(conn)
+            self._backfill_rollups(conn)
+
+    def _rebuild_snapshots(self, conn, version):
         """
-        Save a usage snapshot for all providers.
+        Copy a v0/v1 snapshots table into the current layout in batches.
+
+        Both older changes need a table rebuild in SQLite, so the rows go
+        into a fresh table that is then swapped in.
+        """
+        columns = ', '.join(SNAPSHOT_COLUMNS)
+        conn.execute("DROP TABLE IF EXISTS usage_snapshots_new")
+        conn.execute(_CREATE_SNAPSHOTS.format(table='usage_snapshots_new'))
+        # Index names are global, so use temporary ones until the swap
+        conn.execute("CREATE UNIQUE INDEX idx_provider_ts_new ON usage_snapshots_new(provider, ts)")
+
+        if version < 1:
+            read = conn.execute("SELECT id, timestamp, provider, data_json FROM usage_snapshots ORDER BY id")
+        else:
+            read = conn.execute(f"SELECT id, timestamp, provider, {columns}, data_json FROM usage_snapshots ORDER BY id")
+
+        placeholders = ','.join(['?'] * (len(SNAPSHOT_COLUMNS) + 4))
+        copied = 0
+        while True:
+            rows = read.fetchmany(1000)
+            if not rows:
+                break
+            batch = []
+            for row_id, timestamp, provider, *values in rows:
+                ts = to_epoch(timestamp)
+                if ts is None:
+                    continue
+                data_json = values[-1]
+                if version < 1:
+                    try:
+                        values = snapshot_columns(json.loads(data_json))
+                    except (TypeError, ValueError, AttributeError):
+                        values = (None,) * len(SNAPSHOT_COLUMNS)
+                else:
+                    values = values[:-1]
+                batch.append((row_id, ts, provider, *values, data_json))
+            # Rows that collide once sub-second precision is dropped keep the first copy
+            copied += conn.executemany(f"""
+                INSERT OR IGNORE INTO usage_snapshots_new
+                (id, ts, provider, {columns}, data_json)
+                VALUES ({placeholders})
+            """, batch).rowcount
+
+        conn.execute("DROP TABLE usage_snapshots")
+        conn.execute("ALTER TABLE usage_snapshots_new RENAME TO usage_snapshots")
+        conn.execute("DROP INDEX idx_provider_ts_new")
+        log.info("Migrated %d snapshots to schema v%d", copied, SCHEMA_VERSION)
+
+    @staticmethod
+    def _create_rollups(conn):
+        """Create the rollup tier tables and their bucket indexes."""
+        for tier in ROLLUP_TIERS:
+            conn.execute(_CREATE_ROLLUP.format(table=tier.table))
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{tier.table}_bucket ON {tier.table}(bucket)")
+
+    def _backfill_rollups(self, conn):
+        """Fold every existing raw snapshot into the rollup tiers."""
+        read = conn.execute(f"SELECT provider, ts, {', '.join(SERIES_FIELDS)} FROM usage_snapshots ORDER BY ts")
+        while True:
+            rows = read.fetchmany(1000)
+            if not rows:
+                break
+            self._update_rollups(conn, rows)
+
+    @staticmethod
+    def _update_rollups(conn, samples):
+        """
+        Fold (provider, ts, *SERIES_FIELDS values) samples into every rollup tier.
+
+        Samples are merged per bucket in Python first, so each bucket
+        touched costs one UPSERT per tier.
+        """
+        for tier in ROLLUP_TIERS:
+            buckets = {}
+            for provider, ts, *values in samples:
+                key = (provider, ts - ts % tier.resolution)
+                row = rollup_values(values)
+                merged = buckets.get(key)
+                if merged is None:
+                    buckets[key] = [1, ts, row]
+                    continue
+                merged[0] += 1
+                acc = merged[2]
+                for i in range(0, len(row), 5):
+                    value = row[i]
+                    if value is None:
+                        continue
+                    acc[i] = value if acc[i] is None else min(acc[i], value)
+                    acc[i + 1] = value if acc[i + 1] is None else max(acc[i + 1], value)
+                    acc[i + 2] = value if acc[i + 2] is None else acc[i + 2] + value
+                    acc[i + 3] += 1
+                    if ts >= merged[1]:
+                        acc[i + 4] = value
+                merged[1] = max(merged[1], ts)
+            conn.executemany(
+                SQL_ROLLUP_UPSERT.format(table=tier.table),
+                [(provider, bucket, n, last_ts, *row) for (provider, bucket), (n, last_ts, row) in buckets.items()]
+            )
+
+    @staticmethod
+    def _snapshot(provider_id, ts, columns, data_json):
+        """Build a history entry, preferring the raw payload when one was kept."""
+        timestamp = format_timestamp(ts)
+        if data_json:
+            try:
+                return {'timestamp': timestamp, 'data': json.loads(data_json)}
+            except json.JSONDecodeError:
+                pass
+        return {'timestamp': timestamp, 'data': payload_from_columns(provider_id, columns)}
+
+    def save_snapshot(self, provider_data, now=None):
+        """
+        Save a usage snapshot for all providers and update the rollup tiers.
 
         Args:
             provider_data: List of provider dicts from usagebar CLI
+            now: Snapshot time in epoch seconds (default: current time)
         """
         if not provider_data:
             return
+        self.save_snapshots([(time.time() if now is None else now, provider_data)])
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def save_snapshots(self, snapshots):
+        """
+        Save several snapshots in a single transaction (see SnapshotWriter).
 
-        for provider in provider_data:
-            p_id = provider.get('provider')
-            if not p_id:
-                continue
+        Providers whose data the sampling policy considers unchanged are
+        skipped, as are snapshots for a (provider, second) already stored:
+        the first one is kept. Call from one thread at a time (the writer
+        thread).
 
-            # Check if we already have a snapshot for this provider in the last hour
-            cursor.execute("""
-                SELECT COUNT(*) FROM usage_snapshots
-                WHERE provider = ?
-                AND datetime(timestamp) > datetime('now', '-1 hour')
-            """, (p_id,))
+        Args:
+            snapshots: Iterable of (epoch seconds, provider_data) pairs
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        last_written = self._load_last_written(cursor)
+        saved = []
+        cached = []
 
-            count = cursor.fetchone()[0]
+        for now, provider_data in snapshots:
+            now = int(now)
+            for provider in provider_data:
+                p_id = provider.get('provider')
+                if not p_id:
+                    continue
+
+                columns = snapshot_columns(provider)
+                if not self.sampling.should_write(last_written.get(p_id), now, columns):
+                    continue
 
-            # Only save if we don't have a recent snapshot (avoid spam)
-            if count == 0:
                 try:
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO usage_snapshots (provider, timestamp, data_json)
-                        VALUES (?, ?, ?)
-                    """, (p_id, datetime.now().isoformat(), json.dumps(provider)))
+                    cursor.execute(f"""
+                        INSERT OR IGNORE INTO usage_snapshots
+                        (provider, ts, {', '.join(SNAPSHOT_COLUMNS)}, data_json)
+                        VALUES (?, ?, {', '.join('?' * len(SNAPSHOT_COLUMNS))}, ?)
+                    """, (p_id, now, *columns,
+                          json.dumps(provider) if self.store_raw else None))
+                    if cursor.rowcount != 1:
+                        # Already have this second: rolling it up again would count it twice
+                        continue
+                    last_written[p_id] = (now, columns)
+                    saved.append((p_id, now, *(columns[SNAPSHOT_COLUMNS.index(f)] for f in SERIES_FIELDS)))
+                    cached.append((p_id, now, columns))
                 except Exception as e:
-                    print(f"[UsageBar] Warning: Failed to save snapshot for {p_id}: {e}")
+                    log.warning("Failed to save snapshot for %s: %s", p_id, e)
 
+        if saved:
+            self._update_rollups(conn, saved)
         conn.commit()
-        conn.close()
+        self.retention.note_written(len(saved))
+
+        if saved:
+            with self._cache_lock:
+                if self._cache is not None:
+                    for p_id, ts, columns in cached:
+                        self._cache_buffer(p_id).append(ts, cache_values(columns))
 
-        # Prune old data periodically
-        self.prune_old_data()
+        # Prune old data when the retention schedule says so
+        self.retention.maybe_run()
+
+    def import_snapshots(self, records, batch_size=IMPORT_BATCH_SIZE):
+        """
+        Bulk-load exported snapshots, e.g. to restore or merge another machine's history.
+
+        Records are inserted with executemany() in transactions of
+        `batch_size` rows and folded into the rollup tiers in the same pass.
+        Duplicates (a snapshot whose (provider, ts) is already stored) are
+        skipped. Raw rows older than raw retention are not kept, so those
+        snapshots only go into rollup buckets that were empty before the
+        import; one landing in a bucket that already had data cannot be told
+        apart from a sample the bucket already holds, and is skipped and
+        counted separately rather than merged. So importing the same file
+        twice changes nothing. The sampling policy is not applied.
+
+        Args:
+            records: Iterable of dicts accepted by import_record()
+
+        Returns:
+            Dict with 'read', 'imported', 'duplicates', 'skipped_existing_bucket'
+            (older than raw retention, bucket already filled), 'skipped'
+            (unusable records) and 'seconds'
+        """
+        started = time.monotonic()
+        report = dict.fromkeys(('read', 'imported', 'duplicates', 'skipped_existing_bucket', 'skipped'), 0)
+        created = set()  # Rollup buckets first filled by this import
+        conn = self._connect()
+        batch = []
+        for record in records:
+            report['read'] += 1
+            try:
+                row = import_record(record)
+            except (ValueError, TypeError, AttributeError):
+                # One bad cell or line must not abort the rest of the file
+                row = None
+            if row is None:
+                report['skipped'] += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self._import_batch(conn, batch, created, report)
+                batch = []
+        if batch:
+            self._import_batch(conn, batch, created, report)
+
+        # Imported rows bypassed the in-memory state of save_snapshots()
+        self._last_written = None
+        self.invalidate_cache()
+        self.retention.note_written(report['imported'])
+        report['seconds'] = round(time.monotonic() - started, 3)
+        return report
+
+    def _import_batch(self, conn, batch, created, report):
+        """Insert one batch of import_record() rows and its rollups in a single transaction."""
+        now = time.time()
+        raw_cutoff = now - TIERS[0].retention_days * 86400
+        hourly, daily = ROLLUP_TIERS
+        hourly_cutoff = now - hourly.retention_days * 86400
+
+        recent = [row for row in batch if row[1] >= raw_cutoff]
+        expired = [row for row in batch if row[1] < raw_cutoff]
+        fresh = []
+
+        if recent:
+            stored = set(conn.execute(SQL_EXISTING_KEYS, (min(r[1] for r in recent), max(r[1] for r in recent))))
+            for provider, ts, columns, payload in recent:
+                if (provider, ts) in stored:
+                    report['duplicates'] += 1
+                    continue
+                stored.add((provider, ts))
+                fresh.append((provider, ts, columns, payload))
+            conn.executemany(f"""
+                INSERT OR IGNORE INTO usage_snapshots
+                (provider, ts, {', '.join(SNAPSHOT_COLUMNS)}, data_json)
+                VALUES (?, ?, {', '.join('?' * len(SNAPSHOT_COLUMNS))}, ?)
+            """, [(provider, ts, *columns, json.dumps(payload) if payload and self.store_raw else None)
+                  for provider, ts, columns, payload in fresh])
+
+        rolled = list(fresh)
+        if expired:
+            # Raw rows this old would be pruned: only fill buckets history doesn't cover yet
+            low, high = min(r[1] for r in expired), max(r[1] for r in expired)
+            stored = {
+                (tier.name, *key)
+                for tier in ROLLUP_TIERS
+                for key in conn.execute(SQL_EXISTING_BUCKETS.format(table=tier.table),
+                                        (low - low % tier.resolution, high))
+            }
+            for row in expired:
+                tier = hourly if row[1] >= hourly_cutoff else daily
+                key = (tier.name, row[0], row[1] - row[1] % tier.resolution)
+                if key in stored and key not in created:
+                    report['skipped_existing_bucket'] += 1
+                    continue
+                created.add(key)
+                rolled.append(row)
+
+        if rolled:
+            self._update_rollups(conn, [
+                (provider, ts, *(columns[SNAPSHOT_COLUMNS.index(f)] for f in SERIES_FIELDS))
+                for provider, ts, columns, _ in rolled
+            ])
+        conn.commit()
+        report['imported'] += len(rolled)
+
+    def _load_last_written(self, cursor):
+        """Last written (ts, values) per provider, read from the database once."""
+        if self._last_written is None:
+            cursor.execute(SQL_LATEST.format(where=""))
+            self._last_written = {
+                provider: (ts, tuple(columns))
+                for provider, ts, *columns, data_json in cursor.fetchall()
+            }
+        return self._last_written
 
     def get_history(self, provider_id, hours=24):
         """
@@ -115,30 +993,210 @@ class UsageHistory:
         Returns:
             List of dicts with 'timestamp' and 'data' keys
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.get_history_many([provider_id], hours)[provider_id]
 
-        cursor.execute("""
-            SELECT timestamp, data_json
-            FROM usage_snapshots
-            WHERE provider = ?
-            AND datetime(timestamp) >= datetime('now', '-{} hours')
-            ORDER BY timestamp ASC
-        """.format(hours), (provider_id,))
+    def get_history_many(self, provider_ids, hours=24):
+        """
+        Get usage history for several providers with a single query.
 
-        results = []
-        for ts, data_json in cursor.fetchall():
-            try:
-                results.append({
-                    'timestamp': ts,
-                    'data': json.loads(data_json)
-                })
-            except json.JSONDecodeError:
-                continue
+        Args:
+            provider_ids: Provider names (e.g., ['claude', 'codex'])
+            hours: Number of hours of history to retrieve
+
+        Returns:
+            Dict mapping provider_id -> list of dicts with 'timestamp' and 'data'
+            keys (empty list for providers without history)
+        """
+        results = {provider_id: [] for provider_id in provider_ids}
+        if not results:
+            return results
+
+        cursor = self._connect().cursor()
+
+        placeholders = ','.join(['?' for _ in results])
+        cursor.execute(SQL_HISTORY.format(placeholders=placeholders),
+                       (*results, int(time.time() - hours * 3600)))
+
+        for provider, ts, *columns, data_json in cursor:
+            results[provider].append(self._snapshot(provider, ts, columns, data_json))
+
+        return results
+
+    def iter_snapshots(self, provider_ids=None, since=None, until=None, with_payload=False,
+                       chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Stream raw snapshots without loading the window into memory.
+
+        Rows are fetched from the cursor `chunk_size` at a time, ordered by
+        time (by provider, then time, when provider_ids is given).
+
+        Args:
+            provider_ids: Providers to include, or None for all
+            since: First epoch second to include (default: everything)
+            until: Epoch second to stop before (default: no limit)
+            with_payload: Also return the raw JSON payload (None if not kept)
+
+        Yields:
+            Tuples of (provider, ts, *SNAPSHOT_COLUMNS[, data_json])
+        """
+        where = ["ts >= ?", "ts < ?"]
+        params = [int(since) if since is not None else 0,
+                  int(until) if until is not None else 2 ** 62]
+        if provider_ids:
+            where.append(f"provider IN ({','.join('?' for _ in provider_ids)})")
+            params += provider_ids
+        columns = list(SNAPSHOT_COLUMNS) + (['data_json'] if with_payload else [])
+
+        cursor = self._connect().cursor()
+        cursor.execute(SQL_EXPORT.format(columns=', '.join(columns), where=' AND '.join(where),
+                                         order='provider, ts' if provider_ids else 'ts'), params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def get_series(self, provider_id, hours=24, fields=('primary_used',), tier=None, agg='avg'):
+        """
+        Get numeric usage series for a provider, without touching the raw payloads.
+
+        Args:
+            provider_id: Provider name (e.g., 'claude', 'codex')
+            hours: Number of hours of history to retrieve
+            fields: Columns to return, from SERIES_FIELDS (or RESET_FIELDS, raw tier only)
+            tier: Tier name ('raw', 'hourly', 'daily'), or None to let plan_tier() pick
+            agg: Per-bucket value for rollup tiers, from ROLLUP_AGGREGATES
+
+        Returns:
+            List of (ts, *values) tuples, oldest first, ts in UTC epoch seconds
+            (bucket start for rollup tiers)
+        """
+        return self.get_series_many([provider_id], hours, fields, tier, agg)[provider_id]
+
+    def get_series_many(self, provider_ids, hours=24, fields=('primary_used',), tier=None, agg='avg'):
+        """
+        Get numeric usage series for several providers with a single query.
+
+        Returns:
+            Dict mapping provider_id -> list of (ts, *values) tuples
+        """
+        unknown = set(fields) - set(CACHE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown series fields: {', '.join(sorted(unknown))}")
+        if agg not in ROLLUP_AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {agg}")
+        if tier is None:
+            tier = plan_tier(hours)
+        elif isinstance(tier, str):
+            tier = {t.name: t for t in TIERS}[tier]
+        resets = [i for i, f in enumerate(fields, 1) if f in RESET_FIELDS]
+        if resets and tier.name != 'raw':
+            raise ValueError("Reset times are only kept in the raw tier")
+
+        results = {provider_id: [] for provider_id in provider_ids}
+        if not results:
+            return results
+
+        cutoff = int(time.time() - hours * 3600)
+        if tier.name == 'raw':
+            # Serve what the in-memory cache covers; query only the rest
+            misses = self._series_from_cache(results, cutoff, fields)
+            if not misses:
+                return results
+            results_db = {provider_id: results[provider_id] for provider_id in misses}
+        else:
+            results_db = results
+
+        cursor = self._connect().cursor()
+
+        placeholders = ','.join(['?' for _ in results_db])
+        if tier.name == 'raw':
+            cursor.execute(SQL_SERIES.format(fields=', '.join(fields), placeholders=placeholders),
+                           (*results_db, cutoff))
+        else:
+            if agg == 'avg':
+                columns = [f"{f}_sum / NULLIF({f}_cnt, 0)" for f in fields]
+            else:
+                columns = [f"{f}_{agg}" for f in fields]
+            cursor.execute(
+                SQL_ROLLUP_SERIES.format(fields=', '.join(columns), table=tier.table, placeholders=placeholders),
+                (*results_db, cutoff - cutoff % tier.resolution)
+            )
+
+        for provider, *point in cursor:
+            for i in resets:
+                point[i] = to_epoch(point[i])
+            results[provider].append(tuple(point))
 
-        conn.close()
         return results
 
+    def warm_cache(self, hours=CACHE_WARM_HOURS):
+        """Load the last `hours` of raw series for every provider into the ring buffers."""
+        since = int(time.time() - hours * 3600)
+        cursor = self._connect().cursor()
+        # Query under the lock so a concurrent save is either in the result or appended after
+        with self._cache_lock:
+            cursor.execute(SQL_SERIES_ALL.format(fields=', '.join(CACHE_FIELDS)), (since,))
+            rows = cursor.fetchall()
+            self._cache = {}
+            self._cache_since = since
+            for provider, ts, *values in rows:
+                for i in range(len(SERIES_FIELDS), len(CACHE_FIELDS)):
+                    values[i] = to_epoch(values[i])
+                self._cache_buffer(provider).append(ts, values)
+
+    def invalidate_cache(self):
+        """Drop the ring buffers (after writes that bypass save_snapshots); rewarmed on next use."""
+        with self._cache_lock:
+            self._cache = None
+
+    def _cache_buffer(self, provider_id):
+        buffer = self._cache.get(provider_id)
+        if buffer is None:
+            # Nothing was in SQLite for this provider since the warm window began
+            buffer = self._cache[provider_id] = SeriesRingBuffer(complete_since=self._cache_since)
+        return buffer
+
+    def _series_from_cache(self, results, since, fields):
+        """Fill results for providers whose window the cache covers; returns the others."""
+        if self._cache is None:
+            self.warm_cache()
+        misses = []
+        with self._cache_lock:
+            for provider_id in results:
+                buffer = self._cache_buffer(provider_id)
+                if buffer.covers(since):
+                    results[provider_id] = buffer.window(since, fields)
+                    self.cache_stats['hits'] += 1
+                else:
+                    misses.append(provider_id)
+                    self.cache_stats['misses'] += 1
+        return misses
+
+    def cached_series_many(self, provider_ids, hours=24, fields=('primary_used',)):
+        """
+        Raw series from the ring buffers only, for callers that must not wait on SQLite.
+
+        The database is never queried: while the cache is cold (before
+        warm_cache() or after invalidate_cache()) the result is empty, and a
+        provider whose buffer does not reach back `hours` gets what it holds.
+
+        Returns:
+            Dict mapping provider_id -> list of (ts, *values) tuples
+        """
+        unknown = set(fields) - set(CACHE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown series fields: {', '.join(sorted(unknown))}")
+        since = int(time.time() - hours * 3600)
+        with self._cache_lock:
+            if self._cache is None:
+                return {}
+            return {provider_id: self._cache_buffer(provider_id).window(since, fields)
+                    for provider_id in provider_ids}
+
     def get_latest_snapshots(self, provider_ids=None):
         """
         Get the most recent snapshot for each provider.
@@ -149,63 +1207,36 @@ class UsageHistory:
         Returns:
             Dict mapping provider_id -> latest snapshot data
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._connect().cursor()
 
         if provider_ids:
             placeholders = ','.join(['?' for _ in provider_ids])
-            cursor.execute(f"""
-                SELECT provider, timestamp, data_json
-                FROM usage_snapshots
-                WHERE provider IN ({placeholders})
-                AND id IN (
-                    SELECT MAX(id) FROM usage_snapshots GROUP BY provider
-                )
-            """, provider_ids)
+            cursor.execute(SQL_LATEST.format(where=f"WHERE provider IN ({placeholders})"), list(provider_ids))
         else:
-            cursor.execute("""
-                SELECT provider, timestamp, data_json
-                FROM usage_snapshots
-                WHERE id IN (
-                    SELECT MAX(id) FROM usage_snapshots GROUP BY provider
-                )
-            """)
+            cursor.execute(SQL_LATEST.format(where=""))
 
         results = {}
-        for provider, ts, data_json in cursor.fetchall():
-            try:
-                results[provider] = {
-                    'timestamp': ts,
-                    'data': json.loads(data_json)
-                }
-            except json.JSONDecodeError:
-                continue
+        for provider, ts, *columns, data_json in cursor.fetchall():
+            results[provider] = self._snapshot(provider, ts, columns, data_json)
 
-        conn.close()
         return results
 
     def prune_old_data(self):
-        """Remove old data to keep database size manageable."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Remove data past each tier's retention now; returns the RetentionManager report."""
+        return self.retention.run()
 
-        # Delete snapshots older than MAX_HISTORY_DAYS
-        cursor.execute("""
-            DELETE FROM usage_snapshots
-            WHERE datetime(timestamp) < datetime('now', '-{} days')
-        """.format(MAX_HISTORY_DAYS))
+    def get_meta(self, key, default=None):
+        """Read a bookkeeping value from history_meta."""
+        row = self._connect().execute("SELECT value FROM history_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
 
-        deleted = cursor.rowcount
-        conn.commit()
-        conn.close()
-
-        if deleted > 0:
-            print(f"[UsageBar] Pruned {deleted} old snapshots (> {MAX_HISTORY_DAYS} days)")
+    def set_meta(self, conn, key, value):
+        """Write a bookkeeping value (committed by the caller)."""
+        conn.execute("INSERT OR REPLACE INTO history_meta (key, value) VALUES (?, ?)", (key, str(value)))
 
     def get_stats(self):
         """Get database statistics."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._connect().cursor()
 
         # Total snapshots
         cursor.execute("SELECT COUNT(*) FROM usage_snapshots")
@@ -215,31 +1246,447 @@ class UsageHistory:
         cursor.execute("SELECT COUNT(DISTINCT provider) FROM usage_snapshots")
         providers = cursor.fetchone()[0]
 
+        # Rollup buckets per tier
+        rollups = {}
+        for tier in ROLLUP_TIERS:
+            cursor.execute(f"SELECT COUNT(*) FROM {tier.table}")
+            rollups[f'{tier.name}_rollups'] = cursor.fetchone()[0]
+
         # Date range
-        cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM usage_snapshots")
+        cursor.execute("SELECT MIN(ts), MAX(ts) FROM usage_snapshots")
         min_ts, max_ts = cursor.fetchone()
 
-        # Database size
-        db_size = self.db_path.stat().st_size if self.db_path.exists() else 0
-
-        conn.close()
+        # Database size (including the write-ahead log)
+        db_size = sum(
+            path.stat().st_size
+            for path in (self.db_path, self.db_path.with_name(self.db_path.name + '-wal'))
+            if path.exists()
+        )
 
         return {
             'total_snapshots': total,
             'providers_tracked': providers,
-            'oldest_snapshot': min_ts,
-            'newest_snapshot': max_ts,
+            'oldest_snapshot': format_timestamp(min_ts) if min_ts is not None else None,
+            'newest_snapshot': format_timestamp(max_ts) if max_ts is not None else None,
+            **rollups,
             'db_size_bytes': db_size
         }
 
 
+class RetentionManager:
+    """
+    Applies the per-tier retention on its own schedule.
+
+    Runs when RETENTION_INTERVAL_SECONDS have passed since the last run
+    (recorded in history_meta, so the tray and the CLI share it) or when
+    more than RETENTION_ROW_THRESHOLD raw rows were added since. Expired
+    rows go in batches of RETENTION_BATCH_SIZE, one commit per batch.
+    """
+
+    def __init__(self, history, interval=RETENTION_INTERVAL_SECONDS,
+                 row_threshold=RETENTION_ROW_THRESHOLD, batch_size=RETENTION_BATCH_SIZE):
+        self.history = history
+        self.interval = interval
+        self.row_threshold = row_threshold
+        self.batch_size = batch_size
+        # Schedule state for maybe_run(), read from history_meta once
+        self._last_run = None
+        self._rows_written = 0
+
+    def _max_id(self):
+        return self.history._connect().execute("SELECT MAX(id) FROM usage_snapshots").fetchone()[0] or 0
+
+    def rows_since_last_run(self):
+        """Raw rows added since the last run (ids only grow, so this is an index lookup)."""
+        return self._max_id() - int(self.history.get_meta('retention_max_id', 0))
+
+    def is_due(self, now=None):
+        """True if the interval has passed or enough rows arrived since the last run."""
+        now = now or time.time()
+        last_run = float(self.history.get_meta('retention_last_run', 0))
+        return now - last_run >= self.interval or self.rows_since_last_run() >= self.row_threshold
+
+    def note_written(self, rows):
+        """Count raw rows written by this process towards the row threshold."""
+        self._rows_written += rows
+
+    def maybe_run(self, now=None):
+        """
+        Run if due; returns the report, or None if nothing was done.
+
+        After the first call this decides from in-memory state, so the
+        per-save check costs no query.
+        """
+        now = now or time.time()
+        if self._last_run is None:
+            self._last_run = float(self.history.get_meta('retention_last_run', 0))
+            self._rows_written = self.rows_since_last_run()
+        if now - self._last_run < self.interval and self._rows_written < self.row_threshold:
+            return None
+        return self.run(now)
+
+    def expired(self, now=None):
+        """Rows past retention, per tier name."""
+        now = int(now or time.time())
+        cursor = self.history._connect().cursor()
+        counts = {}
+        for tier in TIERS:
+            if tier.retention_days is None:
+                continue
+            cutoff = now - tier.retention_days * 86400
+            if tier.name == 'raw':
+                cursor.execute(SQL_EXPIRED, (cutoff,))
+            else:
+                cursor.execute(SQL_EXPIRED_ROLLUP.format(table=tier.table), (cutoff,))
+            counts[tier.name] = cursor.fetchone()[0]
+        return counts
+
+    def status(self, now=None):
+        """Schedule and backlog, for `usagebar-history.py retention`."""
+        now = now or time.time()
+        last_run = float(self.history.get_meta('retention_last_run', 0))
+        return {
+            'last_run': format_timestamp(last_run) if last_run else None,
+            'next_run': format_timestamp(max(last_run + self.interval, now)),
+            'rows_since_last_run': self.rows_since_last_run(),
+            'row_threshold': self.row_threshold,
+            'due': self.is_due(now),
+            'expired_rows': self.expired(now),
+            'last_reclaimed_rows': int(self.history.get_meta('retention_last_rows', 0)),
+            'last_reclaimed_bytes': int(self.history.get_meta('retention_last_bytes', 0)),
+        }
+
+    def run(self, now=None):
+        """
+        Delete everything past retention in small batches.
+
+        Returns:
+            Dict with rows deleted per tier, total 'rows', 'bytes' reclaimed
+            (pages returned to SQLite's free list, reused by later writes)
+            and 'seconds' taken
+        """
+        now = int(now or time.time())
+        started = time.perf_counter()
+        conn = self.history._connect()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        report = {}
+        for tier in TIERS:
+            if tier.retention_days is None:
+                continue
+            cutoff = now - tier.retention_days * 86400
+            sql = SQL_PRUNE_BATCH if tier.name == 'raw' else SQL_PRUNE_ROLLUP_BATCH.format(table=tier.table)
+            deleted = 0
+            while True:
+                batch = conn.execute(sql, (cutoff, self.batch_size)).rowcount
+                conn.commit()
+                deleted += batch
+                if batch < self.batch_size:
+                    break
+            report[tier.name] = deleted
+
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        report['rows'] = sum(report.values())
+        report['bytes'] = max(free_after - free_before, 0) * page_size
+        report['seconds'] = round(time.perf_counter() - started, 3)
+
+        self.history.set_meta(conn, 'retention_last_run', now)
+        self.history.set_meta(conn, 'retention_max_id', self._max_id())
+        self.history.set_meta(conn, 'retention_last_rows', report['rows'])
+        self.history.set_meta(conn, 'retention_last_bytes', report['bytes'])
+        conn.commit()
+        self._last_run = now
+        self._rows_written = 0
+
+        if report['rows'] > 0:
+            log.info("Retention removed %d rows (%s bytes reclaimed) in %ss",
+                     report['rows'], f"{report['bytes']:,}", report['seconds'])
+        return report
+
+
+SNAPSHOTS_WRITTEN = usagebar_metrics.counter(
+    'usagebar_history_snapshots_written_total', "Snapshots written by the background history writer")
+WRITE_ERRORS = usagebar_metrics.counter(
+    'usagebar_history_write_errors_total', "History write batches that failed")
+
+
+class SnapshotWriter:
+    """
+    Write-behind queue that saves snapshots on a background thread.
+
+    submit() only enqueues, so callers (the GTK main loop) never wait on
+    SQLite. The writer thread gathers whatever is queued, waiting up to
+    WRITE_BATCH_DELAY for more, and saves it in one transaction. Each
+    snapshot keeps the time it was submitted, not the time it was written.
+
+    When the queue is full (the disk has stalled), the policy decides:
+    'drop-oldest' discards the oldest pending snapshot (newer data
+    supersedes it), 'block' waits up to block_timeout for room and then
+    drops the new one. Both count drops in stats.
+
+    `stats` is a copy of the counters; the writer thread and submitters
+    update them under a lock.
+    """
+
+    def __init__(self, history, max_pending=WRITE_QUEUE_SIZE, batch_delay=WRITE_BATCH_DELAY,
+                 policy='drop-oldest', block_timeout=WRITE_BLOCK_TIMEOUT):
+        if policy not in WRITE_POLICIES:
+            raise ValueError(f"Unknown write policy: {policy}")
+        self.history = history
+        self.batch_delay = batch_delay
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._stats = {'submitted': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._urgent = threading.Event()
+        # Snapshots accepted vs. finished (written, failed or dropped), for flush()
+        self._cond = threading.Condition()
+        self._accepted = 0
+        self._finished = 0
+
+    def start(self):
+        """Start the writer thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="usagebar-history-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, provider_data, now=None):
+        """Queue a snapshot for writing; returns False if it was dropped."""
+        if not provider_data or self._stopping.is_set():
+            return False
+        item = (time.time() if now is None else now, provider_data)
+        self._count(submitted=1)
+        with self._cond:
+            self._accepted += 1
+        if self.policy == 'block':
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self._finish(1, dropped=True)
+                return False
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._finish(1, dropped=True)
+                except queue.Empty:
+                    pass
+
+    def flush(self, timeout=None):
+        """Wait until every snapshot submitted so far is handled; returns False on timeout."""
+        with self._cond:
+            target = self._accepted
+            if self._finished >= target:
+                return True
+            self._urgent.set()
+            return self._cond.wait_for(lambda: self._finished >= target, timeout)
+
+    def stop(self, timeout=5):
+        """Flush pending snapshots and stop the writer thread."""
+        if not self._thread:
+            return True
+        self._stopping.set()
+        self._urgent.set()
+        flushed = self.flush(timeout)
+        self._thread.join(timeout)
+        self._thread = None
+        return flushed
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    @property
+    def stats(self):
+        """Counters since the writer was created (a consistent copy)."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self._stats[key] += delta
+
+    def _finish(self, count, dropped=False):
+        if dropped:
+            self._count(dropped=count)
+        with self._cond:
+            self._finished += count
+            self._cond.notify_all()
+
+    def _take_batch(self):
+        """Block for the first snapshot, then gather more until the batch delay passes."""
+        batch = []
+        while not batch:
+            try:
+                batch.append(self._queue.get(timeout=0.2))
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return batch
+        deadline = time.monotonic() + self.batch_delay
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._urgent.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.05)))
+            except queue.Empty:
+                if remaining <= 0 or self._urgent.is_set():
+                    return batch
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch:
+                    try:
+                        with usagebar_metrics.span('history_write'):
+                            self.history.save_snapshots(batch)
+                        self._count(written=len(batch), batches=1)
+                        SNAPSHOTS_WRITTEN.inc(len(batch))
+                    except Exception as e:
+                        self._count(errors=1)
+                        WRITE_ERRORS.inc()
+                        log.warning("Failed to write %d history snapshots: %s", len(batch), e)
+                    self._finish(len(batch))
+                if self._queue.empty():
+                    self._urgent.clear()
+                    if self._stopping.is_set():
+                        return
+        finally:
+            self.history.close_thread()
+
+
+def export_snapshots(history, out, fmt='ndjson', fields=DEFAULT_EXPORT_FIELDS, provider_ids=None,
+                     since=None, until=None):
+    """
+    Write raw snapshots to a text stream as NDJSON or CSV, one row at a time.
+
+    Memory stays constant however large the history is: rows come from
+    UsageHistory.iter_snapshots() and are written as they arrive.
+
+    Args:
+        history: UsageHistory to read from
+        out: Writable text stream (open CSV files with newline='')
+        fmt: 'ndjson' or 'csv'
+        fields: Columns to write, from EXPORT_FIELDS ('data' is the full
+            payload: an object in NDJSON, a JSON string in CSV)
+        provider_ids, since, until: Filters, as for iter_snapshots()
+
+    Returns:
+        Number of rows written
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    unknown = set(fields) - set(EXPORT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown export fields: {', '.join(sorted(unknown))}")
+
+    def payload(row):
+        data_json = row[-1]
+        if data_json:
+            try:
+                return json.loads(data_json)
+            except json.JSONDecodeError:
+                pass
+        return payload_from_columns(row[0], row[2:2 + len(SNAPSHOT_COLUMNS)])
+
+    getters = {
+        'provider': lambda row: row[0],
+        'ts': lambda row: row[1],
+        'timestamp': lambda row: format_timestamp(row[1]),
+        'data': payload if fmt == 'ndjson' else lambda row: json.dumps(payload(row)),
+    }
+    for i, column in enumerate(SNAPSHOT_COLUMNS, 2):
+        getters[column] = lambda row, i=i: row[i]
+    project = [getters[field] for field in fields]
+
+    if fmt == 'csv':
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(fields)
+        write = writer.writerow
+    else:
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+        write = lambda values: out.write(encode(dict(zip(fields, values))) + '\n')
+
+    count = 0
+    for row in history.iter_snapshots(provider_ids, since, until, with_payload='data' in fields):
+        write([get(row) for get in project])
+        count += 1
+    return count
+
+
 def main():
     """CLI interface for history management."""
-    import sys
+    usagebar_metrics.setup_logging()
+    with UsageHistory() as history:
+        run_command(history, sys.argv[1:])
+
+
+def build_parser():
+    """Argument parser for the history CLI (no command shows a summary)."""
+    parser = argparse.ArgumentParser(prog="usagebar-history.py",
+                                     description="Inspect and maintain the UsageBar history database.")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("prune", help="Delete expired rows now")
+    sub.add_parser("stats", help="Print every statistic")
+
+    p = sub.add_parser("retention", help="Show the retention schedule or prune now")
+    p.add_argument("action", nargs="?", default="status", choices=("status", "run"))
+
+    p = sub.add_parser("export", help="Export snapshots: stream NDJSON/CSV, or JSON of one provider or the latest")
+    p.add_argument("provider", nargs="?", help="JSON format: provider to export (default: latest snapshots)")
+    p.add_argument("hours", nargs="?", type=int, default=24, help="JSON format: window in hours")
+    p.add_argument("--format", choices=('json',) + EXPORT_FORMATS, default="json",
+                   help="ndjson/csv stream every matching snapshot (default: json)")
+    p.add_argument("--since", type=parse_time_arg, help="Start: ISO date/time, epoch seconds or age like 7d, 12h")
+    p.add_argument("--until", type=parse_time_arg, help="End (exclusive), same forms as --since")
+    p.add_argument("--provider", dest="providers", action="append", help="Only this provider (repeatable)")
+    p.add_argument("--fields", type=lambda text: tuple(text.split(',')), default=DEFAULT_EXPORT_FIELDS,
+                   help=f"Comma-separated columns from: {','.join(EXPORT_FIELDS)}")
+    p.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    p.add_argument("--gzip", action="store_true", help="Compress the output (implied by a .gz output file)")
 
-    history = UsageHistory()
+    p = sub.add_parser("import", help="Import NDJSON/CSV exports (gzip'd or not), skipping duplicates")
+    p.add_argument("files", nargs="+", help="Export files, or - for stdin")
+    p.add_argument("--format", choices=EXPORT_FORMATS,
+                   help="Input format (default: csv for *.csv[.gz], else ndjson)")
 
-    if len(sys.argv) < 2:
+    p = sub.add_parser("chart", help="Draw usage over a time window in the terminal")
+    p.add_argument("providers", nargs="*", help="Providers to draw (default: all)")
+    window = p.add_mutually_exclusive_group()
+    window.add_argument("--hours", type=float, help="Window length in hours (default: 24)")
+    window.add_argument("--days", type=float, help="Window length in days")
+    p.add_argument("--window", choices=USAGE_WINDOWS + ('credits',), default="primary",
+                   help="Limit to draw (default: primary)")
+    p.add_argument("--agg", choices=ROLLUP_AGGREGATES, default="max",
+                   help="Rollup aggregate for long windows (default: max)")
+    p.add_argument("--glyphs", choices=("braille", "block"), default="braille")
+    p.add_argument("--width", type=int, help="Plot width in cells (default: terminal width)")
+    p.add_argument("--height", type=int, default=12, help="Plot height in cells")
+    p.add_argument("--no-color", dest="colour", action="store_false", default=None,
+                   help="Never colour the series (default: colour on a terminal)")
+    return parser
+
+
+def run_command(history, argv):
+    """Run one CLI command against an open history database."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command is None:
         # Show stats
         stats = history.get_stats()
         print("UsageBar History Statistics")
@@ -248,31 +1695,159 @@ def main():
         print(f"Providers tracked: {stats['providers_tracked']}")
         print(f"Date range: {stats['oldest_snapshot']} to {stats['newest_snapshot']}")
         print(f"Database size: {stats['db_size_bytes']:,} bytes")
-        return
-
-    command = sys.argv[1]
-
-    if command == "prune":
-        history.prune_old_data()
-        print("Pruned old data")
-    elif command == "stats":
+    elif args.command == "prune":
+        report = history.prune_old_data()
+        print(f"Pruned {report['rows']} old rows ({report['bytes']:,} bytes reclaimed)")
+    elif args.command == "retention":
+        run_retention(history, args)
+    elif args.command == "stats":
         stats = history.get_stats()
         for key, value in stats.items():
             print(f"{key}: {value}")
-    elif command == "export":
+    elif args.command == "export" and args.format in EXPORT_FORMATS:
+        unknown = set(args.fields) - set(EXPORT_FIELDS)
+        if unknown:
+            parser.error(f"unknown export fields: {', '.join(sorted(unknown))}")
+        if args.provider:
+            parser.error("use --provider with --format ndjson/csv")
+        run_export(history, args)
+    elif args.command == "export":
+        if args.since or args.until or args.providers or args.output != "-" or args.gzip:
+            parser.error("--since/--until/--provider/--output/--gzip need --format ndjson or csv")
         # Export history as JSON
-        provider_id = sys.argv[2] if len(sys.argv) > 2 else None
-        hours = int(sys.argv[3]) if len(sys.argv) > 3 else 24
-
-        if provider_id:
-            data = history.get_history(provider_id, hours)
+        if args.provider:
+            data = history.get_history(args.provider, args.hours)
         else:
+            # Latest snapshot per provider, with its burn-rate forecast
+            forecast = _load_sibling("usagebar_forecast", "usagebar-forecast.py")
             data = history.get_latest_snapshots()
+            series = history.get_series_many(list(data), hours=24, fields=forecast.SERIES_FIELDS)
+            for p_id, snapshot in data.items():
+                forecasts = forecast.forecast_provider(series[p_id])
+                snapshot['forecast'] = {window: forecast.to_dict(f) for window, f in forecasts.items()}
 
         print(json.dumps(data, indent=2))
+    elif args.command == "import":
+        run_import(history, args)
+    elif args.command == "chart":
+        print(render_chart(history, args))
+
+
+def parse_time_arg(text):
+    """
+    Parse a CLI time bound to epoch seconds.
+
+    Accepts epoch seconds, an age relative to now ('90m', '12h', '7d', '2w')
+    and ISO dates or date-times (local time unless an offset is given).
+    """
+    text = text.strip()
+    if re.fullmatch(r'\d{9,}', text):
+        return int(text)
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([mhdw])', text)
+    if match:
+        unit = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}[match.group(2)]
+        return int(time.time() - float(match.group(1)) * unit)
+    try:
+        return int(datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a date, time, epoch or age: {text!r}")
+
+
+def run_export(history, args):
+    """Stream `export --format ndjson|csv` to stdout or a file, gzip'd if asked."""
+    to_stdout = args.output == "-"
+    compress = args.gzip or args.output.endswith(".gz")
+    if to_stdout:
+        out = io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb'), encoding='utf-8',
+                               newline='') if compress else sys.stdout
+    elif compress:
+        out = gzip.open(args.output, 'wt', encoding='utf-8', newline='')
+    else:
+        out = open(args.output, 'w', encoding='utf-8', newline='')
+
+    try:
+        count = export_snapshots(history, out, args.format, args.fields, args.providers, args.since, args.until)
+        if out is sys.stdout:
+            out.flush()
+        else:
+            out.close()
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`): stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+    if not to_stdout:
+        print(f"[UsageBar] Exported {count} snapshots to {args.output}", file=sys.stderr)
+
+
+def read_export(stream, fmt):
+    """Records from an NDJSON or CSV export (binary stream, gzip detected from its header)."""
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(text)
+    else:
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+
+
+def run_import(history, args):
+    """`import FILE...`: bulk-load exports into the history database."""
+    for path in args.files:
+        fmt = args.format or ('csv' if path.endswith(('.csv', '.csv.gz')) else 'ndjson')
+        if path == "-":
+            report = history.import_snapshots(read_export(sys.stdin.buffer, fmt))
+        else:
+            with open(path, 'rb') as f:
+                report = history.import_snapshots(read_export(f, fmt))
+        existing = report['skipped_existing_bucket']
+        older = f", {existing} older than raw retention in already-filled rollup buckets" if existing else ""
+        print(f"{path}: imported {report['imported']} snapshots ({report['duplicates']} duplicates{older}, "
+              f"{report['skipped']} skipped) in {report['seconds']}s")
+
+
+def render_chart(history, args):
+    """
+    Terminal chart for `chart`: one line per provider over the window.
+
+    The storage tier is the finest one returning at most
+    CHART_POINTS_PER_COLUMN points per dot column (raw for a day, hourly
+    for a week, daily for 90 days): render_terminal_chart() keeps each
+    column's min and max, so the extra detail shows, and even long windows
+    read only a few hundred rows.
+    """
+    charts = _load_sibling("usagebar_charts", "usagebar-charts.py")
+    hours = args.days * 24 if args.days else (args.hours or 24)
+    width = args.width or max(shutil.get_terminal_size().columns - 8, 20)
+    colour = os.isatty(1) and not os.environ.get("NO_COLOR") if args.colour is None else args.colour
+    field = 'credits_remaining' if args.window == 'credits' else f"{args.window}_used"
+
+    providers = args.providers or sorted(history.get_latest_snapshots())
+    dot_columns = width * (2 if args.glyphs == 'braille' else 1)
+    tier = plan_tier(hours, max_points=dot_columns * CHART_POINTS_PER_COLUMN)
+    series = history.get_series_many(providers, hours=hours, fields=(field,), tier=tier, agg=args.agg)
+
+    end = time.time()
+    if field == 'credits_remaining':
+        values = [v for points in series.values() for _, v in points if v is not None]
+        low, high, unit = 0.0, max(values, default=1.0), ''
     else:
-        print(f"Unknown command: {command}")
-        print("Available: prune, stats, export [provider] [hours]")
+        low, high, unit = 0.0, 100.0, '%'
+
+    detail = "raw samples" if tier.name == 'raw' else f"{tier.name} {args.agg}"
+    window = f"{hours / 24:g} days" if hours >= 48 else f"{hours:g}h"
+    lines = [f"{args.window} usage, last {window} ({detail})"]
+    lines += charts.render_terminal_chart(series, end - hours * 3600, end, width=width, height=args.height,
+                                          glyphs=args.glyphs, colour=colour, low=low, high=high, unit=unit)
+    return "\n".join(lines)
+
+
+def run_retention(history, args):
+    """`retention [status]` shows the schedule and backlog; `retention run` prunes now."""
+    report = history.retention.run() if args.action == "run" else history.retention.status()
+    for key, value in report.items():
+        print(f"{key}: {value}")
 
 
 if __name__ == "__main__":
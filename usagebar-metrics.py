@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+UsageBar Refresh-Pipeline Instrumentation
+
+Timing spans, counters and histograms for the tray's refresh pipeline
+(CLI spawn and runtime, JSON parsing, history reads and writes, chart
+rendering, menu building and indicator updates), plus the logging setup
+that replaces the tray's unconditional prints.
+
+Spans are always recorded: each costs two perf_counter calls and a dict
+update under a lock. The optional MetricsServer exposes the registry in
+the Prometheus text format on a localhost port or a Unix socket:
+
+    usagebar-tray.py --metrics 127.0.0.1:9464
+    usagebar-tray.py --metrics unix:/run/user/1000/usagebar-metrics.sock
+    curl -s localhost:9464/metrics
+"""
+
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds: sub-millisecond menu diffs up to minute-long CLI runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Stages timed by span(); recorded as usagebar_stage_seconds{stage="..."}
+STAGES = ('worker_spawn', 'cli_spawn', 'cli_run', 'json_parse', 'history_write', 'history_read',
+          'chart_render', 'menu_build', 'indicator_update')
+
+# Hosts the TCP endpoint may bind to: the metrics are for this machine only
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+DEFAULT_METRICS_PORT = 9464
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LOG_FORMAT = '[UsageBar] %(message)s'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+log = logging.getLogger('usagebar.metrics')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """
+    Observations counted into fixed cumulative buckets per label set.
+
+    Each label set keeps one count per bucket plus the sum and count, so
+    memory is fixed however many observations are made.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[-1] if series else 0
+
+    def sum(self, **labels):
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[-2] if series else 0.0
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = []
+        for key, values in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets, values):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {values[-1]}")
+        return lines
+
+
+class Registry:
+    """Named metrics, rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('usagebar_stage_seconds', "Time spent in each refresh pipeline stage")
+STARTED = time.time()
+
+
+def counter(name, help_text):
+    """Counter in the default registry (created on first use)."""
+    return REGISTRY.counter(name, help_text)
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time the enclosed block as one observation of a pipeline stage.
+
+    Recorded in usagebar_stage_seconds{stage=...} with any extra labels
+    (e.g. provider) and logged at DEBUG level.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, **labels)
+
+
+def timed(stage, **labels):
+    """Decorator form of span() for a whole function or method."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def observe(stage, seconds, **labels):
+    """Record a stage duration measured elsewhere (e.g. across threads)."""
+    STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+    if log.isEnabledFor(logging.DEBUG):
+        detail = ''.join(f" {key}={value}" for key, value in sorted(labels.items()))
+        log.debug("%s%s took %.2f ms", stage, detail, seconds * 1000)
+
+
+def render():
+    """The default registry, with process uptime, in the Prometheus text format."""
+    uptime = time.time() - STARTED
+    return (REGISTRY.render()
+            + "# HELP usagebar_uptime_seconds Seconds since the tray started\n"
+            + "# TYPE usagebar_uptime_seconds gauge\n"
+            + f"usagebar_uptime_seconds {uptime:.3f}\n")
+
+
+class _LevelFormatter(logging.Formatter):
+    """'[UsageBar] message', with the level spelled out for warnings, errors and debug."""
+
+    def format(self, record):
+        text = super().format(record)
+        if record.levelno != logging.INFO:
+            text = text.replace('[UsageBar] ', f"[UsageBar] {record.levelname.capitalize()}: ", 1)
+        return text
+
+
+def setup_logging(level=None):
+    """
+    Configure the 'usagebar' loggers to write to stderr.
+
+    level: name from LOG_LEVELS; defaults to $USAGEBAR_LOG_LEVEL, then INFO.
+    Returns the effective level name.
+    """
+    if level is None:
+        level = os.environ.get('USAGEBAR_LOG_LEVEL', 'INFO').upper()
+        if level not in LOG_LEVELS:
+            level = 'INFO'  # A typo in the environment should not stop the tray
+    level = level.upper()
+    if level not in LOG_LEVELS:
+        raise ValueError(f"unknown log level {level!r} (expected one of {', '.join(LOG_LEVELS)})")
+    logger = logging.getLogger('usagebar')
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(_LevelFormatter(LOG_FORMAT))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+    return level
+
+
+def parse_endpoint(spec):
+    """
+    Parse a metrics endpoint: 'PORT', 'HOST:PORT' (loopback only) or 'unix:PATH'.
+
+    Returns ('tcp', (host, port)) or ('unix', path); raises ValueError.
+    """
+    spec = str(spec).strip()
+    if spec.startswith('unix:'):
+        path = os.path.expanduser(spec[len('unix:'):])
+        if not path:
+            raise ValueError("unix: endpoint needs a socket path")
+        return 'unix', path
+    host, _, port = spec.rpartition(':')
+    host = host.strip('[]') or '127.0.0.1'
+    if host not in LOOPBACK_HOSTS:
+        raise ValueError(f"metrics endpoint must be on localhost, not {host!r}")
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"invalid metrics port in {spec!r}") from None
+    return 'tcp', (host, port)
+
+
+def _server_classes():
+    """HTTP server classes, built on first use: http.server takes ~50 ms to import."""
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            # Unix socket peers have no (host, port) address
+            return self.client_address[0] if self.client_address else 'unix'
+
+        def log_message(self, fmt, *args):
+            log.debug("metrics %s - %s", self.address_string(), fmt % args)
+
+    class TCPServer(HTTPServer):
+        def __init__(self, address, handler):
+            self.address_family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+            super().__init__(address, handler)
+
+    class UnixServer(socketserver.UnixStreamServer):
+        def server_bind(self):
+            if os.path.exists(self.server_address):
+                os.unlink(self.server_address)  # Left behind by a previous run
+            old_umask = os.umask(0o177)  # Owner-only socket
+            try:
+                super().server_bind()
+            finally:
+                os.umask(old_umask)
+
+    return MetricsHandler, TCPServer, UnixServer
+
+
+class MetricsServer:
+    """Serve render() over HTTP on a background thread."""
+
+    def __init__(self, endpoint):
+        self.kind, self.address = parse_endpoint(endpoint)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        handler, tcp_server, unix_server = _server_classes()
+        if self.kind == 'unix':
+            self._server = unix_server(self.address, handler)
+        else:
+            self._server = tcp_server(self.address, handler)
+            self.address = self._server.server_address[:2]  # Port 0 picks a free port
+        self._thread = threading.Thread(target=self._server.serve_forever, name="usagebar-metrics",
+                                        daemon=True)
+        self._thread.start()
+        log.info("Metrics endpoint at %s", self.url)
+        return self
+
+    @property
+    def url(self):
+        if self.kind == 'unix':
+            return f"unix:{self.address}"
+        host, port = self.address
+        return f"http://[{host}]:{port}/metrics" if ':' in host else f"http://{host}:{port}/metrics"
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        if self.kind == 'unix' and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._server = None
+
+
+def main():
+    """Serve a few synthetic spans, or print them with --print."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="UsageBar metrics endpoint demo")
+    parser.add_argument('endpoint', nargs='?', default=str(DEFAULT_METRICS_PORT),
+                        help="PORT, HOST:PORT (localhost) or unix:PATH")
+    parser.add_argument('--print', action='store_true', help="print the metrics instead of serving them")
+    args = parser.parse_args()
+
+    setup_logging()
+    for stage in STAGES:
+        with span(stage):
+            time.sleep(0.001)
+    if args.print:
+        print(render(), end='')
+        return
+    server = MetricsServer(args.endpoint).start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+UsageBar Session Profiling
+
+Opt-in profiling for long-running tray sessions. When enabled (the
+"Profiling" toggle under ⚙️ Settings, the `profiling` setting or
+USAGEBAR_PROFILE=1), every Nth call of the hooked tray methods
+(trigger_refresh, on_data_ready, build_full_menu) runs under cProfile,
+and tracemalloc tracks where memory is allocated.
+
+Reports cover the time since the previous report: the sampled cProfile
+statistics per hook, the largest allocation sites and how they grew.
+Each report is a text summary plus a combined .prof file (for pstats,
+snakeviz and friends) under ~/.config/usagebar/profiles/; only the
+newest MAX_REPORTS are kept. While disabled, a hooked call costs one
+attribute check.
+"""
+
+import functools
+import io
+import os
+import time
+from datetime import datetime
+
+PROFILES_DIR = os.path.expanduser("~/.config/usagebar/profiles")
+
+# Profile one call in this many per hook
+DEFAULT_SAMPLE_EVERY = 5
+
+# Seconds between periodic reports (and tracemalloc snapshots)
+DEFAULT_REPORT_INTERVAL = 3600
+
+# Reports kept on disk (each is a .txt and a .prof file)
+MAX_REPORTS = 10
+
+# Stack depth recorded per allocation, and report sizes
+TRACEMALLOC_FRAMES = 10
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 20
+
+REPORT_PREFIX = "profile-"
+
+
+class SessionProfiler:
+    """Sampled cProfile captures per hook plus periodic tracemalloc snapshots."""
+
+    def __init__(self, directory=PROFILES_DIR, sample_every=DEFAULT_SAMPLE_EVERY, keep=MAX_REPORTS):
+        self.directory = directory
+        self.sample_every = max(int(sample_every), 1)
+        self.keep = keep
+        self.enabled = False
+        self._profiles = {}  # hook -> cProfile.Profile, reset after each report
+        self._calls = {}  # hook -> [calls, profiled, inside another capture] since the last report
+        self._active = False  # A capture is running (hooks nest: on_data_ready -> build_full_menu)
+        self._baseline = None
+        self._previous = None
+        self._since = None
+        self._own_tracing = False
+        self.started = None
+
+    def start(self):
+        """Begin sampling hooked calls and tracing allocations."""
+        if self.enabled:
+            return
+        import tracemalloc
+
+        self._own_tracing = not tracemalloc.is_tracing()
+        if self._own_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.started = self._since = time.time()
+        self._baseline = self._previous = self._memory_snapshot()
+        self.enabled = True
+
+    def stop(self):
+        """Stop profiling and drop everything collected since the last report."""
+        if not self.enabled:
+            return
+        import tracemalloc
+
+        self.enabled = False
+        if self._own_tracing:
+            tracemalloc.stop()
+        self._profiles.clear()
+        self._calls.clear()
+        self._baseline = self._previous = None
+
+    def call(self, hook, func, *args, **kwargs):
+        """Run func, under cProfile if this call is sampled."""
+        counts = self._calls.setdefault(hook, [0, 0, 0])
+        counts[0] += 1
+        if self._active:
+            counts[2] += 1  # Already covered by the enclosing hook's capture
+            return func(*args, **kwargs)
+        if (counts[0] - counts[2] - 1) % self.sample_every:
+            return func(*args, **kwargs)
+
+        profile = self._profiles.get(hook)
+        if profile is None:
+            import cProfile
+
+            profile = self._profiles[hook] = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, sys.setprofile) owns the hook
+            return func(*args, **kwargs)
+        counts[1] += 1
+        self._active = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._active = False
+
+    @staticmethod
+    def _memory_snapshot():
+        import tracemalloc
+
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def write_report(self, reason="on demand"):
+        """
+        Write a report covering the time since the previous one.
+
+        Returns the path of the text report, or None while disabled.
+        """
+        if not self.enabled:
+            return None
+        import pstats
+        import tracemalloc
+
+        now = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        base = self._report_base(now)
+        snapshot = self._memory_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        out = io.StringIO()
+        out.write("UsageBar profile report\n")
+        out.write(f"Written: {datetime.fromtimestamp(now).isoformat(timespec='seconds')} ({reason})\n")
+        out.write(f"Covers: {now - self._since:.0f} s; profiling for {now - self.started:.0f} s\n")
+        out.write(f"Sampling: 1 in {self.sample_every} calls per hook\n")
+
+        combined = None
+        for hook in sorted(self._calls):
+            calls, profiled, nested = self._calls[hook]
+            inside = f", {nested} inside another hook's capture" if nested else ""
+            out.write(f"\n== {hook}: {calls} calls, {profiled} profiled{inside} ==\n")
+            profile = self._profiles.get(hook)
+            if profile is None or not profiled:
+                continue
+            profile.create_stats()
+            stats = pstats.Stats(profile, stream=out)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            if combined is None:
+                combined = pstats.Stats(profile)
+            else:
+                combined.add(profile)
+
+        out.write(f"\n== Memory: {current / 1048576:.1f} MiB traced, peak {peak / 1048576:.1f} MiB ==\n")
+        out.write("\nLargest allocation sites:\n")
+        for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+            out.write(f"  {stat}\n")
+        for title, before in (("since the previous report", self._previous),
+                              ("since profiling started", self._baseline)):
+            out.write(f"\nGrowth {title}:\n")
+            for stat in snapshot.compare_to(before, 'lineno')[:TOP_ALLOCATIONS]:
+                if stat.size_diff > 0:
+                    out.write(f"  {stat}\n")
+
+        with open(base + ".txt", 'w') as f:
+            f.write(out.getvalue())
+        if combined is not None:
+            combined.dump_stats(base + ".prof")
+
+        # The next report starts from here
+        self._previous = snapshot
+        self._since = now
+        self._profiles.clear()
+        self._calls.clear()
+        self._rotate()
+        return base + ".txt"
+
+    def _report_base(self, now):
+        stamp = datetime.fromtimestamp(now).strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(self.directory, f"{REPORT_PREFIX}{stamp}")
+        n = 1
+        while os.path.exists(base + ".txt"):
+            n += 1
+            base = os.path.join(self.directory, f"{REPORT_PREFIX}{stamp}-{n}")
+        return base
+
+    def reports(self):
+        """Text reports on disk, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        paths = [os.path.join(self.directory, name) for name in names
+                 if name.startswith(REPORT_PREFIX) and name.endswith(".txt")]
+        return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+    def _rotate(self):
+        for path in self.reports()[:-self.keep] if self.keep else []:
+            for stale in (path, path[:-len(".txt")] + ".prof"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+
+PROFILER = SessionProfiler()
+
+
+def profiled(hook):
+    """Decorator: route calls through PROFILER while it is enabled."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            return PROFILER.call(hook, func, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def env_enabled():
+    """Whether USAGEBAR_PROFILE asks for profiling (1/true/yes/on)."""
+    return os.environ.get("USAGEBAR_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def main():
+    """List the reports on disk, or print the newest one with --latest."""
+    import sys
+
+    reports = PROFILER.reports()
+    if "--latest" in sys.argv[1:]:
+        if not reports:
+            print(f"No profile reports in {PROFILES_DIR}")
+            return 1
+        with open(reports[-1]) as f:
+            print(f.read(), end='')
+        return 0
+    for path in reports:
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
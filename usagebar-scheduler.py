@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+UsageBar Adaptive Refresh Scheduler
+
+Decides when each provider should be polled next. Providers that are
+burning quota towards a warning threshold, or are about to reset, are
+polled often; idle providers back off to the configured maximum.
+"""
+
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime
+
+# Warning thresholds in percent remaining (matches the tray's 🟢/🟡/🔴 colours)
+WARNING_THRESHOLDS = (50, 20, 0)
+
+# Default bounds, in seconds
+DEFAULT_BASE_INTERVAL = 300
+DEFAULT_MIN_INTERVAL = 60
+DEFAULT_MAX_INTERVAL = 1800
+
+# Burn rate is estimated over this much recent history
+RATE_WINDOW_SECONDS = 2 * 3600
+MIN_RATE_SPAN_SECONDS = 300
+
+# Below this burn rate (percent per hour) a provider counts as idle
+IDLE_RATE = 0.5
+
+# Poll at least this many times before a projected threshold crossing
+POLLS_BEFORE_CROSSING = 4
+
+# Within this many points of a threshold, poll at the minimum interval
+NEAR_THRESHOLD = 5
+
+# Poll this long after a reset so the new window is picked up promptly
+RESET_GRACE_SECONDS = 30
+
+# A drop of more than this many points between samples is treated as a reset
+RESET_DROP = 1.0
+
+# Samples kept per provider
+SAMPLES_KEPT = 256
+
+USAGE_WINDOWS = ('primary', 'secondary', 'tertiary')
+
+log = logging.getLogger('usagebar.scheduler')
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp (CLI 'resetsAt') or epoch number (history row) to epoch seconds."""
+    if not value:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def _used(payload, window):
+    usage = (payload or {}).get('usage') or {}
+    return (usage.get(window) or {}).get('usedPercent')
+
+
+def read_history(history, provider_ids):
+    """
+    Recent samples for AdaptiveScheduler.seed(), with one UsageHistory query.
+
+    This reads SQLite, so the tray calls it on its history thread.
+
+    Returns:
+        Dict mapping provider_id -> list of (timestamp, {window: usedPercent})
+    """
+    fields = tuple(f'{w}_used' for w in USAGE_WINDOWS)
+    series = history.get_series_many(list(provider_ids), hours=RATE_WINDOW_SECONDS // 3600,
+                                      fields=fields, tier='raw')
+    return {
+        provider_id: [(float(point[0]), dict(zip(USAGE_WINDOWS, point[1:]))) for point in points]
+        for provider_id, points in series.items()
+    }
+
+
+class AdaptiveScheduler:
+    """Per-provider poll scheduling from burn rate, reset time and threshold distance."""
+
+    def __init__(self, base_interval=DEFAULT_BASE_INTERVAL, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.base_interval = self._clamp(base_interval)
+        self._samples = {}
+        self._due = {}
+        self._failures = {}
+
+    def _clamp(self, seconds):
+        return int(min(max(seconds, self.min_interval), self.max_interval))
+
+    def _samples_for(self, provider_id):
+        """Recent (timestamp, {window: usedPercent}) samples, oldest first."""
+        samples = self._samples.get(provider_id)
+        if samples is None:
+            samples = self._samples[provider_id] = deque(maxlen=SAMPLES_KEPT)
+        return samples
+
+    def seed(self, samples):
+        """
+        Merge stored samples (see read_history) with those observed so far.
+
+        Args:
+            samples: Dict mapping provider_id -> list of (timestamp, {window: usedPercent})
+        """
+        for provider_id, stored in samples.items():
+            merged = {}
+            for ts, used in list(stored) + list(self._samples_for(provider_id)):
+                merged[ts] = used
+            self._samples[provider_id] = deque(sorted(merged.items()), maxlen=SAMPLES_KEPT)
+
+    def burn_rate(self, provider_id, window, now=None):
+        """
+        Usage growth in percent per hour for one window, or None if unknown.
+
+        Only samples since the most recent reset are considered.
+        """
+        now = now or time.time()
+        points = [(ts, used[window]) for ts, used in self._samples_for(provider_id)
+                  if ts >= now - RATE_WINDOW_SECONDS and used.get(window) is not None]
+        for i in range(len(points) - 1, 0, -1):
+            if points[i][1] < points[i - 1][1] - RESET_DROP:
+                points = points[i:]
+                break
+        if len(points) < 2 or points[-1][0] - points[0][0] < MIN_RATE_SPAN_SECONDS:
+            return None
+        return (points[-1][1] - points[0][1]) / ((points[-1][0] - points[0][0]) / 3600)
+
+    def next_interval(self, provider_id, payload, now=None):
+        """Seconds until this provider should be polled again."""
+        now = now or time.time()
+        interval = None
+
+        for window in USAGE_WINDOWS:
+            used = _used(payload, window)
+            if used is None:
+                continue
+            remaining = 100 - used
+            rate = self.burn_rate(provider_id, window, now)
+
+            # Distance (in points) to the next threshold below the current level
+            below = [t for t in WARNING_THRESHOLDS if t < remaining]
+            distance = remaining - below[0] if below else 0
+
+            if distance <= NEAR_THRESHOLD and remaining > 0:
+                candidate = self.min_interval
+            elif rate is None:
+                candidate = self.base_interval
+            elif rate < IDLE_RATE:
+                candidate = self.max_interval
+            else:
+                candidate = distance / rate * 3600 / POLLS_BEFORE_CROSSING
+
+            # Land just after the reset so the fresh window shows up quickly
+            reset_at = parse_timestamp(((payload.get('usage') or {}).get(window) or {}).get('resetsAt'))
+            if reset_at is not None:
+                until_reset = reset_at - now
+                if until_reset <= 0:
+                    candidate = self.min_interval
+                elif until_reset + RESET_GRACE_SECONDS < candidate:
+                    candidate = until_reset + RESET_GRACE_SECONDS
+
+            interval = candidate if interval is None else min(interval, candidate)
+
+        if interval is None:
+            return self.base_interval
+        return self._clamp(math.ceil(interval))
+
+    def observe(self, provider_id, payload, now=None):
+        """Record fresh data for a provider and schedule its next poll; returns the interval."""
+        now = now or time.time()
+        samples = self._samples_for(provider_id)
+        samples.append((now, {w: _used(payload, w) for w in USAGE_WINDOWS}))
+        interval = self.next_interval(provider_id, payload, now)
+        self._due[provider_id] = now + interval
+        self._failures.pop(provider_id, None)
+        return interval
+
+    def mark_failed(self, provider_id, now=None):
+        """
+        Schedule a retry for a failed provider; returns the delay.
+
+        The first retry comes after the base interval, and each further
+        consecutive failure doubles it, up to the maximum (an unconfigured
+        provider fails on every poll).
+        """
+        failures = self._failures[provider_id] = self._failures.get(provider_id, 0) + 1
+        delay = self._clamp(self.base_interval * 2 ** min(failures - 1, 16))
+        self._due[provider_id] = (now or time.time()) + delay
+        return delay
+
+    def due(self, provider_ids, now=None):
+        """Providers from provider_ids whose next poll time has passed (unknown ones are due)."""
+        now = now or time.time()
+        return [p for p in provider_ids if self._due.get(p, 0) <= now]
+
+    def seconds_until_next(self, provider_ids, now=None):
+        """Seconds until the earliest scheduled poll among provider_ids."""
+        now = now or time.time()
+        earliest = min((self._due.get(p, 0) for p in provider_ids), default=now)
+        return self._clamp(earliest - now) if earliest > now else 0
+
+
+def main():
+    """Show the schedule the tray would use for the latest stored snapshots."""
+    import importlib.util
+    import os
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location("usagebar_history", os.path.join(script_dir, "usagebar-history.py"))
+    usagebar_history = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(usagebar_history)
+
+    history = usagebar_history.UsageHistory()
+    latest = history.get_latest_snapshots()
+    scheduler = AdaptiveScheduler()
+    scheduler.seed(read_history(history, latest))
+    for provider_id, snapshot in sorted(latest.items()):
+        interval = scheduler.next_interval(provider_id, snapshot['data'])
+        rate = scheduler.burn_rate(provider_id, 'primary')
+        rate_text = f"{rate:+.1f}%/h" if rate is not None else "n/a"
+        print(f"{provider_id:<12} next poll in {interval:>5}s  (burn {rate_text})")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ to monitor usage limits across various AI providers.
 # Add script directory to path for local module imports
 import sys
 import os
+import time
+_started = time.perf_counter()
 _script_dir = os.path.dirname(os.path.abspath(__file__))
 if _script_dir not in sys.path:
     sys.path.insert(0, _script_dir)
@@ -27,40 +29,103 @@ except ValueError as e:
     sys.exit(1)
 
 from gi.repository import Gtk, AppIndicator3, GLib, Gdk, GdkPixbuf
-import subprocess
+import argparse
 import json
+import logging
 import webbrowser
 from datetime import datetime
 import threading
 import importlib.util
+from contextlib import contextmanager
+_gi_loaded = time.perf_counter()
+
+def _load_module(name, filename):
+    """Load a sibling script (hyphenated filename) as a module via importlib, once per process."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+class StartupProfile:
+    """
+    Wall-clock time of each startup phase, printed with --profile-startup.
+
+    Phases are recorded unconditionally (two perf_counter calls each) so
+    the report also covers work done before the command line is parsed.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = []  # (name, start, end) in perf_counter seconds
+        self.enabled = False
+        self.reported = False
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end=None):
+        with self._lock:
+            self.phases.append((name, start, time.perf_counter() if end is None else end))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start)
+
+    def report(self):
+        """Print the phases once, in the order they started."""
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        print("[UsageBar] Startup profile (ms; 'at' is since the tray module started loading):")
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        for name, start, end in phases:
+            print(f"[UsageBar]   {name:<28}{(end - start) * 1000:>9.1f}   at {(end - self.started) * 1000:>8.1f}")
 
-# Import history tracking using importlib (more reliable than regular imports)
-try:
-    spec = importlib.util.spec_from_file_location("usagebar_history", os.path.join(_script_dir, "usagebar-history.py"))
-    usagebar_history = importlib.util.module_from_spec(spec)
-    sys.modules["usagebar_history"] = usagebar_history
-    spec.loader.exec_module(usagebar_history)
-    UsageHistory = usagebar_history.UsageHistory
-    HISTORY_AVAILABLE = True
-    print("[UsageBar] ✓ History tracking module loaded")
-except Exception as e:
-    HISTORY_AVAILABLE = False
-    UsageHistory = None
-    print(f"[UsageBar] ✗ History tracking not available: {e}")
-
-# Import chart rendering using importlib
-try:
-    spec = importlib.util.spec_from_file_location("usagebar_charts", os.path.join(_script_dir, "usagebar-charts.py"))
-    usagebar_charts = importlib.util.module_from_spec(spec)
-    sys.modules["usagebar_charts"] = usagebar_charts
-    spec.loader.exec_module(usagebar_charts)
-    UsageChart = usagebar_charts.UsageChart
-    CHARTS_AVAILABLE = True
-    print("[UsageBar] ✓ Chart rendering module loaded")
-except Exception as e:
-    CHARTS_AVAILABLE = False
-    UsageChart = None
-    print(f"[UsageBar] ✗ Chart rendering not available: {e}")
+
+STARTUP = StartupProfile(_started)
+STARTUP.add("GI imports", _started, _gi_loaded)
+
+log = logging.getLogger('usagebar.tray')
+
+# History and chart rendering are optional and not needed until the first
+# data arrives, so they are loaded on first use (see optional_module)
+OPTIONAL_MODULES = {
+    'usagebar_history': ("usagebar-history.py", "History tracking"),
+    'usagebar_charts': ("usagebar-charts.py", "Chart rendering"),
+}
+_optional_modules = {}
+_optional_lock = threading.Lock()
+
+def optional_module(name):
+    """Load an optional sibling module on first use; None if it is not available."""
+    with _optional_lock:
+        if name not in _optional_modules:
+            filename, description = OPTIONAL_MODULES[name]
+            try:
+                with STARTUP.phase(f"load {filename}"):
+                    _optional_modules[name] = _load_module(name, filename)
+                log.debug("✓ %s module loaded", description)
+            except Exception as e:
+                _optional_modules[name] = None
+                log.warning("✗ %s not available: %s", description, e)
+        return _optional_modules[name]
+
+# Import the collector worker client, refresh scheduler and forecasting
+with STARTUP.phase("core modules"):
+    usagebar_metrics = _load_module("usagebar_metrics", "usagebar-metrics.py")
+    usagebar_collector = _load_module("usagebar_collector", "usagebar-collector.py")
+    usagebar_scheduler = _load_module("usagebar_scheduler", "usagebar-scheduler.py")
+    usagebar_forecast = _load_module("usagebar_forecast", "usagebar-forecast.py")
+    usagebar_profiler = _load_module("usagebar_profiler", "usagebar-profiler.py")
+
+REFRESHES = usagebar_metrics.counter('usagebar_refreshes_total', "Provider refreshes started")
+FETCH_ERRORS = usagebar_metrics.counter('usagebar_fetch_errors_total', "Failed provider fetches, by provider")
 
 # --- Configuration & Constants ---
 
@@ -74,28 +139,127 @@ ICONS_DIR = os.path.join(ASSETS_DIR, "icons")
 CSS_FILE = os.path.join(ASSETS_DIR, "style.css")
 
 # Provider display configuration
-# Icons and Dashboard URLs
+# Icons, Dashboard URLs and per-provider fetch timeouts (seconds)
 PROVIDER_CONFIG = {
-    'codex': {'icon': '🤖', 'name': 'Codex', 'url': 'https://platform.openai.com/usage'},
-    'claude': {'icon': '🧠', 'name': 'Claude', 'url': 'https://claude.ai'},
-    'cursor': {'icon': '⚡', 'name': 'Cursor', 'url': 'https://cursor.com'},
-    'gemini': {'icon': '💎', 'name': 'Gemini', 'url': 'https://aistudio.google.com'},
-    'zai': {'icon': '⚡', 'name': 'Z.ai', 'url': 'https://z.ai'},
-    'antigravity': {'icon': '🚀', 'name': 'Antigravity', 'url': 'https://antigravity.dev'},
-    'factory': {'icon': '🏭', 'name': 'Factory', 'url': 'https://app.factory.ai'}
+    'codex': {'icon': '🤖', 'name': 'Codex', 'url': 'https://platform.openai.com/usage', 'timeout': 60},
+    'claude': {'icon': '🧠', 'name': 'Claude', 'url': 'https://claude.ai', 'timeout': 90},
+    'cursor': {'icon': '⚡', 'name': 'Cursor', 'url': 'https://cursor.com', 'timeout': 45},
+    'gemini': {'icon': '💎', 'name': 'Gemini', 'url': 'https://aistudio.google.com', 'timeout': 60},
+    'zai': {'icon': '⚡', 'name': 'Z.ai', 'url': 'https://z.ai', 'timeout': 30},
+    'antigravity': {'icon': '🚀', 'name': 'Antigravity', 'url': 'https://antigravity.dev', 'timeout': 45},
+    'factory': {'icon': '🏭', 'name': 'Factory', 'url': 'https://app.factory.ai', 'timeout': 45}
 }
 
+# Provider submenu rows drawn as Gtk.ImageMenuItem (Cairo chart pixbufs)
+CHART_ROWS = ('trend', 'weekly-trend')
+
+# Stored snapshots older than this are not shown at startup (seconds)
+WARM_START_MAX_AGE = 7 * 24 * 3600
+
+
+def cached_payload(payload, now=None):
+    """
+    Copy of a stored provider payload for display before it is revalidated.
+
+    Relative reset descriptions ("in 3 hours") were true when the snapshot
+    was saved; where resetsAt is known they are recomputed from now.
+    """
+    now = time.time() if now is None else now
+    payload = dict(payload)
+    usage = dict(payload.get('usage') or {})
+    for window in usagebar_forecast.USAGE_WINDOWS:
+        limit = usage.get(window)
+        if not isinstance(limit, dict):
+            continue
+        resets_at = usagebar_forecast.parse_timestamp(limit.get('resetsAt'))
+        if resets_at is not None:
+            limit = dict(limit)
+            if resets_at > now:
+                limit['resetDescription'] = f"in {usagebar_forecast.format_duration(resets_at - now)}"
+            else:
+                limit['resetDescription'] = "reset since this was saved"
+            usage[window] = limit
+    payload['usage'] = usage
+    return payload
+
+
 # providers that are considered "critical" for the tray icon label
 PRIMARY_PROVIDERS = ['codex', 'claude', 'gemini', 'zai']
 
+class RetainedMenu:
+    """
+    A Gtk.Menu whose items are keyed by row, so refreshes update in place.
+
+    sync() takes the desired rows in order and only touches what differs:
+    changed labels/tooltips are set on the existing widgets, new rows are
+    inserted, stale rows removed and moved rows reordered. The factory
+    creates the widget for a new row: factory(key, label) -> Gtk.MenuItem.
+    Rows may carry a pixbuf as a fourth element (for Gtk.ImageMenuItem
+    rows); it is only re-set when a different pixbuf object is passed.
+    """
+
+    def __init__(self, factory):
+        self.menu = Gtk.Menu()
+        self.factory = factory
+        self.items = {}
+        self.images = {}
+        self.order = []
+
+    def sync(self, rows):
+        """
+        Update the menu to match rows.
+
+        Args:
+            rows: List of (key, label, tooltip[, pixbuf]); label None means a separator
+        """
+        wanted = [row[0] for row in rows]
+        for key in set(self.order) - set(wanted):
+            widget = self.items.pop(key)
+            self.images.pop(key, None)
+            self.menu.remove(widget)
+            widget.destroy()
+            self.order.remove(key)
+
+        for position, (key, label, tooltip, *image) in enumerate(rows):
+            pixbuf = image[0] if image else None
+            widget = self.items.get(key)
+            if widget is None:
+                widget = self.factory(key, label)
+                if tooltip:
+                    widget.set_tooltip_text(tooltip)
+                self._set_image(key, widget, pixbuf)
+                self.menu.insert(widget, position)
+                widget.show_all()
+                self.items[key] = widget
+                self.order.insert(position, key)
+                continue
+
+            self._set_image(key, widget, pixbuf)
+            if label is not None and widget.get_label() != label:
+                widget.set_label(label)
+            if tooltip is not None and widget.get_tooltip_text() != tooltip:
+                widget.set_tooltip_text(tooltip)
+            if self.order[position] != key:
+                self.menu.reorder_child(widget, position)
+                self.order.remove(key)
+                self.order.insert(position, key)
+
+    def _set_image(self, key, widget, pixbuf):
+        if self.images.get(key) is pixbuf:
+            return
+        widget.set_image(Gtk.Image.new_from_pixbuf(pixbuf) if pixbuf is not None else None)
+        self.images[key] = pixbuf
+
+
 class UsageBarTray:
     """The main application class for the UsageBar system tray."""
 
     def __init__(self):
-        print("[UsageBar] Initializing system tray application...")
+        log.info("Initializing system tray application...")
 
         # Load custom CSS styling
-        self.load_css()
+        with STARTUP.phase("CSS"):
+            self.load_css()
 
         # Initialize the AppIndicator
         # Try to use custom icon, fallback to system icon
@@ -104,62 +268,221 @@ class UsageBarTray:
             icon_name = icon_path
         else:
             icon_name = "utilities-system-monitor"
-            print(f"[UsageBar] Warning: Custom icon not found, using system icon")
-
-        self.indicator = AppIndicator3.Indicator.new(
-            "usagebar-tray",
-            icon_name,
-            AppIndicator3.IndicatorCategory.APPLICATION_STATUS
-        )
-        self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
-        self.indicator.set_label("⏳", "")
+            log.warning("Custom icon not found, using system icon")
+
+        with STARTUP.phase("indicator"):
+            self.indicator = AppIndicator3.Indicator.new(
+                "usagebar-tray",
+                icon_name,
+                AppIndicator3.IndicatorCategory.APPLICATION_STATUS
+            )
+            self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
+            self.indicator_label = None
+            self.set_indicator_label("⏳")
+
+        # Retained main menu (created on first build) and the menu shown by the indicator
+        self.main_menu = None
+        self.provider_menus = {}
+        self.attached_menu = None
 
         self.provider_data = []
         self.last_refresh = None
         self.is_refreshing = False
 
-        # Initialize history tracking
-        if HISTORY_AVAILABLE:
-            try:
-                self.history = UsageHistory()
-                print("[UsageBar] History tracking enabled")
-            except Exception as e:
-                print(f"[UsageBar] Warning: Could not initialize history: {e}")
-                self.history = None
-        else:
-            self.history = None
+        # Long-lived collector process (started lazily on first refresh)
+        self.collector = usagebar_collector.CollectorClient()
+        # In-process fan-out used when the collector worker is unavailable
+        self.fanout = None
+
+        # History tracking is opened off the main thread once the main loop runs
+        # (see start_history); snapshots are written by a background thread
+        self.history = None
+        self.history_writer = None
+        self.pending_snapshots = []  # Fetched before the database was open
+        # Providers shown from stored snapshots until fresh data arrives: id -> saved epoch
+        self.cached_at = {}
+        self.refresh_error = None
+        # Last fetch failure per provider, shown in its rows until it refreshes
+        self.provider_errors = {}
+        # Results handed over by the fetch thread, applied in one idle callback
+        self.incoming = []
+        self.incoming_errors = {}
+        self.incoming_scheduled = False
+        self.incoming_lock = threading.Lock()
+        self.metrics_server = None
+        self.profile_timer = None
+        self.dump_profile_item = None
+        self.startup_pending = {'history', 'first menu'}
+
+        # Rendered chart pixbufs, redrawn only when their series or the theme
+        # changes (created with the first chart)
+        self.chart_cache = None
 
         # Load user settings or set defaults
         self.load_settings()
 
+        # Opt-in session profiling (⚙️ Settings, or USAGEBAR_PROFILE=1 for this run only)
+        if self.profiling or usagebar_profiler.env_enabled():
+            self.start_profiling()
+
+        # Per-provider poll times; the next refresh is armed after each one finishes
+        self.scheduler = usagebar_scheduler.AdaptiveScheduler(
+            base_interval=self.refresh_interval,
+            min_interval=self.min_refresh_interval,
+            max_interval=self.max_refresh_interval
+        )
+        self.schedule_timer = None
+
         # Set the initial menu state
-        self.set_loading_menu()
+        with STARTUP.phase("loading menu"):
+            self.set_loading_menu()
 
-        # Trigger the first data fetch
+        # Open the history database and trigger the first data fetch once the icon is up
+        GLib.idle_add(self.start_history)
         GLib.timeout_add(500, self.trigger_refresh)
 
-        # Schedule periodic background refreshes
-        GLib.timeout_add_seconds(self.refresh_interval, self.trigger_refresh_loop)
+        log.info("Initialization complete.")
+
+    def start_history(self):
+        """
+        Idle callback: open the history database on a background thread.
+
+        Schema creation and migrations can take a while on a large database,
+        so they run after the main loop is up and never delay the tray icon.
+        Everything the main thread needs from SQLite is read here too.
+        """
+        STARTUP.add("main loop running", _started, time.perf_counter())
+
+        def open_in_background():
+            history = self.open_history()
+            cached, seeds = {}, {}
+            if history is not None:
+                cached = self.load_cached_snapshots(history)
+                seeds = self.load_scheduler_history(history)
+                # This thread is done with SQLite; release its connection
+                history.close_thread()
+            GLib.idle_add(self.attach_history, history, cached, seeds)
+
+        threading.Thread(target=open_in_background, name="usagebar-history-open", daemon=True).start()
+        return False
+
+    def open_history(self):
+        """
+        Load the history module, open the database and warm its series cache.
+
+        Returns None if history is unavailable. The menu reads series only
+        from the warmed cache (see build_full_menu), never from SQLite.
+        """
+        history_module = optional_module('usagebar_history')
+        if history_module is None:
+            return None
+        try:
+            with STARTUP.phase("DB init"):
+                history = history_module.UsageHistory()
+        except Exception as e:
+            log.warning("Could not initialize history: %s", e)
+            return None
+        try:
+            with STARTUP.phase("history cache"), usagebar_metrics.span('history_read', query='warm'):
+                history.warm_cache()
+        except Exception as e:
+            log.warning("Could not load recent history: %s", e)
+        return history
+
+    def load_cached_snapshots(self, history, now=None):
+        """
+        Latest stored snapshot per provider, as {provider_id: (epoch seconds, payload)}.
 
-        print("[UsageBar] Initialization complete.")
+        Snapshots older than WARM_START_MAX_AGE are left out.
+        """
+        now = time.time() if now is None else now
+        cached = {}
+        try:
+            with STARTUP.phase("cached snapshots"), usagebar_metrics.span('history_read', query='latest'):
+                latest = history.get_latest_snapshots()
+        except Exception as e:
+            log.warning("Could not read stored snapshots: %s", e)
+            return cached
+        for p_id, snapshot in latest.items():
+            saved_at = usagebar_forecast.parse_timestamp(snapshot['timestamp'])
+            if saved_at is not None and now - saved_at <= WARM_START_MAX_AGE:
+                cached[p_id] = (saved_at, snapshot['data'])
+        return cached
+
+    def load_scheduler_history(self, history):
+        """Recent samples to seed the refresh scheduler with (see AdaptiveScheduler.seed)."""
+        try:
+            with usagebar_metrics.span('history_read', query='scheduler'):
+                return usagebar_scheduler.read_history(history, list(PROVIDER_CONFIG))
+        except Exception as e:
+            log.warning("Could not read history for the refresh scheduler: %s", e)
+            return {}
+
+    def attach_history(self, history, cached=None, seeds=None):
+        """
+        Main thread: start using an opened UsageHistory (see open_history).
+
+        cached holds the latest stored snapshots (see load_cached_snapshots);
+        providers with no fresh data yet are shown from them, marked with
+        their age, until the refresh in flight replaces them. seeds are the
+        scheduler's recent samples (see load_scheduler_history).
+        """
+        pending, self.pending_snapshots = self.pending_snapshots, None
+        if history is not None and self.history is None:
+            self.history = history
+            self.history_writer = optional_module('usagebar_history').SnapshotWriter(history)
+            self.history_writer.start()
+            for data in pending or ():
+                self.history_writer.submit(data)
+            self.scheduler.seed(seeds or {})
+            log.info("History tracking enabled")
+
+            shown = {p.get('provider', '?').lower() for p in self.provider_data}
+            for p_id, (saved_at, payload) in (cached or {}).items():
+                if p_id not in shown:
+                    self.cached_at[p_id] = saved_at
+                    self.provider_data.append(cached_payload(payload))
+            if self.cached_at:
+                log.info("Showing stored data for %d providers until refreshed", len(self.cached_at))
+
+            # Data that arrived first is shown again with its sparklines and forecasts
+            if self.provider_data:
+                with STARTUP.phase("cached menu" if self.cached_at else "history menu"):
+                    self.build_full_menu()
+        self.startup_done('history')
+        return False
 
     def load_settings(self):
         """Load settings from the local config file."""
         self.refresh_interval = 300 # Default: 5 minutes
+        self.min_refresh_interval = 60
+        self.max_refresh_interval = 1800
+        self.adaptive_refresh = True
         self.show_details = False
+        self.use_collector = True
+        self.metrics_endpoint = None
+        self.profiling = False
+        self.profile_interval = usagebar_profiler.DEFAULT_REPORT_INTERVAL
         try:
             if os.path.exists(SETTINGS_FILE):
                 with open(SETTINGS_FILE, 'r') as f:
                     s = json.load(f)
                     self.refresh_interval = s.get('refresh_interval', 300)
+                    self.min_refresh_interval = s.get('min_refresh_interval', 60)
+                    self.max_refresh_interval = s.get('max_refresh_interval', 1800)
+                    self.adaptive_refresh = s.get('adaptive_refresh', True)
                     self.show_details = s.get('show_details', False)
+                    self.use_collector = s.get('use_collector', True)
+                    self.metrics_endpoint = s.get('metrics_endpoint')
+                    self.profiling = s.get('profiling', False)
+                    self.profile_interval = s.get('profile_interval', usagebar_profiler.DEFAULT_REPORT_INTERVAL)
         except Exception as e:
-            print(f"[UsageBar] Warning: Failed to load settings: {e}")
+            log.warning("Failed to load settings: %s", e)
 
     def load_css(self):
         """Apply custom CSS styling to the application with theme detection."""
         if not os.path.exists(CSS_FILE):
-            print(f"[UsageBar] CSS file not found at {CSS_FILE}, using default styling")
+            log.info("CSS file not found at %s, using default styling", CSS_FILE)
             return
 
         try:
@@ -182,9 +505,9 @@ class UsageBarTray:
                 )
 
                 theme_name = "dark" if is_dark else "light"
-                print(f"[UsageBar] Custom CSS loaded from {CSS_FILE} ({theme_name} theme)")
+                log.debug("Custom CSS loaded from %s (%s theme)", CSS_FILE, theme_name)
         except Exception as e:
-            print(f"[UsageBar] Warning: Failed to load CSS: {e}")
+            log.warning("Failed to load CSS: %s", e)
 
     def detect_system_theme(self):
         """Detect if system is using dark theme."""
@@ -201,81 +524,203 @@ class UsageBarTray:
             with open(SETTINGS_FILE, 'w') as f:
                 json.dump({
                     'refresh_interval': self.refresh_interval,
-                    'show_details': self.show_details
+                    'min_refresh_interval': self.min_refresh_interval,
+                    'max_refresh_interval': self.max_refresh_interval,
+                    'adaptive_refresh': self.adaptive_refresh,
+                    'show_details': self.show_details,
+                    'use_collector': self.use_collector,
+                    'metrics_endpoint': self.metrics_endpoint,
+                    'profiling': self.profiling,
+                    'profile_interval': self.profile_interval
                 }, f)
         except Exception as e:
-            print(f"[UsageBar] Error: Failed to save settings: {e}")
+            log.error("Failed to save settings: %s", e)
+
+    def schedule_next_refresh(self):
+        """Arm the timer for the next scheduled refresh, replacing any pending one."""
+        if self.schedule_timer:
+            GLib.source_remove(self.schedule_timer)
+        if self.adaptive_refresh:
+            delay = self.scheduler.seconds_until_next(list(PROVIDER_CONFIG))
+        else:
+            delay = self.refresh_interval
+        self.schedule_timer = GLib.timeout_add_seconds(max(delay, 1), self.on_schedule_tick)
+        return False
 
-    def trigger_refresh_loop(self):
-        """Callback for periodic status updates."""
-        self.trigger_refresh()
-        return True # Keep the timer running
+    def on_schedule_tick(self):
+        """Timer callback: refresh the providers that are due."""
+        self.schedule_timer = None
+        if self.adaptive_refresh:
+            due = self.scheduler.due(list(PROVIDER_CONFIG))
+        else:
+            due = list(PROVIDER_CONFIG)
+        if due:
+            self.trigger_refresh(due)
+        else:
+            self.schedule_next_refresh()
+        return False
 
-    def trigger_refresh(self):
-        """Asynchronously trigger a refresh of usage data."""
+    @usagebar_profiler.profiled('trigger_refresh')
+    def trigger_refresh(self, providers=None):
+        """Asynchronously trigger a refresh of usage data (all providers by default)."""
         if self.is_refreshing:
             return False
             
         self.is_refreshing = True
         # Set loading icon in tray
         if not self.last_refresh:
-            self.indicator.set_label("⏳", "")
+            self.set_indicator_label("⏳")
         
         # Run the CLI in a separate thread to keep UI responsive
-        thread = threading.Thread(target=self.fetch_all_data_thread, daemon=True)
+        thread = threading.Thread(target=self.fetch_all_data_thread, args=(providers,), daemon=True)
         thread.start()
         return False
 
-    def fetch_all_data_thread(self):
-        """Background thread logic for calling the Swift CLI."""
+    def fetch_all_data_thread(self, providers=None):
+        """Background thread logic: fetch providers concurrently via the Swift CLI."""
+        providers = list(providers or PROVIDER_CONFIG)
+        timeouts = {p_id: config['timeout'] for p_id, config in PROVIDER_CONFIG.items()}
+        received = set()
+        errors = {}
+        REFRESHES.inc()
+        started = time.perf_counter()
+
+        def on_provider(payload):
+            p_id = payload.get('provider', '?').lower()
+            received.add(p_id)
+            # Time from the refresh request until this provider's data was decoded
+            usagebar_metrics.observe('cli_run', time.perf_counter() - started, provider=p_id)
+            # Hand each provider to the main GTK thread as soon as it arrives
+            self.queue_result(payload=payload)
+
+        def on_provider_error(p_id, msg):
+            errors[p_id] = msg
+            FETCH_ERRORS.inc(provider=p_id)
+            log.warning("%s: fetch failed: %s", p_id, msg)
+            self.queue_result(p_id=p_id, error=msg)
+
         try:
-            # Call the 'usagebar' CLI (must be in system PATH)
-            cmd = ["usagebar", "usage", "--provider", "all", "--format", "json"]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-            
-            # Parse the JSON output from the CLI
-            data = None
-            for line in result.stdout.split('\n'):
-                line = line.strip()
-                if line.startswith('['):
-                    try:
-                        data = json.loads(line)
-                        break
-                    except json.JSONDecodeError:
-                        continue
-            
-            if data:
-                # Update UI on the main GTK thread
-                GLib.idle_add(self.on_data_ready, data)
-            else:
-                GLib.idle_add(self.on_error, "CLI returned no data")
-                
+            if self.use_collector:
+                try:
+                    self.collector.refresh(providers, timeouts=timeouts,
+                                           on_provider=on_provider, on_error=on_provider_error)
+                    providers = []
+                except Exception as e:
+                    log.warning("Collector worker failed, spawning CLI directly: %s", e)
+                    providers = [p for p in providers if p not in received]
+
+            if providers:
+                # In-process fallback ('usagebar' must be in system PATH)
+                self.fanout = usagebar_collector.FanoutFetch(providers, timeouts=timeouts)
+                self.fanout.run(lambda p_id, payload: on_provider(payload), on_provider_error)
+
+            if not received:
+                msg = next(iter(errors.values()), "CLI returned no data")
+                GLib.idle_add(self.on_error, msg)
+
         except Exception as e:
-            print(f"[UsageBar] Data fetch error: {e}")
-            GLib.idle_add(self.on_error, str(e))
+            log.error("Data fetch error: %s", e)
+            if not received:
+                GLib.idle_add(self.on_error, str(e))
         finally:
+            self.fanout = None
             self.is_refreshing = False
+            GLib.idle_add(self.schedule_next_refresh)
+
+    def queue_result(self, payload=None, p_id=None, error=None):
+        """
+        Fetch thread: queue a provider's data or error for the main thread.
 
+        Results that arrive before the main loop gets to them are applied
+        together by one idle callback (flush_results), so a burst of
+        providers costs one menu rebuild rather than one each.
+        """
+        with self.incoming_lock:
+            if payload is not None:
+                self.incoming.append(payload)
+            else:
+                self.incoming_errors[p_id] = error
+            if self.incoming_scheduled:
+                return
+            self.incoming_scheduled = True
+        GLib.idle_add(self.flush_results)
+
+    def flush_results(self):
+        """Main thread: apply every queued fetch result with a single menu rebuild."""
+        with self.incoming_lock:
+            data, self.incoming = self.incoming, []
+            errors, self.incoming_errors = self.incoming_errors, {}
+            self.incoming_scheduled = False
+        for p_id, msg in errors.items():
+            self.on_provider_error(p_id, msg, rebuild=False)
+        if data:
+            self.on_data_ready(data)
+        elif any(p.get('provider', '?').lower() in errors for p in self.provider_data):
+            self.build_full_menu()
+        return False
+
+    def cancel_refresh(self):
+        """Cancel the refresh in flight: pending provider fetches are abandoned."""
+        self.collector.cancel()
+        if self.fanout:
+            self.fanout.cancel()
+
+    @usagebar_profiler.profiled('on_data_ready')
     def on_data_ready(self, data):
-        """Main thread callback for successful data fetch."""
-        self.provider_data = data
+        """Main thread callback for fresh provider data (one or more providers)."""
+        fresh = {p.get('provider', '?').lower(): p for p in data}
+        self.provider_data = [
+            p for p in self.provider_data if p.get('provider', '?').lower() not in fresh
+        ] + list(fresh.values())
         self.last_refresh = datetime.now()
+        self.refresh_error = None
+
+        for p_id, payload in fresh.items():
+            self.cached_at.pop(p_id, None)
+            self.provider_errors.pop(p_id, None)
+            self.scheduler.observe(p_id, payload)
+
+        # Save to history (queued; the writer thread does the SQLite work)
+        if self.history_writer:
+            self.history_writer.submit(data)
+        elif self.pending_snapshots is not None:
+            self.pending_snapshots.append(data)
+
+        if 'first menu' in self.startup_pending:
+            with STARTUP.phase("first menu"):
+                self.build_full_menu()
+            self.startup_done('first menu')
+        else:
+            self.build_full_menu()
+        return False
 
-        # Save to history
-        if self.history:
-            try:
-                self.history.save_snapshot(data)
-            except Exception as e:
-                print(f"[UsageBar] Warning: Failed to save history: {e}")
-
-        self.build_full_menu()
+    def on_provider_error(self, p_id, msg, rebuild=True):
+        """Main thread callback for one provider's failed fetch: back off and mark its rows."""
+        self.scheduler.mark_failed(p_id)
+        self.provider_errors[p_id] = msg
+        if rebuild and any(p.get('provider', '?').lower() == p_id for p in self.provider_data):
+            self.build_full_menu()
         return False
 
     def on_error(self, msg):
-        """Main thread callback for data fetch failures."""
-        self.build_error_menu(msg)
+        """Main thread callback for a refresh that returned no data at all."""
+        if self.provider_data:
+            # Keep the menu: failed providers are marked in their own rows, and
+            # stored data still waiting for a first refresh is labelled as such
+            if self.last_refresh is None:
+                self.refresh_error = msg
+            self.build_full_menu()
+        else:
+            self.build_error_menu(msg)
+        self.startup_done('first menu')
         return False
 
+    def startup_done(self, step):
+        """Mark a startup step finished; the --profile-startup report follows the last one."""
+        self.startup_pending.discard(step)
+        if not self.startup_pending:
+            STARTUP.report()
+
     def set_loading_menu(self):
         """Build the initial 'Loading' menu."""
         menu = Gtk.Menu()
@@ -294,7 +739,21 @@ class UsageBarTray:
         menu.append(quit_item)
         
         menu.show_all()
-        self.indicator.set_menu(menu)
+        self.attach_menu(menu)
+
+    def attach_menu(self, menu):
+        """Hand a menu to the indicator (re-exports its whole layout over DBus)."""
+        if self.attached_menu is not menu:
+            with usagebar_metrics.span('indicator_update', call='set_menu'):
+                self.indicator.set_menu(menu)
+            self.attached_menu = menu
+
+    def set_indicator_label(self, label):
+        """Update the tray label, skipping the DBus round trip if unchanged."""
+        if label != self.indicator_label:
+            with usagebar_metrics.span('indicator_update', call='set_label'):
+                self.indicator.set_label(label, "")
+            self.indicator_label = label
 
     def make_progress_bar(self, percent_remaining, width=20):
         """
@@ -349,14 +808,234 @@ class UsageBarTray:
         menu.append(quit_item)
         
         menu.show_all()
-        self.indicator.set_menu(menu)
-        self.indicator.set_label("⚠️", "")
+        self.attach_menu(menu)
+        self.set_indicator_label("⚠️")
+
+    def create_main_menu(self):
+        """Create the retained main menu; provider rows are filled in by build_full_menu."""
+        def make_item(key, label):
+            if label is None:
+                return Gtk.SeparatorMenuItem()
+            item = Gtk.MenuItem(label=label)
+            if key.startswith('provider:'):
+                p_id = key.split(':', 1)[1]
+                submenu = RetainedMenu(lambda k, l, p_id=p_id: self.make_provider_row(p_id, k, l))
+                self.provider_menus[p_id] = submenu
+                item.set_submenu(submenu.menu)
+            elif key == 'refresh':
+                item.connect("activate", lambda w: self.trigger_refresh())
+            elif key == 'quit':
+                item.connect("activate", lambda w: Gtk.main_quit())
+            elif key == 'settings':
+                item.set_submenu(self.make_settings_menu())
+            else:
+                item.set_sensitive(False)
+            return item
+
+        self.provider_menus = {}
+        self.main_menu = RetainedMenu(make_item)
+
+    def make_provider_row(self, p_id, key, label):
+        """Create the widget for a new row in a provider submenu."""
+        if label is None:
+            return Gtk.SeparatorMenuItem()
+        if key in CHART_ROWS:
+            item = Gtk.ImageMenuItem(label=label)
+            item.set_always_show_image(True)
+        else:
+            item = Gtk.MenuItem(label=label)
+        if key == 'dashboard':
+            dashboard_url = PROVIDER_CONFIG[p_id]['url']
+            item.connect("activate", lambda w, url=dashboard_url: webbrowser.open(url))
+        else:
+            item.set_sensitive(False)
+        return item
+
+    def make_settings_menu(self):
+        """Build the Settings submenu (its items hold their own state)."""
+        settings_menu = Gtk.Menu()
+
+        detail_item = Gtk.CheckMenuItem(label="Show Technical Details")
+        detail_item.set_active(self.show_details)
+        detail_item.connect("toggled", self.on_detail_toggled)
+        settings_menu.append(detail_item)
+
+        adaptive_item = Gtk.CheckMenuItem(label="Adaptive Refresh")
+        adaptive_item.set_active(self.adaptive_refresh)
+        adaptive_item.connect("toggled", self.on_adaptive_toggled)
+        settings_menu.append(adaptive_item)
+
+        settings_menu.append(Gtk.SeparatorMenuItem())
+        profiling_item = Gtk.CheckMenuItem(label="Profiling")
+        profiling_item.set_active(usagebar_profiler.PROFILER.enabled)
+        profiling_item.connect("toggled", self.on_profiling_toggled)
+        settings_menu.append(profiling_item)
+
+        self.dump_profile_item = Gtk.MenuItem(label="📄 Dump Profile Now")
+        self.dump_profile_item.set_sensitive(usagebar_profiler.PROFILER.enabled)
+        self.dump_profile_item.connect("activate", lambda w: self.dump_profile())
+        settings_menu.append(self.dump_profile_item)
+
+        return settings_menu
+
+    def chart_image(self, p_id, kind, values):
+        """
+        Cairo-rendered chart pixbuf for a provider submenu, or None without Cairo.
+
+        kind is 'sparkline' or 'area'. Pixbufs come from the chart cache, so
+        an unchanged series returns the same object and the row is left alone.
+        """
+        usagebar_charts = optional_module('usagebar_charts')
+        if usagebar_charts is None or not usagebar_charts.CAIRO_AVAILABLE:
+            return None
+        if self.chart_cache is None:
+            self.chart_cache = usagebar_charts.ChartCache()
+        render, (width, height) = {
+            'sparkline': (usagebar_charts.render_sparkline_surface, usagebar_charts.SPARKLINE_SIZE),
+            'area': (usagebar_charts.render_area_surface, usagebar_charts.AREA_CHART_SIZE),
+        }[kind]
+
+        def draw(values, theme):
+            with usagebar_metrics.span('chart_render', kind=kind):
+                surface = render(values, width, height, theme)
+                return Gdk.pixbuf_get_from_surface(surface, 0, 0, width, height)
+
+        theme = 'dark' if self.detect_system_theme() else 'light'
+        try:
+            return self.chart_cache.get(p_id, kind, values, theme, draw)
+        except Exception as e:
+            log.warning("Could not render %s for %s: %s", kind, p_id, e)
+            return None
+
+    def provider_rows(self, p_id, p_data, config, history=None):
+        """
+        Rows for one provider's submenu, as (key, label, tooltip) tuples.
+
+        history is the provider's last 24h series as tuples of
+        (timestamp, *usagebar_forecast.SERIES_FIELDS), or None when history
+        tracking is unavailable.
+        """
+        rows = []
+        forecasts = usagebar_forecast.forecast_provider(history or [], p_data)
+        usage = p_data.get('usage', {})
+        primary = usage.get('primary', {})
+        p_rem = 100 - primary.get('usedPercent', 0)
+
+        # Account details
+        if usage.get('accountEmail'):
+            rows.append(('account', f"📧 {usage.get('accountEmail')}", None))
+            rows.append(('sep-account', None, None))
+
+        # Primary (Session) Usage
+        rows.append(('session', f"Session: {self.make_progress_bar(p_rem)}", None))
+
+        # Add sparkline if we have history
+        usagebar_charts = optional_module('usagebar_charts') if history is not None else None
+        if usagebar_charts is not None:
+            try:
+                log.debug("Provider %s, history count: %d", p_id, len(history))
+                if len(history) >= 2:
+                    trend = usagebar_charts.UsageChart.calculate_trend(history)
+                    image = self.chart_image(p_id, 'sparkline', [point[1] for point in history])
+
+                    # Format trend info
+                    if trend['direction'] == 'up':
+                        trend_icon = '📈'
+                    elif trend['direction'] == 'down':
+                        trend_icon = '📉'
+                    else:
+                        trend_icon = '➡️'
+
+                    if image is not None:
+                        trend_label = f"24h {trend_icon} {trend['change']:+.0f}%"
+                    else:
+                        sparkline = usagebar_charts.UsageChart.render_sparkline_text(history, width=20)
+                        trend_label = f"24h: {sparkline} {trend_icon} {trend['change']:+.0f}%"
+                    log.debug("Adding trend line: %s", trend_label)
+                    rows.append(('trend', trend_label, None, image))
+                else:
+                    # Not enough history yet
+                    log.debug("Not enough history (%d snapshots)", len(history))
+                    if len(history) == 1:
+                        msg = "⏳ Collecting usage data (refreshing...)"
+                    else:
+                        msg = "⏳ Building usage history..."
+                    rows.append(('trend', msg, None))
+            except Exception as e:
+                log.warning("Could not render chart: %s", e, exc_info=True)
+
+        forecast_label = usagebar_forecast.describe(forecasts.get('primary'))
+        if forecast_label:
+            rows.append(('forecast', f"    {forecast_label}", None))
+
+        if primary.get('resetDescription'):
+            # Detail Mode: show specific timestamp
+            reset_text = f"⏰ {primary.get('resetDescription')}"
+            if self.show_details and primary.get('resetsAt'):
+                reset_text += f" ({primary.get('resetsAt')})"
+            rows.append(('reset', f"    {reset_text}", None))
+
+        # Secondary (Weekly) Usage
+        secondary = usage.get('secondary')
+        if secondary:
+            sec_rem = 100 - secondary.get('usedPercent', 0)
+            rows.append(('weekly', f"Weekly:  {self.make_progress_bar(sec_rem)}", None))
+            if usagebar_charts is not None and len(history) >= 2:
+                image = self.chart_image(p_id, 'area', [point[3] for point in history])
+                if image is not None:
+                    rows.append(('weekly-trend', "    24h", None, image))
+            if secondary.get('resetDescription'):
+                rows.append(('weekly-reset', f"    ⏰ {secondary.get('resetDescription')}", None))
+            forecast_label = usagebar_forecast.describe(forecasts.get('secondary'))
+            if forecast_label:
+                rows.append(('weekly-forecast', f"    {forecast_label}", None))
+
+        # Tertiary (Specific Model) Usage
+        tertiary = usage.get('tertiary')
+        if tertiary:
+            tert_rem = 100 - tertiary.get('usedPercent', 0)
+            label = "Sonnet:" if p_id == 'claude' else "Other:"
+            rows.append(('tertiary', f"{label}   {self.make_progress_bar(tert_rem)}", None))
+            forecast_label = usagebar_forecast.describe(forecasts.get('tertiary'))
+            if forecast_label:
+                rows.append(('tertiary-forecast', f"    {forecast_label}", None))
+
+        # Credit Balance
+        creds = p_data.get('credits', {})
+        if creds and creds.get('remaining') is not None:
+            rows.append(('sep-credits', None, None))
+            rows.append(('credits', f"💰 ${creds.get('remaining'):.2f} remaining", None))
+
+        # Technical details (Version, etc.)
+        if self.show_details and p_data.get('version'):
+            rows.append(('sep-version', None, None))
+            rows.append(('version', f"🏷 Version: {p_data.get('version')}", None))
+
+        # Dashboard Link
+        if config.get('url'):
+            rows.append(('sep-dashboard', None, None))
+            rows.append(('dashboard', f"🌐 Open {config['name']} Dashboard", None))
+
+        return rows
+
+    @usagebar_profiler.profiled('build_full_menu')
+    @usagebar_metrics.timed('menu_build')
+    def build_full_menu(self, rebuild=False):
+        """
+        Bring the rich, expandable main menu up to date with provider data.
+
+        The menu is retained between refreshes: only rows whose label or
+        tooltip changed are touched, and the indicator only re-exports the
+        menu when it is first attached. Pass rebuild=True to start from scratch.
+        """
+        if rebuild or self.main_menu is None:
+            self.create_main_menu()
 
-    def build_full_menu(self):
-        """Build the rich, expandable main menu from provider data with modern UI."""
-        menu = Gtk.Menu()
         lowest_primary = 100
         critical_id = None
+        rows = []
+        submenus = {}
+        now = time.time()
 
         # Sort providers by usage (highest used first)
         sorted_data = sorted(
@@ -365,6 +1044,19 @@ class UsageBarTray:
             reverse=True
         )
 
+        # Sparklines and forecasts come from the in-memory series cache, warmed
+        # on the history thread: building the menu never waits on SQLite
+        histories = {}
+        if self.history:
+            try:
+                with usagebar_metrics.span('history_read', query='series'):
+                    histories = self.history.cached_series_many(
+                        [p.get('provider', '?').lower() for p in sorted_data], hours=24,
+                        fields=usagebar_forecast.SERIES_FIELDS
+                    )
+            except Exception as e:
+                log.warning("Could not load history: %s", e)
+
         for p_data in sorted_data:
             p_id = p_data.get('provider', '?').lower()
             usage = p_data.get('usage', {})
@@ -379,175 +1071,70 @@ class UsageBarTray:
                 lowest_primary = p_rem
                 critical_id = p_id
 
-            # Create provider header with emoji and status
+            # Provider header with emoji and status
             # Using simple text label for maximum compatibility
             status_emoji = self.get_status_emoji(p_rem)
             header_label = f"{config['icon']} {config['name']}  {status_emoji} {p_rem:.0f}%"
-            provider_root = Gtk.MenuItem(label=header_label)
 
-            # Set tooltip with provider details
-            primary = usage.get('primary', {})
+            # Tooltip with provider details
             tooltip_text = f"{config['name']}\nSession: {p_rem:.0f}% remaining"
             if primary.get('resetDescription'):
                 tooltip_text += f"\nResets: {primary.get('resetDescription')}"
             if usage.get('accountEmail'):
                 tooltip_text += f"\nAccount: {usage.get('accountEmail')}"
-            provider_root.set_tooltip_text(tooltip_text)
 
-            # Create submenu
-            provider_menu = Gtk.Menu()
-            provider_root.set_submenu(provider_menu)
-            menu.append(provider_root)
+            # Providers still shown from a stored snapshot carry its age
+            notice_rows = []
+            if p_id in self.cached_at:
+                age = usagebar_forecast.format_duration(now - self.cached_at[p_id])
+                header_label += f"  🕓 {age}"
+                tooltip_text += f"\nSaved {age} ago, not refreshed yet"
+                notice_rows = [('stale', f"🕓 Saved {age} ago, not refreshed yet", None), ('sep-stale', None, None)]
 
-            # Account details
-            if usage.get('accountEmail'):
-                mi = Gtk.MenuItem(label=f"📧 {usage.get('accountEmail')}")
-                mi.set_sensitive(False)
-                provider_menu.append(mi)
-                provider_menu.append(Gtk.SeparatorMenuItem())
-
-            # Primary (Session) Usage
-            session_bar = self.make_progress_bar(p_rem)
-            session_label = f"Session: {session_bar}"
-            mi = Gtk.MenuItem(label=session_label)
-            mi.set_sensitive(False)
-            provider_menu.append(mi)
-
-            # Add sparkline if we have history
-            if self.history and CHARTS_AVAILABLE:
-                try:
-                    history = self.history.get_history(p_id, hours=24)
-                    print(f"[UsageBar] DEBUG: Provider {p_id}, history count: {len(history)}")  # DEBUG
-                    if len(history) >= 2:
-                        sparkline = UsageChart.render_sparkline_text(history, width=20)
-                        trend = UsageChart.calculate_trend(history)
-
-                        # Format trend info
-                        if trend['direction'] == 'up':
-                            trend_icon = '📈'
-                        elif trend['direction'] == 'down':
-                            trend_icon = '📉'
-                        else:
-                            trend_icon = '➡️'
+            # The last fetch failed: the data shown is from an earlier one
+            error = self.provider_errors.get(p_id)
+            if error:
+                header_label += "  ⚠️"
+                tooltip_text += f"\nLast refresh failed: {error}"
+                notice_rows = [('error', f"⚠️ Refresh failed: {error}", None), ('sep-error', None, None)] + notice_rows
 
-                        trend_label = f"24h: {sparkline} {trend_icon} {trend['change']:+.0f}%"
-                        print(f"[UsageBar] DEBUG: Adding trend line: {trend_label}")  # DEBUG
-                        ti = Gtk.MenuItem(label=trend_label)
-                        ti.set_sensitive(False)
-                        provider_menu.append(ti)
-                    else:
-                        # Not enough history yet
-                        print(f"[UsageBar] DEBUG: Not enough history ({len(history)} snapshots)")  # DEBUG
-                        if len(history) == 1:
-                            msg = "⏳ Collecting usage data (refreshing...)"
-                        else:
-                            msg = "⏳ Building usage history..."
-                        ti = Gtk.MenuItem(label=msg)
-                        ti.set_sensitive(False)
-                        provider_menu.append(ti)
-                except Exception as e:
-                    print(f"[UsageBar] Warning: Could not render chart: {e}")
-                    import traceback
-                    traceback.print_exc()
-
-            if primary.get('resetDescription'):
-                # Detail Mode: show specific timestamp
-                reset_text = f"⏰ {primary.get('resetDescription')}"
-                if self.show_details and primary.get('resetsAt'):
-                    reset_text += f" ({primary.get('resetsAt')})"
-                ri = Gtk.MenuItem(label=f"    {reset_text}")
-                ri.set_sensitive(False)
-                provider_menu.append(ri)
-
-            # Secondary (Weekly) Usage
-            secondary = usage.get('secondary')
-            if secondary:
-                sec_rem = 100 - secondary.get('usedPercent', 0)
-                mi = Gtk.MenuItem(label=f"Weekly:  {self.make_progress_bar(sec_rem)}")
-                mi.set_sensitive(False)
-                provider_menu.append(mi)
-                if secondary.get('resetDescription'):
-                    rm = Gtk.MenuItem(label=f"    ⏰ {secondary.get('resetDescription')}")
-                    rm.set_sensitive(False)
-                    provider_menu.append(rm)
-
-            # Tertiary (Specific Model) Usage
-            tertiary = usage.get('tertiary')
-            if tertiary:
-                tert_rem = 100 - tertiary.get('usedPercent', 0)
-                label = "Sonnet:" if p_id == 'claude' else "Other:"
-                mi = Gtk.MenuItem(label=f"{label}   {self.make_progress_bar(tert_rem)}")
-                mi.set_sensitive(False)
-                provider_menu.append(mi)
-
-            # Credit Balance
-            creds = p_data.get('credits', {})
-            if creds and creds.get('remaining') is not None:
-                provider_menu.append(Gtk.SeparatorMenuItem())
-                mi = Gtk.MenuItem(label=f"💰 ${creds.get('remaining'):.2f} remaining")
-                mi.set_sensitive(False)
-                provider_menu.append(mi)
-
-            # Technical details (Version, etc.)
-            if self.show_details and p_data.get('version'):
-                provider_menu.append(Gtk.SeparatorMenuItem())
-                vi = Gtk.MenuItem(label=f"🏷 Version: {p_data.get('version')}")
-                vi.set_sensitive(False)
-                provider_menu.append(vi)
-
-            # Dashboard Link
-            if config.get('url'):
-                provider_menu.append(Gtk.SeparatorMenuItem())
-                oi = Gtk.MenuItem(label=f"🌐 Open {config['name']} Dashboard")
-                dashboard_url = config['url']
-                oi.connect("activate", lambda w, url=dashboard_url: webbrowser.open(url))
-                provider_menu.append(oi)
+            rows.append((f"provider:{p_id}", header_label, tooltip_text))
+            submenus[p_id] = notice_rows + self.provider_rows(p_id, p_data, config, histories.get(p_id))
 
         # Bottom Menu Section
-        menu.append(Gtk.SeparatorMenuItem())
-
+        rows.append(('sep-bottom', None, None))
         if self.last_refresh:
             time_str = self.last_refresh.strftime('%H:%M:%S')
-            mi = Gtk.MenuItem(label=f"🕐 Last updated: {time_str}")
-            mi.set_sensitive(False)
-            menu.append(mi)
-
-        refresh = Gtk.MenuItem(label="🔄 Refresh Now")
-        refresh.connect("activate", lambda w: self.trigger_refresh())
-        menu.append(refresh)
-
-        menu.append(Gtk.SeparatorMenuItem())
-
-        # Settings Submenu
-        settings_menu = Gtk.Menu()
-        settings_root = Gtk.MenuItem(label="⚙️ Settings")
-        settings_root.set_submenu(settings_menu)
-        menu.append(settings_root)
-
-        detail_item = Gtk.CheckMenuItem(label="Show Technical Details")
-        detail_item.set_active(self.show_details)
-        detail_item.connect("toggled", self.on_detail_toggled)
-        settings_menu.append(detail_item)
-
-        menu.append(Gtk.SeparatorMenuItem())
-
-        quit_item = Gtk.MenuItem(label="❌ Quit UsageBar")
-        quit_item.connect("activate", lambda w: Gtk.main_quit())
-        menu.append(quit_item)
-
-        menu.show_all()
-        self.indicator.set_menu(menu)
+            rows.append(('updated', f"🕐 Last updated: {time_str}", None))
+        elif self.refresh_error:
+            rows.append(('updated', f"⚠️ Showing saved data: {self.refresh_error}", None))
+        elif self.cached_at:
+            rows.append(('updated', "🕓 Showing saved data, refreshing...", None))
+        rows.append(('refresh', "🔄 Refresh Now", None))
+        rows.append(('sep-settings', None, None))
+        rows.append(('settings', "⚙️ Settings", None))
+        rows.append(('sep-quit', None, None))
+        rows.append(('quit', "❌ Quit UsageBar", None))
+
+        # Headers first (creates submenus for new providers), then each submenu
+        self.main_menu.sync(rows)
+        for p_id in set(self.provider_menus) - set(submenus):
+            del self.provider_menus[p_id]
+        for p_id, provider_rows in submenus.items():
+            self.provider_menus[p_id].sync(provider_rows)
+
+        self.attach_menu(self.main_menu.menu)
 
         # Update Hub Label: Show status or critical percentage
         if critical_id:
             status_class = self.get_status_class(lowest_primary)
             if status_class == 'healthy':
-                self.indicator.set_label("✅", "")
+                self.set_indicator_label("✅")
             else:
                 emoji = '🟢' if status_class == 'healthy' else '🟡' if status_class == 'warning' else '🔴'
-                self.indicator.set_label(f"{emoji} {lowest_primary:.0f}%", "")
+                self.set_indicator_label(f"{emoji} {lowest_primary:.0f}%")
         else:
-            self.indicator.set_label("✅", "")
+            self.set_indicator_label("✅")
 
     def on_detail_toggled(self, widget):
         """Technical Detailed Mode toggle handler."""
@@ -555,13 +1142,100 @@ class UsageBarTray:
         self.save_settings()
         self.build_full_menu()
 
+    def on_adaptive_toggled(self, widget):
+        """Adaptive refresh toggle handler: switch between per-provider and fixed polling."""
+        self.adaptive_refresh = widget.get_active()
+        self.save_settings()
+        self.schedule_next_refresh()
+
+    def on_profiling_toggled(self, widget):
+        """Profiling toggle handler: sampled cProfile and tracemalloc (see usagebar-profiler.py)."""
+        self.profiling = widget.get_active()
+        self.save_settings()
+        if self.profiling:
+            self.start_profiling()
+        else:
+            self.stop_profiling()
+        if self.dump_profile_item is not None:
+            self.dump_profile_item.set_sensitive(self.profiling)
+
+    def start_profiling(self):
+        """Start profiling and arm the periodic report timer."""
+        if usagebar_profiler.PROFILER.enabled:
+            return
+        usagebar_profiler.PROFILER.start()
+        self.profile_timer = GLib.timeout_add_seconds(max(int(self.profile_interval), 60), self.on_profile_tick)
+        log.info("Profiling enabled; reports go to %s", usagebar_profiler.PROFILER.directory)
+
+    def stop_profiling(self):
+        if self.profile_timer:
+            GLib.source_remove(self.profile_timer)
+            self.profile_timer = None
+        usagebar_profiler.PROFILER.stop()
+        log.info("Profiling disabled")
+
+    def on_profile_tick(self):
+        """Timer callback: write the periodic profile report."""
+        self.dump_profile("periodic")
+        return True
+
+    def dump_profile(self, reason="on demand"):
+        """Write a profile report now; returns its path (None if profiling is off or it failed)."""
+        try:
+            path = usagebar_profiler.PROFILER.write_report(reason)
+        except Exception as e:
+            log.warning("Could not write profile report: %s", e)
+            return None
+        if path:
+            log.info("Profile report written to %s", path)
+        return path
+
+    def start_metrics(self, endpoint):
+        """Serve the refresh-pipeline metrics (see usagebar-metrics.py) on endpoint."""
+        try:
+            self.metrics_server = usagebar_metrics.MetricsServer(endpoint).start()
+        except (OSError, ValueError) as e:
+            log.warning("Could not start metrics endpoint %s: %s", endpoint, e)
+
+    def shutdown(self):
+        """Release background resources before exit."""
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if usagebar_profiler.PROFILER.enabled:
+            self.dump_profile("exit")
+            self.stop_profiling()
+        self.cancel_refresh()
+        self.collector.stop()
+        if self.history_writer:
+            if not self.history_writer.stop():
+                log.warning("Some history snapshots were not written before exit")
+        if self.history:
+            self.history.close()
+
 def main():
     """Application entry point."""
+    parser = argparse.ArgumentParser(description="UsageBar system tray")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print the time spent in each startup phase once the first menu is up")
+    parser.add_argument('--log-level', choices=usagebar_metrics.LOG_LEVELS, type=str.upper,
+                        help="log verbosity (default: $USAGEBAR_LOG_LEVEL or INFO)")
+    parser.add_argument('--metrics', metavar='ENDPOINT',
+                        help="serve Prometheus metrics on PORT, HOST:PORT (localhost) or unix:PATH "
+                             "(default: $USAGEBAR_METRICS or the metrics_endpoint setting)")
+    args = parser.parse_args()
+    STARTUP.enabled = args.profile_startup
+    usagebar_metrics.setup_logging(args.log_level)
+
     app = UsageBarTray()
+    endpoint = args.metrics or os.environ.get('USAGEBAR_METRICS') or app.metrics_endpoint
+    if endpoint:
+        app.start_metrics(endpoint)
     try:
         Gtk.main()
     except KeyboardInterrupt:
         pass
+    finally:
+        app.shutdown()
 
 if __name__ == "__main__":
     main()